@@ -89,7 +89,7 @@ ext_Emhaplofreq = Extension("PyPop._Emhaplofreq",
                             path_to_src(["emhaplofreq/emhaplofreq_wrap.i",
                              "emhaplofreq/emhaplofreq.c"]),
                             swig_opts = swig_opts,
-                            include_dirs=include_dirs + path_to_src(["emhaplofreq"]),
+                            include_dirs=include_dirs + path_to_src(["emhaplofreq", "SWIG"]),
                             define_macros=[('__SWIG__', '1'),
                                            ('DEBUG', '0'),
                                            ('EXTERNAL_MODE', '1'),
@@ -99,7 +99,7 @@ ext_EWSlatkinExact = Extension("PyPop._EWSlatkinExact",
                                path_to_src(["slatkin-exact/monte-carlo_wrap.i",
                                 "slatkin-exact/monte-carlo.c"]),
                                swig_opts = swig_opts,
-                               include_dirs=include_dirs,
+                               include_dirs=include_dirs + path_to_src(["SWIG"]),
                                )
 
 ext_Pvalue = Extension("PyPop._Pvalue",
@@ -153,7 +153,7 @@ ext_Gthwe_macros = [('__SWIG__', '1'),
 ext_Gthwe = Extension("PyPop._Gthwe",
                       ext_Gthwe_files,
                       swig_opts = swig_opts,
-                      include_dirs=include_dirs + path_to_src(["gthwe"]),
+                      include_dirs=include_dirs + path_to_src(["gthwe", "SWIG"]),
                       library_dirs=library_dirs,
                       libraries=["gsl", "gslcblas"],
                       define_macros=ext_Gthwe_macros
@@ -163,7 +163,7 @@ ext_Haplostats = Extension("PyPop._Haplostats",
                        path_to_src(["haplo-stats/haplostats_wrap.i",
                         "haplo-stats/haplo_em_pin.c"]),
                        swig_opts = swig_opts,
-                       include_dirs=include_dirs + path_to_src(["haplo-stats", "pval"]),
+                       include_dirs=include_dirs + path_to_src(["haplo-stats", "pval", "SWIG"]),
                        define_macros=[('MATHLIB_STANDALONE', '1'),
                                       ('__SWIG__', '1'),
                                       ('DEBUG', '0'),
@@ -198,10 +198,11 @@ ext_HweEnum = Extension("PyPop._HweEnum",
                                        ('HAVE_LIBGSL', '1')]
                         )
 
-ext_Emhaplofreq.depends=path_to_src(["SWIG/typemap.i", "emhaplofreq/emhaplofreq.h"])
+ext_Emhaplofreq.depends=path_to_src(["SWIG/typemap.i", "SWIG/threads.i", "SWIG/thread_local.h", "emhaplofreq/emhaplofreq.h"])
+ext_EWSlatkinExact.depends=path_to_src(["SWIG/typemap.i", "SWIG/threads.i", "SWIG/thread_local.h"])
 ext_Pvalue.depends=path_to_src(["SWIG/typemap.i", "pval/Rconfig.h", "pval/Rmath.h", "pval/dpq.h", "pval/nmath.h"])
-ext_Gthwe.depends=path_to_src(["SWIG/typemap.i", "gthwe/func.h", "gthwe/hwe.h"])
-ext_Haplostats.depends=path_to_src(["SWIG/typemap.i", "haplo-stats/haplo_em_pin.h"])
+ext_Gthwe.depends=path_to_src(["SWIG/typemap.i", "SWIG/threads.i", "SWIG/thread_local.h", "gthwe/func.h", "gthwe/hwe.h"])
+ext_Haplostats.depends=path_to_src(["SWIG/typemap.i", "SWIG/threads.i", "SWIG/thread_local.h", "haplo-stats/haplo_em_pin.h"])
     
 # default list of extensions to build
 extensions = [ext_Emhaplofreq, ext_EWSlatkinExact, ext_Pvalue, ext_Haplostats, ext_Gthwe]
@@ -36,8 +36,9 @@
 """Module for storing genotype and allele count data."""
 
 import sys, os, string, types, re
+import numpy as np
 
-from PyPop.Utils import getStreamType, StringMatrix, OrderedDict, TextOutputStream
+from PyPop.Utils import getStreamType, StringMatrix, EncodedStringMatrix, OrderedDict, TextOutputStream
 
 def _serializeAlleleCountDataAt(stream, alleleTable,
                                 total, untypedIndividuals,
@@ -103,6 +104,104 @@ def _serializeAlleleCountDataAt(stream, alleleTable,
         stream.writeln()
 
 
+def _factorizeStrings(values):
+    """Returns the sorted unique values (as strings) and their codes.
+
+    'values' is a NumPy array of alleles, each converted with 'str()';
+    the codes (indices into the returned array of strings) have the
+    same shape as 'values'.  Codes are ordered alphabetically so that
+    comparing two codes is equivalent to comparing the strings.
+
+    *For internal use only.*"""
+    flat = values.ravel().tolist()
+    # hashing is much faster than sorting the strings, map each value
+    # to the position where it first appears
+    try:
+        firstSeen = {}
+        positions = np.fromiter(map(firstSeen.setdefault, flat, range(len(flat))),
+                                dtype=np.intp, count=len(flat))
+    except TypeError:
+        # some filters leave unhashable values (e.g. 0-d arrays),
+        # so fall back to hashing the string forms
+        flat = [str(value) for value in flat]
+        firstSeen = {}
+        positions = np.fromiter(map(firstSeen.setdefault, flat, range(len(flat))),
+                                dtype=np.intp, count=len(flat))
+    uniquePositions, inverse = np.unique(positions, return_inverse=True)
+
+    # distinct values may have the same string form (e.g. 1 and '1')
+    strings = [str(flat[i]) for i in uniquePositions]
+    labels = sorted(set(strings))
+    rank = dict(zip(labels, range(len(labels))))
+    codes = np.array([rank[string] for string in strings], dtype=np.intp)[inverse]
+    return np.array(labels, dtype=str), codes.reshape(values.shape)
+
+class GenotypeCounts:
+    """Table of genotype counts for a single locus.
+
+    Built either from a list of genotype 2-tuples ('locusData', as
+    returned by 'Genotypes.getLocusDataAt()'), or from an array of
+    allele 'labels' and an (individuals x 2) array of 'genotypes'
+    coded as indices into 'labels' (labels may be repeated, e.g. after
+    lumping).
+
+    Attributes:
+
+    - 'n': number of genotypes (individuals)
+
+    - 'k': number of distinct observed alleles
+
+    - 'alleles': observed alleles in order of first appearance
+
+    - 'sortedAlleles': observed alleles sorted alphabetically, this
+      fixes the allele indices used by the arrays below
+
+    - 'counts': (k x k) array, 'counts[i, j]' is the number of
+      individuals with genotype (sortedAlleles[i], sortedAlleles[j]),
+      in the order the alleles appear in the data
+
+    - 'packed': the lower-triangular table of counts for unordered
+      genotypes, row 'i' >= column 'j' stored at 'i*(i+1)/2 + j'
+    """
+
+    def __init__(self, locusData=None, labels=None, genotypes=None):
+
+        if locusData != None:
+            # map each allele to its position in the list of labels
+            index = {}
+            codes = [index.setdefault(allele, len(index)) \
+                     for genotype in locusData for allele in genotype]
+            labels = list(index.keys())
+            genotypes = np.array(codes, dtype=np.intp).reshape(-1, 2)
+
+        # merge any repeated labels, ids follow alphabetical order
+        uniqueLabels, labelIds = np.unique(np.array(labels, dtype=str), return_inverse=True)
+        ids = labelIds.ravel()[np.asarray(genotypes, dtype=np.intp)].reshape(-1, 2)
+
+        used, firstSeen = np.unique(ids.ravel(), return_index=True)
+        self.n = len(ids)
+        self.k = len(used)
+        self.sortedAlleles = uniqueLabels[used].tolist()
+        self.alleles = [self.sortedAlleles[i] for i in np.argsort(firstSeen, kind='stable')]
+
+        rank = np.zeros(len(uniqueLabels), dtype=np.intp)
+        rank[used] = np.arange(self.k)
+        ids = rank[ids]
+        self.counts = np.bincount(ids[:, 0] * self.k + ids[:, 1],
+                                  minlength=self.k * self.k).reshape(self.k, self.k)
+
+        # a genotype is normally stored in one orientation only, but
+        # lumped alleles are relabelled without re-sorting each
+        # genotype: as with the original tables, the (row, column)
+        # orientation takes precedence if it was observed
+        rows, cols = np.tril_indices(self.k)
+        lower = self.counts[rows, cols]
+        self.packed = np.where(lower > 0, lower, self.counts[cols, rows])
+
+    def getAlleleIndex(self):
+        """Returns a map of allele to position in 'sortedAlleles'."""
+        return dict(zip(self.sortedAlleles, range(self.k)))
+
 class Genotypes:
     """Base class that stores and caches basic genotype statistics.
     """
@@ -111,41 +210,31 @@ class Genotypes:
                  untypedAllele='****',
                  unsequencedSite=None,
                  allowSemiTyped=0,
+                 lazy=0,
                  debug=0):
         self.matrix = matrix
         self.untypedAllele = untypedAllele
         self.unsequencedSite = unsequencedSite
         self.allowSemiTyped = allowSemiTyped
+        self.lazy = lazy
         self.debug = debug
         
         self._genDataStructures()
 
-    def _checkAllele(self, allele1, allele2, unsequencedSites):
-        for phase in [allele1, allele2]:
-            if (self.untypedAllele != phase and self.unsequencedSite != phase):
-                if self.debug:
-                    print("alleleTable:", self.alleleTable)
-                    print("alleleTable type:", type(self.alleleTable))
-                    print("phase:", phase)
-                    print("phase type:", type(phase))
-                if phase in self.alleleTable:
-                    self.alleleTable[phase] += 1
-                else:
-                    self.alleleTable[phase] = 1
-                self.total += 1
-            else:
-                if (self.unsequencedSite == phase):
-                    unsequencedSites += 1
-                if self.debug:
-                    print(self.unsequencedSite, phase, unsequencedSites)
-
-        
     def _genDataStructures(self):
         """Generates allele count and map data structures.
+
+        All loci are processed together: the alleles are converted to
+        integer codes once, and counts and genotype lists are then
+        computed with array operations.
+
+        In 'lazy' mode nothing is computed here, each locus is instead
+        processed the first time it is accessed.
         
         *For internal use only.*"""        
 
         self.locusKeys = self.matrix.colList
+        self.locusPositions = dict(zip(self.locusKeys, range(len(self.locusKeys))))
 
         # then total number of individuals in data file
         self.totalIndivCount = len(self.matrix)
@@ -154,91 +243,236 @@ class Genotypes:
         self.totalLocusCount = len(self.locusKeys)
 
         # total loci that contain usable data
-        self.totalLociWithData = 0
+        self._totalLociWithData = None
         
         self.freqcount = {}
         self.locusTable = {}
 
-        for locus in self.locusKeys:
-            if self.debug:
-               print("locus name: %s" %locus)
-               print("column tuple: %s" %self.matrix[locus])
+        # canonical (sorted) genotypes for each locus, as a 2-tuple of
+        # the allele labels and an (individuals x 2) array of codes
+        # into those labels
+        self.genotypeCodes = {}
 
-            # initialise blank dictionary
-            self.alleleTable = {}
+        # lumped allele counts and genotype lists, keyed by (locus,
+        # lumpValue), built the first time each is requested
+        self.lumpedCounts = {}
+        self.lumpedTables = {}
+        self.lumpedLabels = {}
 
-            # initialise blank list
-            self.locusTable[locus] = []
-      
-            self.total = 0
-            untypedIndividuals = 0
-            unsequencedSites = 0
+        # 'GenotypeCounts' tables keyed by (locus, lumpValue)
+        self.genotypeCounts = {}
 
-            # first pass runs a filter of alleles through the
-            # anthonynolan data filter/cleaner
+        if not self.lazy:
+            self._genLoci(self.locusKeys)
+            for locus in self.locusKeys:
+                self._genLocusTable(locus)
 
-            # re-initialise the row count on each iteration of the locus
-            rowCount = 0
+    def _genLoci(self, loci):
+        """Generates allele counts and genotype codes for given loci.
 
-            subMatrix = self.matrix[locus]
+        Loci that have already been processed are skipped.
+        
+        *For internal use only.*"""
 
-            for line in range(0, len(subMatrix)):
+        positions = [self.locusPositions[locus] for locus in loci \
+                     if locus not in self.freqcount]
 
-                if self.debug:
-                    print(rowCount, subMatrix[line]),
+        for locus, alleleTable, total, untypedIndividuals, unsequencedSites, \
+                labels, genotypes in self._countLoci(positions):
 
-                allele1, allele2 = [str(i) for i in subMatrix[line]]
+            if self.debug:
+                print("locus name: %s" % locus)
+                print(alleleTable, total, untypedIndividuals, unsequencedSites)
 
-                if self.debug:
-                    print(allele1, allele2)
-                
-                # increment row count
-                rowCount += 1
+            self.genotypeCodes[locus] = labels, genotypes
 
-                if self.allowSemiTyped:
-                    self._checkAllele(allele1, allele2, unsequencedSites)
-                    if (self.untypedAllele == allele1):
-                        untypedIndividuals += 0.5
-                    if (self.untypedAllele == allele2):
-                        untypedIndividuals += 0.5
-                else:
-                    # ensure that *both* alleles are typed
-                    if (self.untypedAllele != allele1) and \
-                           (self.untypedAllele != allele2):
-                        # check to see if the "allele" isn't a missing sequence site
-                        if (self.unsequencedSite != allele1) and \
-                           (self.unsequencedSite != allele2):
-                            self._checkAllele(allele1, allele2, unsequencedSites)
-                        else:
-                            if self.unsequencedSite == allele1:
-                                unsequencedSites += 1
-                            if self.unsequencedSite == allele2:
-                                unsequencedSites += 1
-                            if self.debug:
-                                print(locus, allele1, allele2, unsequencedSites)
-                            continue
-                    # if either allele is untyped it is we throw out the
-                    # entire individual and go to the next individual
-                    else:
-                        untypedIndividuals += 1
-                        continue
+            # assign frequency, counts
+            self.freqcount[locus] = alleleTable, total, untypedIndividuals, unsequencedSites
 
-                # save alleles as a tuple, sorted alphabetically
-                if allele2 < allele1:
-                  self.locusTable[locus].append((allele2, allele1))
-                else:
-                  self.locusTable[locus].append((allele1, allele2))
+    def _genLocusTable(self, locus):
+        """Generates the list of genotype tuples for a locus.
+        
+        *For internal use only.*"""
 
-                if self.debug:
-                    print(allele1, allele2, self.total)
+        if locus not in self.locusTable:
+            self._genLoci([locus])
+            labels, genotypes = self.genotypeCodes[locus]
 
-            # assign frequency, counts
-            self.freqcount[locus] = self.alleleTable, self.total, untypedIndividuals, unsequencedSites
+            # save alleles as a list of tuples, sorted alphabetically
+            self.locusTable[locus] = list(zip(labels[genotypes[:, 0]].tolist(),
+                                              labels[genotypes[:, 1]].tolist()))
+        return self.locusTable[locus]
+
+    def _getFreqcount(self, locus):
+        """Returns the allele count tuple for a locus.
+        
+        *For internal use only.*"""
+
+        if locus not in self.freqcount:
+            if locus not in self.locusPositions:
+                raise KeyError(locus)
+            self._genLoci([locus])
+        return self.freqcount[locus]
+
+    def _getTotalLociWithData(self):
+        if self._totalLociWithData == None:
+            if self.lazy:
+                untypedCounts = self._countUntyped(range(self.totalLocusCount))
+            else:
+                untypedCounts = [self.freqcount[locus][2] for locus in self.locusKeys]
 
             # if all individuals in a locus aren't untyped
             # then count this locus as having usable data
-            if untypedIndividuals < self.totalIndivCount:
-                self.totalLociWithData += 1
+            self._totalLociWithData = len([untyped for untyped in untypedCounts \
+                                           if untyped < self.totalIndivCount])
+        return self._totalLociWithData
+
+    totalLociWithData = property(_getTotalLociWithData)
+
+    def _countUntyped(self, locusPositions):
+        """Returns the number of untyped individuals at each locus.
+
+        Equivalent to the untyped individuals computed by
+        '_countLoci', but without processing the typed alleles.
+
+        *For internal use only.*"""
+
+        locusPositions = list(locusPositions)
+        if len(locusPositions) == 0 or len(self.matrix) == 0:
+            return [0] * len(locusPositions)
+
+        if isinstance(self.matrix, EncodedStringMatrix):
+            labels, codes = self._locusCodes(locusPositions)
+            if self.untypedAllele in labels:
+                untyped = codes == np.searchsorted(labels, self.untypedAllele)
+            else:
+                untyped = np.zeros(codes.shape, dtype=bool)
+        else:
+            alleles = self.matrix._getColumns([self.matrix.extraCount + pos*2 + phase \
+                                               for pos in locusPositions for phase in (0, 1)])
+            untyped = np.fromiter((str(allele) == self.untypedAllele for allele in alleles.ravel().tolist()),
+                                  dtype=bool, count=alleles.size)
+        untyped = untyped.reshape(len(self.matrix), -1, 2)
+        if self.allowSemiTyped:
+            return [float(count) * 0.5 for count in untyped.sum(axis=(0, 2))]
+        else:
+            return untyped.any(axis=2).sum(axis=0).tolist()
+
+    def _locusCodes(self, locusPositions):
+        """Returns the alleles at the given locus positions as codes.
+
+        Returns the sorted array of allele labels (as strings) and the
+        (individuals x 2*loci) array of codes into it, the same as
+        '_factorizeStrings' of the allele columns.  An encoded matrix
+        is not decoded: its per-locus codes are remapped instead.
+
+        *For internal use only.*"""
+
+        if not isinstance(self.matrix, EncodedStringMatrix):
+            alleles = self.matrix._getColumns([self.matrix.extraCount + pos*2 + phase \
+                                               for pos in locusPositions for phase in (0, 1)])
+            return _factorizeStrings(alleles)
+
+        alleleCodes = self.matrix.getAlleleCodes(':'.join([self.locusKeys[pos] for pos in locusPositions]))
+        labels = sorted(set().union(*[alleles for alleles, codes in alleleCodes.values()]))
+        labels = np.array(labels, dtype=str)
+        blocks = []
+        for pos in locusPositions:
+            alleles, codes = alleleCodes[self.locusKeys[pos]]
+            # codes start at 1, i.e. at the first of 'alleles'
+            lookup = np.searchsorted(labels, np.array(alleles, dtype=str))
+            blocks.append(lookup[codes - 1])
+        return labels, np.hstack(blocks)
+
+    def _countLoci(self, locusPositions):
+        """Count alleles and genotypes at the given locus positions.
+
+        Returns a list with a tuple for each locus consisting of: the
+        locus name, a map of counts keyed by allele (in order of first
+        appearance), the total allele count, the number of untyped
+        individuals, the number of unsequenced sites, the array of
+        allele labels and the (individuals x 2) array of retained
+        genotypes as codes into the labels (sorted within each
+        individual).
+
+        *For internal use only.*"""
+
+        locusPositions = list(locusPositions)
+        rowCount = len(self.matrix)
+        if len(locusPositions) == 0:
+            return []
+        if rowCount == 0:
+            labels = np.array([], dtype=str)
+            genotypes = np.zeros((0, 2), dtype=int)
+            return [(self.locusKeys[pos], {}, 0, 0, 0, labels, genotypes) \
+                    for pos in locusPositions]
+
+        # (individuals x 2*loci) array of alleles as codes whose order
+        # follows the alphabetical order of the alleles
+        labels, codes = self._locusCodes(locusPositions)
+        labelCount = len(labels)
+
+        def codeMask(allele):
+            # mask of the positions holding the given allele
+            if allele == None or allele not in labels:
+                return np.zeros(codes.shape, dtype=bool)
+            return codes == np.searchsorted(labels, allele)
+
+        untyped = codeMask(self.untypedAllele)
+        unsequenced = codeMask(self.unsequencedSite)
+
+        # regroup as (loci x individuals x 2)
+        codes = codes.reshape(rowCount, -1, 2).transpose(1, 0, 2)
+        untyped = untyped.reshape(rowCount, -1, 2).transpose(1, 0, 2)
+        unsequenced = unsequenced.reshape(rowCount, -1, 2).transpose(1, 0, 2)
+
+        if self.allowSemiTyped:
+            # all individuals are kept, each untyped allele counts as
+            # half an untyped individual; unsequenced sites are not
+            # tallied in this mode
+            keep = np.ones(codes.shape[:2], dtype=bool)
+            counted = ~(untyped | unsequenced)
+            untypedCounts = untyped.sum(axis=(1, 2))
+            unsequencedCounts = np.zeros(len(locusPositions), dtype=int)
+        else:
+            # if either allele is untyped we throw out the entire
+            # individual, likewise if either is an unsequenced site
+            anyUntyped = untyped.any(axis=2)
+            keep = ~(anyUntyped | unsequenced.any(axis=2))
+            counted = np.repeat(keep[:, :, np.newaxis], 2, axis=2)
+            untypedCounts = anyUntyped.sum(axis=1)
+            unsequencedCounts = (unsequenced & ~anyUntyped[:, :, np.newaxis]).sum(axis=(1, 2))
+
+        # count every allele at every locus in one go, keyed on
+        # (locus, code)
+        offsets = np.arange(len(locusPositions))[:, np.newaxis, np.newaxis] * labelCount
+        keys = (codes + offsets)[counted]
+        alleleCounts = np.bincount(keys, minlength=len(locusPositions) * labelCount)
+        # keys are in locus, individual, phase order, so the first
+        # index of each key gives the order of first appearance
+        uniqueKeys, firstSeen = np.unique(keys, return_index=True)
+        uniqueKeys = uniqueKeys[np.argsort(firstSeen, kind='stable')]
+        uniqueKeys = uniqueKeys[np.argsort(uniqueKeys // labelCount, kind='stable')]
+        bounds = np.searchsorted(uniqueKeys // labelCount, np.arange(len(locusPositions) + 1))
+
+        results = []
+        for i, pos in enumerate(locusPositions):
+            locusKeys = uniqueKeys[bounds[i]:bounds[i + 1]]
+            alleleTable = dict(zip(labels[locusKeys - i * labelCount].tolist(),
+                                   alleleCounts[locusKeys].tolist()))
+            total = int(alleleCounts[locusKeys].sum())
+
+            if self.allowSemiTyped:
+                # keep same type as accumulating 0.5 per allele
+                untypedIndividuals = float(untypedCounts[i]) * 0.5 if untypedCounts[i] else 0
+            else:
+                untypedIndividuals = int(untypedCounts[i])
+
+            genotypes = np.sort(codes[i][keep[i]], axis=1)
+            results.append((self.locusKeys[pos], alleleTable, total,
+                            untypedIndividuals, int(unsequencedCounts[i]),
+                            labels, genotypes))
+        return results
 
     def getLocusList(self):
         """Returns the list of loci.
@@ -262,6 +496,7 @@ class Genotypes:
         containing counts, the total count at that locus and the
         number of untyped individuals.  """
         
+        self._genLoci(self.locusKeys)
         return self.freqcount
 
     def getAlleleCountAt(self, locus, lumpValue=0):
@@ -273,10 +508,25 @@ class Genotypes:
         by alleles containing counts, the total count at that
         locus, and number of untyped individuals.  """
 
-        # need to recalculate values
         if (lumpValue != 0):
+            alleles, totalAlleles, untyped, unsequenced = self._getLumpedCounts(locus, lumpValue)
+            # copy the map, as the same counts are shared by all callers
+            return dict(alleles), totalAlleles, untyped, unsequenced
+        else:
+            return self._getFreqcount(locus)
 
-            alleles, totalAlleles, untyped, unsequenced = self.freqcount[locus]
+    def _getLumpedCounts(self, locus, lumpValue):
+        """Returns the allele count tuple for a locus after lumping.
+
+        All alleles with counts at or below 'lumpValue' are combined
+        into a single allele called 'lump'.  The result is computed
+        once for each (locus, lumpValue).
+
+        *For internal use only.*"""
+
+        key = locus, lumpValue
+        if key not in self.lumpedCounts:
+            alleles, totalAlleles, untyped, unsequenced = self._getFreqcount(locus)
 
             lumpedAlleles = {}
             for allele in alleles.keys():
@@ -288,12 +538,65 @@ class Genotypes:
                         lumpedAlleles['lump'] = count
                 else:
                     lumpedAlleles[allele] = count
-            lumpedTuple = lumpedAlleles, totalAlleles, untyped, unsequenced
-            ## print lumpedTuple
-            
-            return lumpedTuple
-        else:
-            return self.freqcount[locus]
+            self.lumpedCounts[key] = lumpedAlleles, totalAlleles, untyped, unsequenced
+
+        return self.lumpedCounts[key]
+
+    def _getLumpedTable(self, locus, lumpValue):
+        """Returns the list of genotype tuples for a locus after lumping.
+
+        Computed once for each (locus, lumpValue), by relabelling the
+        genotype codes rather than rewriting each genotype.
+
+        *For internal use only.*"""
+
+        key = locus, lumpValue
+        if key not in self.lumpedTables:
+            labels = self._getLumpedLabels(locus, lumpValue)
+            genotypes = self.genotypeCodes[locus][1]
+            self.lumpedTables[key] = list(zip(labels[genotypes[:, 0]].tolist(),
+                                              labels[genotypes[:, 1]].tolist()))
+
+        return self.lumpedTables[key]
+
+    def _getLumpedLabels(self, locus, lumpValue):
+        """Returns the allele labels for a locus after lumping.
+
+        The genotype codes of the locus index into these labels.
+
+        *For internal use only.*"""
+
+        key = locus, lumpValue
+        if key not in self.lumpedLabels:
+            alleles = self._getFreqcount(locus)[0]
+            listLumped = [allele for allele in alleles.keys() \
+                          if alleles[allele] <= lumpValue]
+
+            labels = self.genotypeCodes[locus][0]
+            self.lumpedLabels[key] = np.where(np.isin(labels, listLumped), 'lump', labels)
+
+        return self.lumpedLabels[key]
+
+    def getGenotypeCountsAt(self, locus, lumpValue=0):
+        """Returns the 'GenotypeCounts' table for the specified locus.
+
+        - 'lumpValue': the specified amount of lumping (Default: 0)
+
+        The table is equivalent to one built from 'getLocusDataAt()'
+        with the same arguments, it is built once and shared by all
+        callers, so should not be modified."""
+
+        key = locus, lumpValue
+        if key not in self.genotypeCounts:
+            self._genLoci([locus])
+            if lumpValue != 0:
+                labels = self._getLumpedLabels(locus, lumpValue)
+            else:
+                labels = self.genotypeCodes[locus][0]
+            self.genotypeCounts[key] = GenotypeCounts(labels=labels,
+                                                      genotypes=self.genotypeCodes[locus][1])
+
+        return self.genotypeCounts[key]
 
     def serializeSubclassMetadataTo(self, stream):
         """Serialize subclass-specific metadata.
@@ -317,7 +620,7 @@ class Genotypes:
     def serializeAlleleCountDataAt(self, stream, locus):
         """ """
         
-        self.alleleTable, self.total, untypedIndividuals, unsequencedSites = self.freqcount[locus]
+        self.alleleTable, self.total, untypedIndividuals, unsequencedSites = self._getFreqcount(locus)
         _serializeAlleleCountDataAt(stream, self.alleleTable,
                                     self.total, untypedIndividuals,
                                     unsequencedSites)
@@ -327,7 +630,7 @@ class Genotypes:
         
         stream.opentag('allelecounts')
             
-        for locus in self.freqcount.keys():
+        for locus in self.locusKeys:
             stream.writeln()
             stream.opentag('locus', name=locus)
                     
@@ -350,46 +653,12 @@ class Genotypes:
         **Note 2:** data is sorted so that allele1 < allele2,
         alphabetically """
 
-        # need to recalculate values
         if (lumpValue != 0):
-
-            alleles, totalAlleles, untyped, unsequenced = self.freqcount[locus]
-
-            lumpedAlleles = {}
-            listLumped = []
-            for allele in alleles.keys():
-                count = alleles[allele]
-                if count <= lumpValue:
-                    listLumped.append(allele)
-                    if 'lump' in lumpedAlleles:
-                        lumpedAlleles['lump'] += count
-                    else:
-                        lumpedAlleles['lump'] = count
-                else:
-                    lumpedAlleles[allele] = count
-            ##print listLumped
-            copyTable = (self.locusTable[locus])[:]
-            newTable = []
-            for li in copyTable:
-                allele1, allele2 = li
-                if allele1 in listLumped:
-                    newAllele1 = 'lump'
-                else:
-                    newAllele1 = allele1
-                if allele2 in listLumped:
-                    newAllele2 = 'lump'
-                else:
-                    newAllele2 = allele2
-                newTable.append((newAllele1, newAllele2))
-                    
-            ##print copyTable
-            ##print newTable
-            
-            return newTable
+            return self._getLumpedTable(locus, lumpValue)[:]
         else:
             # returns a clone of the list, so that this instance variable
             # can't be modified inadvertantly
-            return (self.locusTable[locus])[:]
+            return self._genLocusTable(locus)[:]
     
     def getLocusData(self):
         """Returns the genotyped data for all loci.
@@ -397,6 +666,8 @@ class Genotypes:
         Returns a dictionary keyed by locus name of lists of 2-tuples
         as defined by 'getLocusDataAt()'
         """
+        for locus in self.locusKeys:
+            self._genLocusTable(locus)
         return self.locusTable
 
     def getIndividualsData(self):
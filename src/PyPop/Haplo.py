@@ -864,14 +864,16 @@ class Haplostats(Haplo):
             print ("Length of weight != number of subjects (nrow of geno)")
             exit(-1)
 
-        temp_geno = geno.convertToInts()   # simulates setupGeno
+        # factorize all loci at once, and re-use for the conversion
+        allele_codes = geno.getAlleleCodes()
+        temp_geno = geno.convertToInts(allele_codes)   # simulates setupGeno
         geno_vec = temp_geno.flattenCols() # gets the columns as integers
 
         n_alleles = []
         allele_labels = []
 
         for locus in geno.colList:
-            unique_alleles = geno.getUniqueAlleles(locus)
+            unique_alleles = allele_codes[locus][0]
             allele_labels.append(unique_alleles)
             n_alleles.append(len(unique_alleles))
 
@@ -38,51 +38,538 @@
 
 """
 
-import sys, os, subprocess, io
+import sys, os, subprocess, io, bisect, time
+import numpy as np
 from PyPop import _Pvalue
-from math import pow, sqrt
+from math import pow, sqrt, exp, log1p, lgamma
+from statistics import NormalDist
 from tempfile import TemporaryDirectory
-# FIXME: should remove the need for hardcoding a GENOTYPE_SEPARATOR
-# this can clash with a character within an allele identifier too easily
+from concurrent.futures import ProcessPoolExecutor
+from xml.etree import ElementTree
 from PyPop.Utils import getStreamType, TextOutputStream, GENOTYPE_SEPARATOR
 from PyPop.Arlequin import ArlequinExactHWTest
+from PyPop.DataTypes import GenotypeCounts
+
+def _chenStatistics(alleleFreqs, genotypes, totalGametes):
+  """Chen's chi-square statistic for every genotype at once.
+
+  'alleleFreqs' is the vector of allele frequencies and 'genotypes'
+  the (k x k) table of genotype counts, or any stack of them (e.g. a
+  table per simulated or enumerated sample), so the same function
+  serves both 'HardyWeinberg' and the exact tests.  Returns an array
+  the same shape as 'genotypes', where element (i, j) is the
+  statistic for genotype i/j counted in that cell.  Its square root
+  is the normal deviate that 'gthwe' uses, so both order tables the
+  same way."""
+  p = np.asarray(alleleFreqs, dtype=float)
+  totalIndivs = totalGametes/2
+  freqs = np.asarray(genotypes, dtype=float)/float(totalIndivs)
+  homs = np.diagonal(freqs, axis1=-2, axis2=-1)
+
+  p_i, p_j = p[:, None], p[None, :]
+  p_ii, p_jj = homs[..., :, None], homs[..., None, :]
+
+  # heterozygote case, then homozygote case on the diagonal
+  d = p_i*p_j - (0.5)*freqs
+  var = (1.0/float(totalGametes))*(p_i*p_j*((1-p_i)*(1-p_j) + p_i*p_j)
+                                   + p_i*p_i*(p_jj - p_j*p_j)
+                                   + p_j*p_j*(p_ii - p_i*p_i))
+  diagonal = np.eye(len(p), dtype=bool)
+  d = np.where(diagonal, p_i*p_i - p_ii, d)
+  var = np.where(diagonal,
+                 (1.0/float(totalIndivs))*(np.power(p_i, 4.0)-(2*np.power(p_i, 3.0))+(p_i*p_i)),
+                 var)
+
+  with np.errstate(divide='ignore', invalid='ignore'):
+    return np.abs(d)*np.abs(d)/var
+
+def _accumulate(values, start=0.0):
+  """Sum an array sequentially, as repeatedly adding each value would.
+
+  Unlike 'sum()' on an array (which adds pairwise), this gives
+  results identical to a Python loop.
+
+  *For internal use only.*"""
+  if len(values) == 0:
+    return start
+  return float(np.add.accumulate(values)[-1])
+
+def _pvals(chisqs, df=1):
+  """Chi-square p-values for an array of statistics, in one call.
+
+  *For internal use only.*"""
+  return np.array(_Pvalue.pvals([float(chisq) for chisq in chisqs], df))
+
+def _fcmp(x1, x2, epsilon=1e-6):
+  """Compare arrays of floats to relative precision 'epsilon'.
+
+  Returns -1, 0 or 1 elementwise, as per 'gsl_fcmp()' which 'gthwe'
+  uses to compare probabilities and test statistics.
+
+  *For internal use only.*"""
+  x1, x2 = np.broadcast_arrays(np.asarray(x1, dtype=float), np.asarray(x2, dtype=float))
+  exponent = np.frexp(np.where(np.abs(x1) > np.abs(x2), x1, x2))[1]
+  delta = np.ldexp(epsilon, exponent)
+  # statistics with a zero variance are infinite, and compare equal
+  with np.errstate(invalid='ignore'):
+    difference = x1 - x2
+  return np.where(difference > delta, 1, np.where(difference < -delta, -1, 0))
+
+def _biallelicExactDistribution(n, rareCount):
+  """Null distribution of heterozygote counts for a biallelic locus.
+
+  Given 'n' individuals and 'rareCount' copies of the rarer allele,
+  returns '(hets, lnProbs)': the possible heterozygote counts and the
+  log-probability of each, conditional on the allele counts.  Built
+  from the ratio of successive probabilities (Wigginton et al. 2005):
+
+    P(h+2)/P(h) = 4 * homsRare(h) * homsCommon(h) / ((h+2) * (h+1))
+
+  so is linear in the number of individuals.
+
+  *For internal use only.*"""
+  hets = np.arange(rareCount % 2, rareCount + 1, 2)
+  homsRare = (rareCount - hets) // 2
+  homsCommon = n - hets - homsRare
+  with np.errstate(divide='ignore'):
+    lnRatios = np.log(4.0 * homsRare[:-1] * homsCommon[:-1]) \
+               - np.log((hets[:-1] + 2.0) * (hets[:-1] + 1.0))
+  lnProbs = np.concatenate(([0.0], np.cumsum(lnRatios)))
+  lnProbs -= lnProbs.max()
+  lnProbs -= np.log(np.exp(lnProbs).sum())
+  return hets, lnProbs
+
+def _lnFactorials(top):
+  """Table of 'ln(x!)' for 'x' from 0 to 'top'.
+
+  *For internal use only.*"""
+  return np.concatenate(([0.0], np.cumsum(np.log(np.arange(1, top + 1)))))
+
+def _lumpedGenotypeDistribution(n, countI, countJ):
+  """Null distribution of the i/i, i/j and j/j genotype counts.
+
+  Given 'n' individuals and 'countI' and 'countJ' copies of alleles
+  'i' and 'j', lumps all other alleles into one, which leaves the
+  joint distribution of these three genotype counts unchanged.  With
+  three alleles, each table is fixed by the i/j, i/i and j/j counts,
+  so this is quadratic (per i/j count) rather than exponential in
+  the number of alleles.
+
+  Yields '(hets, homsI, homsJ, lnProbs)' for each possible i/j count
+  in turn, where 'homsI' and 'homsJ' are broadcastable arrays of
+  every i/i and j/j count, and 'lnProbs' the log-probability of each
+  (minus infinity if the counts don't make a table).
+
+  *For internal use only.*"""
+  countOther = 2 * n - countI - countJ
+  lnFact = _lnFactorials(2 * n)
+  homsI = np.arange(countI // 2 + 1)[:, None]
+  homsJ = np.arange(countJ // 2 + 1)[None, :]
+  lnNorm = lnFact[n] + lnFact[countI] + lnFact[countJ] + lnFact[countOther] \
+           - lnFact[2 * n]
+  for hets in range(min(countI, countJ) + 1):
+    # i/other, j/other and (twice) other/other counts
+    hetsI = countI - hets - 2 * homsI
+    hetsJ = countJ - hets - 2 * homsJ
+    homsOther = countOther - hetsI - hetsJ
+    valid = (hetsI >= 0) & (hetsJ >= 0) & (homsOther >= 0) & (homsOther % 2 == 0)
+    lnProbs = np.where(valid,
+                       lnNorm + (hets + hetsI + hetsJ) * np.log(2.0)
+                       - lnFact[hets] - lnFact[homsI] - lnFact[homsJ]
+                       - lnFact[np.where(valid, hetsI, 0)]
+                       - lnFact[np.where(valid, hetsJ, 0)]
+                       - lnFact[np.where(valid, homsOther // 2, 0)],
+                       -np.inf)
+    yield hets, homsI, homsJ, lnProbs
+
+def _logAdd(x, y):
+  """'log(exp(x) + exp(y))' without overflow.
+
+  *For internal use only.*"""
+  if x < y:
+    x, y = y, x
+  if y == -np.inf:
+    return x
+  return x + log1p(exp(y - x))
+
+class _TableEnumeration:
+  """Exact p-value over all genotype tables with the same allele counts.
+
+  Each table has probability (Levene 1949) proportional to the
+  product over genotypes of 2^x/x! for heterozygotes and 1/x! for
+  homozygotes, where x is the genotype count.  Tables are filled in
+  one genotype at a time, a row (allele) at a time, so a partially
+  filled in table only matters to its completions through the allele
+  counts still to be placed: those of the current row, of the alleles
+  the row has already been paired with, and those still to pair with
+  it.  Alleles within the last two groups are interchangeable, so
+  each is kept sorted, which lets many partial tables share one
+  state.
+
+  For each state, '_bounds()' memoizes the total, largest and smallest
+  weight of all its completions.  '_extreme()' then walks the tables
+  from the top, adding a whole subtree at once if even its most
+  probable completion is no more probable than the observed table
+  (dropping it if even the least probable one is), and so only
+  descends where the subtree straddles the observed probability.
+
+  Built from the 'flattenedMatrix' of observed genotype counts for
+  'k' alleles, as per 'HardyWeinbergGuoThompson'.
+
+  *For internal use only.*"""
+
+  def __init__(self, flattenedMatrix, k):
+    alleleCounts = [0] * k
+    lnWeight = 0.0
+    for i in range(k):
+      for j in range(i + 1):
+        count = flattenedMatrix[(i * (i + 1) // 2) + j]
+        alleleCounts[i] += count
+        alleleCounts[j] += count
+        lnWeight += count * np.log(2.0) * (i != j) - lgamma(count + 1)
+    n = sum(alleleCounts) // 2
+    top = max(alleleCounts, default=0)
+    lnFact = _lnFactorials(2 * n)
+    self.lnHets = (np.arange(top + 1) * np.log(2.0) - lnFact[:top + 1]).tolist()
+    self.lnHoms = (-lnFact[:top // 2 + 1]).tolist()
+    self.lnNorm = float(lnFact[n] - lnFact[2 * n] + lnFact[alleleCounts].sum())
+    self.lnObserved = lnWeight + self.lnNorm
+    self.root = self._startRow(alleleCounts)
+    self.bounds = {None: (0.0, 0.0, 0.0)}
+    self.cells = k * (k + 1) // 2
+
+  def _startRow(self, counts):
+    """State at the start of a row, for the rarest remaining allele.
+
+    Alleles with nothing left to place are dropped, returns 'None'
+    once all are placed.
+
+    *For internal use only.*"""
+    counts = sorted([count for count in counts if count])
+    if not counts:
+      return None
+    return (counts[0], (), tuple(counts[1:]))
+
+  def _choices(self, state):
+    """Yield '(lnWeight, nextState)' for each count of the next genotype.
+
+    *For internal use only.*"""
+    remaining, paired, unpaired = state
+    if remaining == 0:
+      # rest of the row is zero, so move straight on to the next
+      yield 0.0, self._startRow(paired + unpaired)
+    elif not unpaired:
+      # the homozygote takes up the rest of the row
+      if remaining % 2 == 0:
+        yield self.lnHoms[remaining // 2], self._startRow(paired)
+    else:
+      other, unpaired = unpaired[0], unpaired[1:]
+      for hets in range(min(remaining, other) + 1):
+        if not unpaired and (remaining - hets) % 2:
+          continue
+        if other > hets:
+          nextPaired = list(paired)
+          bisect.insort(nextPaired, other - hets)
+          nextPaired = tuple(nextPaired)
+        else:
+          nextPaired = paired
+        yield self.lnHets[hets], (remaining - hets, nextPaired, unpaired)
+
+  def _bounds(self, state):
+    """Total, largest and smallest log-weight of completions of 'state'.
+
+    'None' if the state can't be completed to a table.
+
+    *For internal use only.*"""
+    if state in self.bounds:
+      return self.bounds[state]
+    lnTotal, lnMax, lnMin = -np.inf, -np.inf, np.inf
+    for lnWeight, nextState in self._choices(state):
+      bounds = self._bounds(nextState)
+      if bounds:
+        lnTotal = _logAdd(lnTotal, lnWeight + bounds[0])
+        lnMax = max(lnMax, lnWeight + bounds[1])
+        lnMin = min(lnMin, lnWeight + bounds[2])
+    bounds = (lnTotal, lnMax, lnMin) if lnTotal > -np.inf else None
+    self.bounds[state] = bounds
+    return bounds
+
+  def _extreme(self, state, lnPrefix):
+    """Probability of completions of 'state' no more probable than observed.
+
+    'lnPrefix' is the log-weight of the partial table so far.  Partial
+    tables that reach the same state with the same weight have the
+    same answer, so these are memoized too, to a precision well below
+    that of the comparison with the observed table.
+
+    *For internal use only.*"""
+    bounds = self._bounds(state)
+    if bounds is None or lnPrefix + bounds[2] > self.threshold:
+      return 0.0
+    if lnPrefix + bounds[1] <= self.threshold:
+      return exp(lnPrefix + bounds[0] + self.lnNorm)
+    key = (state, round(lnPrefix * 1e9))
+    if key not in self.extremes:
+      self.extremes[key] = sum([self._extreme(nextState, lnPrefix + lnWeight)
+                                for lnWeight, nextState in self._choices(state)])
+    return self.extremes[key]
+
+  def pValue(self, epsilon=1e-6):
+    """Probability of all tables no more probable than the observed one.
+
+    Probabilities are compared to relative precision 'epsilon', as per
+    '_fcmp()'.
+
+    *For internal use only.*"""
+    self.threshold = self.lnObserved - self.lnNorm \
+                     + float(np.ldexp(epsilon, np.frexp(self.lnObserved)[1]))
+    self.extremes = {}
+    recursionLimit = sys.getrecursionlimit()
+    sys.setrecursionlimit(max(recursionLimit, 4 * self.cells + 1000))
+    try:
+      return min(1.0, self._extreme(self.root, 0.0))
+    finally:
+      sys.setrecursionlimit(recursionLimit)
+
+# rough timings (in seconds) for the cost model in 'planExactTest()':
+# for enumeration (a * tables ** b, as memoization means far fewer
+# states are visited than there are tables), per MCMC step (plus a
+# part that grows with the square of the number of alleles) and per
+# plain Monte Carlo step (per gamete shuffled, plus per allele squared).
+# These were measured on one machine, so are only used as they stand
+# if 'calibrateExactTestTimings()' cannot time the engines
+_SECONDS_TO_ENUMERATE = (1e-4, 0.4)
+_SECONDS_PER_MCMC_STEP = (5e-7, 3e-8)
+_SECONDS_PER_MONTE_CARLO_STEP = (2e-8, 5e-8)
+
+# small genotype table (flattened, as per 'GenotypeCounts.packed') on
+# which each engine is timed, and how far its timings may be rescaled
+_CALIBRATION_MATRIX = [6, 8, 2, 3, 1, 1, 2, 1, 0, 1]
+_CALIBRATION_LIMITS = (0.1, 10.0)
+
+# timings for this process, once calibrated
+_exactTestTimings = None
+
+def _referenceTimings():
+  """Timings for 'planExactTest()', as measured on the reference machine.
+
+  *For internal use only.*"""
+  return {'enumeration': _SECONDS_TO_ENUMERATE,
+          'mcmc': _SECONDS_PER_MCMC_STEP,
+          'monte-carlo': _SECONDS_PER_MONTE_CARLO_STEP}
+
+def _bestTime(func, repeats):
+  """Shortest wall clock time, in seconds, of 'repeats' calls to 'func'.
+
+  *For internal use only.*"""
+  best = float('inf')
+  for i in range(repeats):
+    start = time.perf_counter()
+    func()
+    best = min(best, time.perf_counter() - start)
+  return best
+
+def calibrateExactTestTimings(repeats=3):
+  """Calibrate the timings used by 'planExactTest()' to this machine.
+
+  The first call times each engine on a small genotype table (taking
+  the best of 'repeats' runs, a few hundredths of a second in all),
+  and rescales the reference timings by how much faster or slower
+  each engine ran here, within a factor of ten.  Later calls return
+  the same timings, so calibration runs once per process.  If the
+  '_Gthwe' extension cannot be loaded, the MCMC and plain Monte Carlo
+  timings are left as they are.
+
+  Returns a dictionary of the timings, keyed by engine name.  The
+  estimates made from them are still approximate, as the timings of
+  a small table do not scale exactly to larger ones.
+  """
+  global _exactTestTimings
+  if _exactTestTimings is not None:
+    return _exactTestTimings
+
+  flattenedMatrix = _CALIBRATION_MATRIX
+  k = 4
+  n = [0] * k
+  totalGametes = 2 * sum(flattenedMatrix)
+  alleleCounts = np.zeros(k, dtype=np.int64)
+  cell = 0
+  for i in range(k):
+    for j in range(i + 1):
+      alleleCounts[i] += flattenedMatrix[cell]
+      alleleCounts[j] += flattenedMatrix[cell]
+      cell += 1
+
+  def rescale(name, measured, predicted):
+    factor = min(max(measured / predicted, _CALIBRATION_LIMITS[0]), _CALIBRATION_LIMITS[1])
+    a, b = timings[name]
+    if name == 'enumeration':
+      # the exponent is a property of the algorithm, not the machine
+      timings[name] = (a * factor, b)
+    else:
+      timings[name] = (a * factor, b * factor)
 
-def _chen_statistic (genotype, alleleFreqs, genotypes,  total_gametes):
-
-  total_indivs = total_gametes/2
-
-  allele1, allele2 = genotype.split(GENOTYPE_SEPARATOR)
-  p_i = alleleFreqs[allele1]
-  p_j = alleleFreqs[allele2]
-
-  # get current genotype frequency
-  p_ij = genotypes[genotype]/float(total_indivs)
+  timings = _referenceTimings()
+  a, b = timings['enumeration']
+  rescale('enumeration',
+          _bestTime(lambda: _TableEnumeration(flattenedMatrix, k).pValue(), repeats),
+          a * np.exp(b * _lnTableCount(alleleCounts)))
 
-  # get homozygous genotype frequencies, set to 0.0 if they aren't seen
   try:
-    p_ii = genotypes[allele1+GENOTYPE_SEPARATOR+allele1]/float(total_indivs)
-  except KeyError:
-    p_ii = 0.0
-  try:
-    p_jj = genotypes[allele2+GENOTYPE_SEPARATOR+allele2]/float(total_indivs)
-  except KeyError:
-    p_jj = 0.0
-    
-  if (allele1 != allele2):
-    # heterozygote case
-
-    d = p_i*p_j - (0.5)*p_ij
-    var = (1.0/float(total_gametes))*(p_i*p_j*((1-p_i)*(1-p_j) + p_i*p_j)
-                                      + p_i*p_i*(p_jj - p_j*p_j) 
-                                      + p_j*p_j*(p_ii - p_i*p_i))
-  else:
-    # homozygote case 
-    d = p_i*p_i - p_ii
-    var = (1.0/float(total_indivs))*(pow(p_i, 4.0)-(2*pow(p_i,3.0))+(p_i*p_i))
+    from PyPop import _Gthwe
+  except ImportError:
+    _Gthwe = None
+  if _Gthwe is not None:
+    dememorizationSteps, samplingNum, samplingSize = 1000, 10, 500
+    monteCarloSteps = 5000
+    with TemporaryDirectory() as tmp:
+      xml_tmp_filename = os.path.join(tmp, 'gthwe.out.xml')
+      a, b = timings['mcmc']
+      rescale('mcmc',
+              _bestTime(lambda: _Gthwe.run_data(flattenedMatrix, n, k, totalGametes,
+                                                dememorizationSteps, samplingNum,
+                                                samplingSize, 'calibration',
+                                                xml_tmp_filename, 0, 1, 0, [], 0, 0.0),
+                        repeats),
+              (a + b * k * k) * (dememorizationSteps + samplingNum * samplingSize))
+      a, b = timings['monte-carlo']
+      rescale('monte-carlo',
+              _bestTime(lambda: _Gthwe.run_randomization(flattenedMatrix, n, k, totalGametes,
+                                                         monteCarloSteps, xml_tmp_filename,
+                                                         0, 1, [], 0, 0.0),
+                        repeats),
+              (a * totalGametes + b * k * k) * monteCarloSteps)
+
+  _exactTestTimings = timings
+  return _exactTestTimings
+
+# the least sampling the planner will cut the tests down to
+_MIN_SAMPLING_NUM = 100
+_MIN_MONTE_CARLO_STEPS = 10000
+
+def _lnTableCount(alleleCounts, probes=1000, seed=1234):
+  """Estimate the (log) number of genotype tables with these allele counts.
+
+  Uses Knuth's (1975) estimate of the size of a backtracking tree:
+  each probe fills in the heterozygote counts one at a time, picking
+  uniformly from the values that still fit the allele counts.  The
+  product of the number of choices at each step, if the leftover
+  alleles can be made up by homozygotes, is an unbiased estimate of
+  the number of tables, so is averaged over all probes.
+
+  *For internal use only.*"""
+  rng = np.random.default_rng(seed)
+  remaining = np.tile(np.asarray(alleleCounts, dtype=np.int64), (probes, 1))
+  k = remaining.shape[1]
+  lnWeights = np.zeros(probes)
+  for i in range(k):
+    for j in range(i):
+      choices = np.minimum(remaining[:, i], remaining[:, j]) + 1
+      lnWeights += np.log(choices)
+      hets = rng.integers(choices)
+      remaining[:, i] -= hets
+      remaining[:, j] -= hets
+  lnWeights = lnWeights[np.all(remaining % 2 == 0, axis=1)]
+  if len(lnWeights) == 0:
+    # no probe completed a table, so just count the observed one
+    return 0.0
+  return float(lnWeights.max() + np.log(np.exp(lnWeights - lnWeights.max()).sum()) - np.log(probes))
+
+def planExactTest(genotypeCounts,
+                  timeBudget,
+                  dememorizationSteps=2000,
+                  samplingNum=1000,
+                  samplingSize=1000,
+                  maxMatrixSize=250,
+                  monteCarloSteps=1000000,
+                  enumeration=1,
+                  timings=None):
+  """Choose how to run the exact test for a locus, within a time budget.
+
+  Given the 'genotypeCounts' table ('GenotypeCounts') for a locus,
+  estimates the cost of each way of running the exact test, and
+  picks the first that fits in 'timeBudget' seconds:
+
+  - full enumeration, if there are few enough genotype tables with
+    the same allele counts (two allele loci always qualify), and
+    'enumeration' is true (the default);
+
+  - the Guo & Thompson Markov chain (MCMC), if the flattened genotype
+    matrix has no more than 'maxMatrixSize' elements.  'samplingNum'
+    is cut to fit, but not below 100;
+
+  - otherwise, plain Monte Carlo, with 'monteCarloSteps' cut to fit,
+    but not below 10000.
+
+  The costs come from 'timings' (as returned by
+  'calibrateExactTestTimings()', which is called if they are not
+  given), so are approximate.
+
+  Returns a dictionary with the chosen 'engine' ('enumeration',
+  'mcmc' or 'monte-carlo'), the 'timeBudget', the 'estimatedTables'
+  and the 'estimatedSeconds' for the chosen engine, and the
+  'samplingNum' and 'monteCarloSteps' to run with.
+  """
+  if timings is None:
+    timings = calibrateExactTestTimings()
 
-  chiSquare = abs(d)*abs(d)/var
+  k = genotypeCounts.k
+  alleleCounts = genotypeCounts.counts.sum(axis=0) + genotypeCounts.counts.sum(axis=1)
+  totalGametes = int(alleleCounts.sum())
 
-  return chiSquare
+  if k == 2:
+    # the tables differ only by the number of heterozygotes
+    lnTables = float(np.log(min(alleleCounts) // 2 + 1))
+  else:
+    lnTables = _lnTableCount(alleleCounts)
+
+  plan = {'timeBudget': timeBudget,
+          'estimatedTables': float(np.exp(min(lnTables, 700.0))),
+          'samplingNum': samplingNum,
+          'monteCarloSteps': monteCarloSteps}
+
+  a, b = timings['enumeration']
+  enumerationSeconds = float(np.exp(min(np.log(a) + b * lnTables, 700.0)))
+  if (enumeration and enumerationSeconds <= timeBudget) or k == 2:
+    plan.update(engine='enumeration', estimatedSeconds=enumerationSeconds)
+    return plan
+
+  a, b = timings['mcmc']
+  mcmcStepSeconds = a + b * k * k
+  if k * (k + 1) // 2 <= maxMatrixSize:
+    chunks = int((timeBudget / mcmcStepSeconds - dememorizationSteps) // samplingSize)
+    if chunks >= min(samplingNum, _MIN_SAMPLING_NUM):
+      chunks = min(samplingNum, chunks)
+      plan.update(engine='mcmc', samplingNum=chunks,
+                  estimatedSeconds=mcmcStepSeconds * (dememorizationSteps + chunks * samplingSize))
+      return plan
+
+  a, b = timings['monte-carlo']
+  monteCarloStepSeconds = a * totalGametes + b * k * k
+  steps = min(monteCarloSteps, max(_MIN_MONTE_CARLO_STEPS, int(timeBudget / monteCarloStepSeconds)))
+  plan.update(engine='monte-carlo', monteCarloSteps=steps,
+              estimatedSeconds=monteCarloStepSeconds * steps)
+  return plan
+
+def _runGuoThompsonChain(args):
+  """Run one Guo & Thompson Markov chain, returning its XML output.
+
+  Runs in a separate process, so 'args' is a tuple of the arguments
+  to '_Gthwe.run_data()', minus the output filename.
+
+  *For internal use only.*"""
+  from PyPop import _Gthwe
+  with TemporaryDirectory() as tmp:
+    xml_tmp_filename = os.path.join(tmp, 'gthwe.out.xml')
+    (flattenedMatrix, n, k, totalGametes, dememorizationSteps, samplingNum,
+     samplingSize, locusName, testing, seed, stopThresholds, stopZ) = args
+    _Gthwe.run_data(flattenedMatrix, n, k, totalGametes, dememorizationSteps,
+                    samplingNum, samplingSize, locusName, xml_tmp_filename,
+                    0, testing, seed, stopThresholds, len(stopThresholds), stopZ)
+    fp = open(xml_tmp_filename)
+    contents = fp.read()
+    fp.close()
+  return contents
 
 class HardyWeinberg:
   """Calculate Hardy-Weinberg statistics.
@@ -97,12 +584,18 @@ class HardyWeinberg:
                alleleCount=None,
                lumpBelow = 5,
                flagChenTest = 0,
+               genotypeCounts=None,
                debug=0):
     """Constructor.
 
     - locusData and alleleCount to be provided by driver script
       via a call to ParseFile.getLocusData(locus).
 
+    - genotypeCounts: the 'GenotypeCounts' table for the locus, if
+      already available (e.g. from 'Genotypes.getGenotypeCountsAt()'),
+      in which case 'locusData' is not used (Default: built from
+      'locusData')
+
     - lumpBelow: treat alleles with frequency less than this as if they
       were in same class  (Default: 5)
 
@@ -114,12 +607,17 @@ class HardyWeinberg:
     self.locusData = locusData         # ordered tuples of genotypes
     self.lumpBelow = lumpBelow
 
+    # table of genotype counts, shared by all the tests
+    if genotypeCounts == None:
+      genotypeCounts = GenotypeCounts(locusData=locusData)
+    self.genotypeCounts = genotypeCounts
+
     self.alleleCounts = alleleCount[0] #just the dictionary of allelename:count
     self.alleleTotal = alleleCount[1]
 
     self.debug = debug
 
-    self.n = len(self.locusData)
+    self.n = self.genotypeCounts.n
     self.k = len(self.alleleCounts)
 
     self.flagChenTest = flagChenTest
@@ -132,50 +630,40 @@ class HardyWeinberg:
 
   def _generateTables(self):
     """Manipulate the given genotype data to generate
-    the tables upon which the calculations will be based."""
+    the tables upon which the calculations will be based.
+
+    Alleles are referred to by their index in the alphabetically
+    sorted list of observed alleles.  The possible genotypes are
+    enumerated in order of first appearance of their alleles, and
+    all per-genotype quantities are arrays in that order.  Sums are
+    accumulated sequentially in the same order as the original
+    (per-genotype) implementation, so that results are identical."""
 
     self.alleleFrequencies = {}
-    self.observedGenotypes = []
-    self.observedAlleles = []               # need a uniqed list
-    self.observedGenotypeCounts = {}
-    self.possibleGenotypes = []
-    self.expectedGenotypeCounts = {}
     self.hetsObservedByAllele = {}
     self.hetsExpectedByAllele = {}
     self.hetsChisqByAllele = {}
     self.hetsPvalByAllele = {}
-    self.chisqByGenotype = {}
-    self.pvalByGenotype = {}
-    self.totalHomsObs = 0
-    self.totalHetsObs = 0
-    self.totalHomsExp = 0.0
-    self.totalHetsExp = 0.0
     
     # self.alleleTotal = 0
 
     if self.flagChenTest:
       self.chenPvalByGenotype = {}
 
-    for allele in self.locusData:
-      """Run through each tuple in the given genotype data and
-      create dictionaries of observed alleles and genotypes."""
-
-      if allele[0] not in self.observedAlleles:
-        self.observedAlleles.append(allele[0])
-      if allele[1] not in self.observedAlleles:
-        self.observedAlleles.append(allele[1])
-
-      if allele[0] != allele[1]:
-        if allele[0] in self.hetsObservedByAllele:
-          self.hetsObservedByAllele[allele[0]] += 1
-        else:
-          self.hetsObservedByAllele[allele[0]] = 1
-        if allele[1] in self.hetsObservedByAllele:
-          self.hetsObservedByAllele[allele[1]] += 1
-        else:
-          self.hetsObservedByAllele[allele[1]] = 1
-
-      self.observedGenotypes.append(allele[0] + GENOTYPE_SEPARATOR + allele[1])
+    # observed alleles (in order of first appearance) and the (k x
+    # k) table of observed genotype counts
+    self.observedAlleles = self.genotypeCounts.alleles[:]
+    self.sortedAlleles = self.genotypeCounts.sortedAlleles[:]
+    self.observedGenotypeCounts = self.genotypeCounts.counts
+    k = len(self.sortedAlleles)
+
+    # heterozygotes and homozygotes observed, in total and by allele
+    homs = self.observedGenotypeCounts.diagonal()
+    self.hetsObserved = self.observedGenotypeCounts.sum(axis=0) + \
+                        self.observedGenotypeCounts.sum(axis=1) - 2 * homs
+    self.hetsObservedByAllele = dict(zip(self.sortedAlleles, self.hetsObserved.tolist()))
+    self.totalHomsObs = int(homs.sum())
+    self.totalHetsObs = self.n - self.totalHomsObs
 
     for allele in self.alleleCounts.keys():
       """For each entry in the dictionary of allele counts
@@ -184,73 +672,44 @@ class HardyWeinberg:
       freq = self.alleleCounts[allele] / float(self.alleleTotal)
       self.alleleFrequencies[allele] = freq
 
-    for genotype in self.observedGenotypes:
-      """Generate a dictionary of genotype:count key:values
-
-      - and accumulate totals for homozygotes and heterozygotes"""
-
-      if genotype in self.observedGenotypeCounts:
-        self.observedGenotypeCounts[genotype] += 1
-      else:
-        self.observedGenotypeCounts[genotype] = 1
-
-      temp = genotype.split(GENOTYPE_SEPARATOR)
-      if temp[0] == temp[1]:
-        self.totalHomsObs += 1
-      else:
-        self.totalHetsObs += 1
-
     if self.debug:
       print("Total homozygotes observed:", self.totalHomsObs)
       print("Total heterozygotes observed:", self.totalHetsObs)
 
-    for i in range(len(self.observedAlleles)):
-      """Generate a list of all possible genotypes
-
-      - sorting the individual genotypes alphabetically"""
-
-      for j in range(i, len(self.observedAlleles)):
-          if self.observedAlleles[i] < self.observedAlleles[j]:
-            self.possibleGenotypes.append(self.observedAlleles[i] + GENOTYPE_SEPARATOR + self.observedAlleles[j])
-          else:
-            self.possibleGenotypes.append(self.observedAlleles[j] + GENOTYPE_SEPARATOR + self.observedAlleles[i])
-
-    for genotype in self.possibleGenotypes:
-      """Calculate expected genotype counts under HWP
-
-      - Create a dictionary of genotype:frequency key:values
-
-      - accumulate totals for homozygotes and heterozygotes
-
-      - and build table of observed genotypes for each allele"""
-
-      temp = genotype.split(GENOTYPE_SEPARATOR)
-      if temp[0] == temp[1]:         # homozygote, N * pi * pi
-        self.expectedGenotypeCounts[genotype] = self.n * \
-        self.alleleFrequencies[temp[0]] * self.alleleFrequencies[temp[1]]
-        self.totalHomsExp += self.expectedGenotypeCounts[genotype]
-      else:                          # heterozygote, 2N * pi * pj
-        self.expectedGenotypeCounts[genotype] = 2 * self.n * \
-        self.alleleFrequencies[temp[0]] * self.alleleFrequencies[temp[1]]
-        self.totalHetsExp += self.expectedGenotypeCounts[genotype]
-
-        for allele in self.observedAlleles:
-          if allele == temp[0]:
-            if allele in self.hetsExpectedByAllele:
-              self.hetsExpectedByAllele[allele] += self.expectedGenotypeCounts[genotype]
-            else:
-              self.hetsExpectedByAllele[allele] = self.expectedGenotypeCounts[genotype]
-          elif allele == temp[1]:
-            if allele in self.hetsExpectedByAllele:
-              self.hetsExpectedByAllele[allele] += self.expectedGenotypeCounts[genotype]
-            else:
-              self.hetsExpectedByAllele[allele] = self.expectedGenotypeCounts[genotype]
-
-    total = 0
-    for value in self.expectedGenotypeCounts.values():
-      """Check that the sum of expected genotype counts approximates N"""
-
-      total += value
+    # all possible genotypes, as (smaller, larger) allele indices,
+    # with 'genotypeIndex' giving the position of each in the list
+    alleleIndex = self.genotypeCounts.getAlleleIndex()
+    order = np.array([alleleIndex[allele] for allele in self.observedAlleles], dtype=np.intp)
+    first, second = np.triu_indices(k)
+    self.possibleGenotypes = np.sort(np.column_stack((order[first], order[second])), axis=1)
+    allele1, allele2 = self.possibleGenotypes.T
+    self.genotypeIndex = np.zeros((k, k), dtype=np.intp)
+    self.genotypeIndex[allele1, allele2] = np.arange(len(allele1))
+    self.isHomozygote = allele1 == allele2
+
+    # expected genotype counts under HWP: N * pi * pi for
+    # homozygotes, 2N * pi * pj for heterozygotes
+    freqs = np.array([self.alleleFrequencies[allele] for allele in self.sortedAlleles], dtype=float)
+    self.expectedGenotypeCounts = np.where(self.isHomozygote,
+                                           self.n * freqs[allele1] * freqs[allele2],
+                                           2 * self.n * freqs[allele1] * freqs[allele2])
+    self.observedGenotypes = self.observedGenotypeCounts[allele1, allele2]
+
+    self.totalHomsExp = _accumulate(self.expectedGenotypeCounts[self.isHomozygote])
+    self.totalHetsExp = _accumulate(self.expectedGenotypeCounts[~self.isHomozygote])
+
+    # expected heterozygotes by allele, each heterozygote contributes
+    # to both its alleles
+    hets = ~self.isHomozygote
+    self.hetsExpected = np.zeros(k)
+    np.add.at(self.hetsExpected,
+              np.column_stack((allele1[hets], allele2[hets])).ravel(),
+              np.repeat(self.expectedGenotypeCounts[hets], 2))
+    if hets.any():
+      self.hetsExpectedByAllele = dict(zip(self.sortedAlleles, self.hetsExpected.tolist()))
+
+    # check that the sum of expected genotype counts approximates N
+    total = _accumulate(self.expectedGenotypeCounts, 0)
     if abs(float(self.n) - total) > float(self.n) / 1000.0:
       print('AAIIEE!')
       print('Calculated sum of expected genotype counts is:', total, ', but N is:', self.n)
@@ -272,18 +731,10 @@ class HardyWeinberg:
       compiled as a loadable shared library.  This code is based on
       R's implementation of the chi-square test which is released
       under the GNU GPL and as such, is redistributable with our
-      code, removing the need for an external program"""
-
-    self.counterA = {}
-    self.chisq = {}
-    self.chisqPval = {}
-    self.commonGenotypeCounter = 0
-    self.commonChisqAccumulator = 0.0
-    self.commonObservedAccumulator = 0
-    self.commonExpectedAccumulator = 0.0
-    self.rareGenotypeCounter = 0
-    self.lumpedObservedGenotypes = 0.0
-    self.lumpedExpectedGenotypes = 0.0
+      code, removing the need for an external program.  The
+      per-allele, per-genotype and Chen p-values for a locus are
+      each computed in a single call to 'pvals'."""
+
     self.flagHets = 0
     self.flagHoms = 0
     self.flagCommons = 0
@@ -310,104 +761,69 @@ class HardyWeinberg:
       self.chisqHetsPval = _Pvalue.pval(self.totalChisqHets, 1)
       self.flagHets = 1
 
-    # now the values for heterozygoous genotypes by allele
-    for allele in self.observedAlleles:
-      if self.hetsExpectedByAllele:
-        if self.hetsExpectedByAllele[allele] >= self.lumpBelow:
-          if not (allele in self.hetsObservedByAllele):
-            self.hetsObservedByAllele[allele] = 0
-
-          squareMe = self.hetsObservedByAllele[allele] - self.hetsExpectedByAllele[allele]
-          self.hetsChisqByAllele[allele] = (squareMe * squareMe) / self.hetsExpectedByAllele[allele]
-
-          self.hetsPvalByAllele[allele] = _Pvalue.pval(self.hetsChisqByAllele[allele], 1)
-
-          if self.debug:
-            print('By Allele:    obs exp   chi        p')
-            print('          ', allele, self.hetsObservedByAllele[allele], self.hetsExpectedByAllele[allele], self.hetsChisqByAllele[allele], self.hetsPvalByAllele[allele])
-
-    # do Chen's statistic
-    if self.flagChenTest:
-      for genotype in self.observedGenotypeCounts.keys():
-        chenChiSquare = _chen_statistic(genotype, self.alleleFrequencies,
-                            self.observedGenotypeCounts, self.alleleTotal)
-        self.chenPvalByGenotype[genotype] = _Pvalue.pval(chenChiSquare,1)
-
-    # the list for all genotypes by genotype
-    for genotype in self.expectedGenotypeCounts.keys():
-
-      if self.expectedGenotypeCounts[genotype] >= self.lumpBelow:
-        if not (genotype in self.observedGenotypeCounts):
-          self.observedGenotypeCounts[genotype] = 0
-
-        squareMe = self.observedGenotypeCounts[genotype] - self.expectedGenotypeCounts[genotype]
-
-        self.chisqByGenotype[genotype] = (squareMe * squareMe) / self.expectedGenotypeCounts[genotype]
-        self.pvalByGenotype[genotype] = _Pvalue.pval(self.chisqByGenotype[genotype],1)
-        
-        if self.debug:
-          print('By Genotype:  obs exp   chi        p')
-          print('          ', genotype, self.observedGenotypeCounts[genotype], self.expectedGenotypeCounts[genotype], self.chisqByGenotype[genotype], self.pvalByGenotype[genotype])
-
-
-    # and now the hard stuff
-    for genotype in self.expectedGenotypeCounts.keys():
-      if self.expectedGenotypeCounts[genotype] >= self.lumpBelow:
-
-        # Count the common genotypes in categories by allele.
-        # Used to determine DoF for common genotypes later.
-        temp = genotype.split(GENOTYPE_SEPARATOR)
-        if temp[0] in self.counterA:
-          self.counterA[temp[0]] += 1
-        else:
-          self.counterA[temp[0]] = 1
-        if temp[1] in self.counterA:
-          self.counterA[temp[1]] += 1
-        else:
-          self.counterA[temp[1]] = 1
+    # now the values for heterozygous genotypes by allele (in order
+    # of first appearance)
+    if self.hetsExpectedByAllele:
+      alleleIndex = self.genotypeCounts.getAlleleIndex()
+      testedAlleles = [allele for allele in self.observedAlleles \
+                       if self.hetsExpected[alleleIndex[allele]] >= self.lumpBelow]
+      indices = [alleleIndex[allele] for allele in testedAlleles]
+      squareMe = self.hetsObserved[indices] - self.hetsExpected[indices]
+      hetsChisqs = (squareMe * squareMe) / self.hetsExpected[indices]
+      hetsPvals = _pvals(hetsChisqs)
+      for allele, chisq, pval in zip(testedAlleles, hetsChisqs, hetsPvals):
+        self.hetsChisqByAllele[allele] = float(chisq)
+        self.hetsPvalByAllele[allele] = float(pval)
 
         if self.debug:
-          print('Expected:')
-          print(genotype, self.expectedGenotypeCounts[genotype])
-          if genotype in self.observedGenotypeCounts:
-            print('Observed:', self.observedGenotypeCounts[genotype])
-          else:
-            print('Observed: 0')
-
-        # calculate the contribution of each genotype to it
-        # and tot up the cumulative chi-square 
-        self.commonGenotypeCounter += 1
-        if genotype in self.observedGenotypeCounts:
-          observedCount = self.observedGenotypeCounts[genotype]
-        else:
-          observedCount = 0.0
-
-        squareMe = observedCount - self.expectedGenotypeCounts[genotype]
-        self.chisq[genotype] = (squareMe * squareMe) / self.expectedGenotypeCounts[genotype]
-
-        self.chisqPval[genotype] = _Pvalue.pval(self.chisq[genotype], 1)
-        
-        self.commonChisqAccumulator += self.chisq[genotype]
-        self.commonObservedAccumulator += observedCount
-        self.commonExpectedAccumulator += self.expectedGenotypeCounts[genotype]
+          print('By Allele:    obs exp   chi        p')
+          print('          ', allele, self.hetsObservedByAllele[allele], self.hetsExpectedByAllele[allele], self.hetsChisqByAllele[allele], self.hetsPvalByAllele[allele])
+
+    # do Chen's statistic, for each genotype in the orientation it
+    # was observed
+    if self.flagChenTest and self.n:
+      alleleFreqs = [self.alleleFrequencies[allele] for allele in self.sortedAlleles]
+      observed = self.observedGenotypeCounts.nonzero()
+      chenChiSquares = _chenStatistics(alleleFreqs, self.observedGenotypeCounts,
+                                       self.alleleTotal)[observed]
+      for i, j, pval in zip(*observed, _pvals(chenChiSquares)):
+        self.chenPvalByGenotype[(int(i), int(j))] = float(pval)
+
+    # genotypes with enough expected counts are tested individually,
+    # the remaining (rare) genotypes are lumped together
+    self.isCommon = self.expectedGenotypeCounts >= self.lumpBelow
+    common = self.isCommon
+    rare = ~common
+
+    squareMe = self.observedGenotypes[common] - self.expectedGenotypeCounts[common]
+    self.chisqByGenotype = np.zeros(len(common))
+    self.chisqByGenotype[common] = (squareMe * squareMe) / self.expectedGenotypeCounts[common]
+    self.pvalByGenotype = np.zeros(len(common))
+    self.pvalByGenotype[common] = _pvals(self.chisqByGenotype[common])
 
-        if self.debug:
-          print('Chi Squared value:')
-          print(genotype, ':', self.chisq[genotype])
-          # print("command %s returned %s" % (command, returnedValue)
-          print('P-value:')
-          print(genotype, ':', self.chisqPval[genotype])
+    if self.debug:
+      print('By Genotype:  obs exp   chi        p')
+      for g in common.nonzero()[0]:
+        print('          ', self.possibleGenotypes[g], self.observedGenotypes[g], self.expectedGenotypeCounts[g], self.chisqByGenotype[g], self.pvalByGenotype[g])
 
-      else:
-        """Expected genotype count for this genotype is less than lumpBelow"""
+    # count the alleles present in the common genotypes, used to
+    # determine DoF for common genotypes later.
+    commonAlleles = np.unique(self.possibleGenotypes[common])
 
-        self.rareGenotypeCounter += 1
+    # tot up the cumulative chi-square and counts over common
+    # genotypes, and the lumped counts over rare genotypes
+    self.commonGenotypeCounter = int(common.sum())
+    self.commonChisqAccumulator = _accumulate(self.chisqByGenotype[common])
+    self.commonObservedAccumulator = int(self.observedGenotypes[common].sum())
+    self.commonExpectedAccumulator = _accumulate(self.expectedGenotypeCounts[common])
 
-        self.lumpedExpectedGenotypes += self.expectedGenotypeCounts[genotype]
+    self.rareGenotypeCounter = int(rare.sum())
+    self.lumpedExpectedGenotypes = _accumulate(self.expectedGenotypeCounts[rare])
+    self.lumpedObservedGenotypes = float(self.observedGenotypes[rare].sum())
 
-        if genotype in self.observedGenotypeCounts:
-          self.lumpedObservedGenotypes += self.observedGenotypeCounts[genotype]
-    # End of loop for genotype in self.expectedGenotypeCounts.keys():
+    if self.debug:
+      print('Common genotypes:', self.commonGenotypeCounter, 'chisq:', self.commonChisqAccumulator)
+      print('Rare genotypes:', self.rareGenotypeCounter)
 
     if self.commonGenotypeCounter == 0:
     # no common genotypes, so do no calculations.
@@ -429,11 +845,7 @@ class HardyWeinberg:
       """ Calculate the Chi Squared value for the lumped rare genotypes"""
 
       # first calculate the degrees of freedom for the common genotypes
-      self.counterAllelesCommon = 0
-
-      for allele in self.counterA.keys():
-        if self.counterA[allele] > 0:
-          self.counterAllelesCommon += 1
+      self.counterAllelesCommon = len(commonAlleles)
 
       # if all alleles present in common genotypes, then there are
       # k - 1 independent allele frequency estimates.
@@ -629,46 +1041,29 @@ class HardyWeinberg:
 
   def serializeXMLTableTo(self, stream):
 
-    sortedAlleles = self.observedAlleles[:]
-    sortedAlleles.sort()
-
     stream.opentag("genotypetable")
     stream.writeln()
 
     genotypeId = 0
 
-    for horiz in sortedAlleles:
+    # lower-triangular table, so that 'horiz' >= 'vert'
+    for horiz in range(len(self.sortedAlleles)):
 
-      for vert in sortedAlleles:
-        # ensure that matrix is triangular
-        if vert > horiz:
-          continue
+      for vert in range(horiz + 1):
 
         # start tag
-        stream.opentag("genotype", row=horiz, id=("%d" % genotypeId), col=vert)
+        stream.opentag("genotype", row=self.sortedAlleles[horiz],
+                       id=("%d" % genotypeId), col=self.sortedAlleles[vert])
+
+        # get observed value
+        obs = self.genotypeCounts.packed[genotypeId]
 
         # increment id
         genotypeId += 1
 
-        # need to check both permutations of key
-        key1 = "%s%s%s" % (horiz, GENOTYPE_SEPARATOR, vert)
-        key2 = "%s%s%s" % (vert, GENOTYPE_SEPARATOR, horiz)
-
-        # get observed value
-        if key1 in self.observedGenotypeCounts:
-          obs = self.observedGenotypeCounts[key1]
-        elif key2 in self.observedGenotypeCounts:
-          obs = self.observedGenotypeCounts[key2]
-        else:
-          obs = 0
-
         # get expected value
-        if key1 in self.expectedGenotypeCounts:
-          exp = self.expectedGenotypeCounts[key1]
-        elif key2 in self.expectedGenotypeCounts:
-          exp = self.expectedGenotypeCounts[key2]
-        else:
-          exp = 0.0
+        genotype = self.genotypeIndex[vert, horiz]
+        exp = self.expectedGenotypeCounts[genotype]
 
         stream.writeln()
         stream.tagContents("observed", "%d" % obs)
@@ -677,27 +1072,25 @@ class HardyWeinberg:
         stream.writeln()
 
         # get and tag chisq and pvalue (if they exist)
-        if key1 in self.chisqByGenotype:
-          stream.tagContents("chisq", "%4f" % self.chisqByGenotype[key1])
-          stream.writeln()
-          stream.tagContents("pvalue", "%4f" % self.pvalByGenotype[key1])
-        elif key2 in self.chisqByGenotype:
-          stream.tagContents("chisq", "%4f" % self.chisqByGenotype[key2])
+        if self.isCommon[genotype]:
+          stream.tagContents("chisq", "%4f" % self.chisqByGenotype[genotype])
           stream.writeln()
-          stream.tagContents("pvalue", "%4f" % self.pvalByGenotype[key2])
+          stream.tagContents("pvalue", "%4f" % self.pvalByGenotype[genotype])
         else:
           stream.emptytag("chisq", role='not-calculated')
           stream.writeln()
           stream.emptytag("pvalue", role='not-calculated')
         stream.writeln()
 
+        # Chen's statistic is kept for the orientation in which the
+        # genotype was observed
         if self.flagChenTest:
-          if key1 in self.chenPvalByGenotype:
+          if (horiz, vert) in self.chenPvalByGenotype:
             stream.tagContents("chenPvalue", "%4f" % \
-                             self.chenPvalByGenotype[key1])
-          elif key2 in self.chenPvalByGenotype:
+                             self.chenPvalByGenotype[(horiz, vert)])
+          elif (vert, horiz) in self.chenPvalByGenotype:
             stream.tagContents("chenPvalue", "%4f" % \
-                               self.chenPvalByGenotype[key2])
+                               self.chenPvalByGenotype[(vert, horiz)])
           else:
             stream.emptytag("chenPvalue", role='not-calculated')
           stream.writeln()
@@ -742,6 +1135,29 @@ class HardyWeinbergGuoThompson(HardyWeinberg):
 
   - 'monteCarloSteps': number of steps for the plain Monte Carlo
      randomization test (without Markov-chain)
+
+  - 'numChains': number of independent Markov chains to run in
+     parallel (default 1).  The 'samplingNum' chunks are split between
+     the chains, each of which has its own dememorization steps and
+     random number seed, and the merged p-value has the standard
+     error between chains.
+
+  - 'stopThresholds': list of significance thresholds (e.g. '[0.01,
+     0.05]') for the MCMC test.  If given, sampling stops as soon as
+     the confidence interval for the p-value excludes all of them (but
+     not before 10 chunks).  The steps used and the half-width of the
+     interval are reported as '<stepsUsed>' and '<precision>'.
+
+  - 'monteCarloStopThresholds': as 'stopThresholds', for the plain
+     Monte Carlo test (checked every 1000 steps, after the first
+     10000).  The steps used are reported in '<steps>'.
+
+  - 'stopConfidence': confidence level of the interval used for
+     stopping (default 0.99).
+
+  - 'plan': the dictionary returned by 'planExactTest()', if the test
+     was chosen by the planner, which is recorded in the output as a
+     '<plan>' element.
      """
 
   def __init__(self,
@@ -754,6 +1170,11 @@ class HardyWeinbergGuoThompson(HardyWeinberg):
                samplingSize=1000,
                maxMatrixSize=250,
                monteCarloSteps=1000000, # samplingNum*samplingSize (consistency)
+               numChains=1,
+               stopThresholds=None,
+               monteCarloStopThresholds=None,
+               stopConfidence=0.99,
+               plan=None,
                testing=False,
                **kw):
 
@@ -764,6 +1185,11 @@ class HardyWeinbergGuoThompson(HardyWeinberg):
     self.samplingSize=samplingSize
     self.maxMatrixSize=maxMatrixSize
     self.monteCarloSteps=monteCarloSteps
+    self.numChains=numChains
+    self.stopThresholds=[float(t) for t in (stopThresholds or [])]
+    self.monteCarloStopThresholds=[float(t) for t in (monteCarloStopThresholds or [])]
+    self.stopZ=NormalDist().inv_cdf((1 + stopConfidence) / 2)
+    self.plan=plan
     if testing:
       self.testing = 1
     else:
@@ -777,49 +1203,25 @@ class HardyWeinbergGuoThompson(HardyWeinberg):
 
   def generateFlattenedMatrix(self):
 
-    self.sortedAlleles = self.observedAlleles
-    self.sortedAlleles.sort()
-
     if self.debug:
       print ("sortedAlleles: ", self.sortedAlleles)
       print ("observedGenotypeCounts: ", self.observedGenotypeCounts)
 
-    # allele list
-    self.flattenedMatrix = []
+    # The order of this flattened (lower-triangular) matrix must
+    # match *exactly* the order in which it is emitted by the XML
+    # <hardyweinberg><genotypetable>, otherwise the individual
+    # pvalues genotypes output order in the gthwe module wouldn't
+    # match the genotypes in the XML.  Both are generated from the
+    # packed genotype table, so this is guaranteed.
+    self.flattenedMatrix = self.genotypeCounts.packed.tolist()
     self.flattenedMatrixNames = []
-    self.totalGametes = 0
-
-    # FIXME: The order in which this flattenedMatrix is generated is
-    # very important, because it must match *exactly* the order in
-    # which is emitted by the XML <hardyweinberg><genotypetable>.
-    # currently the order *does* match, because allele list is
-    # sorted before running test (check this!).  If it didn't, the
-    # individual pvalues genotypes output order in the gthwe module
-    # wouldn't match the genotypes in the XML, making it impossible
-    # to match the emitted pvalues with their genotype label (I
-    # can't think of any other solution to this other than passing
-    # in the labels for the genotypes which would be very
-    # cumbersome).
     for horiz in self.sortedAlleles:
-      # print("%2s" % horiz),
       for vert in self.sortedAlleles:
         # ensure that matrix is triangular
         if vert > horiz:
           continue
-
-        # need to check both permutations of key
-        key1 = "%s%s%s" % (horiz, GENOTYPE_SEPARATOR, vert)
-        key2 = "%s%s%s" % (vert, GENOTYPE_SEPARATOR, horiz)
-        if key1 in self.observedGenotypeCounts:
-          output = "%2s " % self.observedGenotypeCounts[key1]
-        elif key2 in self.observedGenotypeCounts:
-          output = "%2s " % self.observedGenotypeCounts[key2]
-        else:
-          output = "%2s " % "0"
-
-        self.flattenedMatrix.append(int(output))
-        self.flattenedMatrixNames.append(key2)
-        self.totalGametes += int(output)
+        self.flattenedMatrixNames.append("%s%s%s" % (vert, GENOTYPE_SEPARATOR, horiz))
+    self.totalGametes = sum(self.flattenedMatrix)
                
   def dumpTable(self, locusName, stream, allelelump=0):
 
@@ -861,20 +1263,26 @@ class HardyWeinbergGuoThompson(HardyWeinberg):
                       allelelump=("%d" % allelelump))
 
       self.serializeXMLTableTo(stream)
+      self._serializePlanTo(stream)
 
-      with TemporaryDirectory() as tmp:
-        # generates temporary directory and filename, and cleans-up after block ends
-        xml_tmp_filename=os.path.join(tmp, 'gthwe.out.xml')
-
-        _Gthwe.run_data(self.flattenedMatrix, n, self.k, self.totalGametes,
-                        self.dememorizationSteps, self.samplingNum,
-                        self.samplingSize, locusName, xml_tmp_filename, 0, self.testing)
-
-        # read the generated contents of the temporary XML file
-        fp = open(xml_tmp_filename)
-        # copy XML output to stream
-        stream.write(fp.read())
-        fp.close()
+      if self.numChains > 1:
+        self._runChains(locusName, n, stream)
+      else:
+        with TemporaryDirectory() as tmp:
+          # generates temporary directory and filename, and cleans-up after block ends
+          xml_tmp_filename=os.path.join(tmp, 'gthwe.out.xml')
+
+          _Gthwe.run_data(self.flattenedMatrix, n, self.k, self.totalGametes,
+                          self.dememorizationSteps, self.samplingNum,
+                          self.samplingSize, locusName, xml_tmp_filename, 0,
+                          self.testing, 0, self.stopThresholds,
+                          len(self.stopThresholds), self.stopZ)
+
+          # read the generated contents of the temporary XML file
+          fp = open(xml_tmp_filename)
+          # copy XML output to stream
+          stream.write(fp.read())
+          fp.close()
 
       stream.closetag('hardyweinbergGuoThompson')
       stream.writeln()
@@ -885,6 +1293,7 @@ class HardyWeinbergGuoThompson(HardyWeinberg):
                       type='monte-carlo',
                       allelelump=("%d" % allelelump))
       self.serializeXMLTableTo(stream)
+      self._serializePlanTo(stream)
 
       
       with TemporaryDirectory() as tmp:
@@ -893,7 +1302,9 @@ class HardyWeinbergGuoThompson(HardyWeinberg):
 
         _Gthwe.run_randomization(self.flattenedMatrix, n, self.k,
                                  self.totalGametes, self.monteCarloSteps,
-                                 xml_tmp_filename, 0, self.testing)
+                                 xml_tmp_filename, 0, self.testing,
+                                 self.monteCarloStopThresholds,
+                                 len(self.monteCarloStopThresholds), self.stopZ)
 
         # read the generated contents of the temporary XML file
         fp = open(xml_tmp_filename)
@@ -906,8 +1317,109 @@ class HardyWeinbergGuoThompson(HardyWeinberg):
 
 
 
+  def _serializePlanTo(self, stream):
+    """Record the planner's choice of test, if it made one.
+
+    *For internal use only.*"""
+    if self.plan:
+      # the estimates are from timings of a small table, so approximate
+      stream.emptytag('plan', engine=self.plan['engine'],
+                      approximate="1",
+                      timeBudget=("%g" % self.plan['timeBudget']),
+                      estimatedTables=("%.3g" % self.plan['estimatedTables']),
+                      estimatedSeconds=("%.3g" % self.plan['estimatedSeconds']))
+      stream.writeln()
+
+  def _runChains(self, locusName, n, stream):
+    """Run the MCMC test as 'numChains' chains, and merge the output.
+
+    Chains are run in a process pool, each with the same
+    dememorization steps and its share of the 'samplingNum' chunks.
+    The overall and individual genotype p-values are the means over
+    all chunks, and the standard error is between chains.
+
+    *For internal use only.*"""
+    chunks = [self.samplingNum // self.numChains + (i < self.samplingNum % self.numChains) \
+              for i in range(self.numChains)]
+    chunks = [chunk for chunk in chunks if chunk > 0]
+
+    # give each chain an independent seed, fixed in testing mode
+    seeds = np.random.SeedSequence(1234 if self.testing else None).spawn(len(chunks))
+    args = [(self.flattenedMatrix, n, self.k, self.totalGametes,
+             self.dememorizationSteps, chunk, self.samplingSize, locusName,
+             self.testing, int(seed.generate_state(1)[0]) or 1,
+             self.stopThresholds, self.stopZ) \
+            for chunk, seed in zip(chunks, seeds)]
+
+    with ProcessPoolExecutor(max_workers=len(args)) as executor:
+      chains = [ElementTree.fromstring('<chain>' + contents + '</chain>') \
+                for contents in executor.map(_runGuoThompsonChain, args)]
+
+    # chains that stopped early are weighted by the chunks they used
+    if self.stopThresholds:
+      chunks = [int(chain.find('stepsUsed').text) // self.samplingSize for chain in chains]
+    weights = np.array(chunks, dtype=float) / sum(chunks)
+    pvals = np.array([float(chain.find("pvalue[@type='overall']").text) for chain in chains])
+    pvalue = float((weights * pvals).sum())
+    if len(chains) > 1:
+      stderr = sqrt((weights * (pvals - pvalue) ** 2).sum() / (len(chains) - 1))
+    else:
+      stderr = 0.0
+
+    stream.tagContents('dememorizationSteps', "%d" % self.dememorizationSteps)
+    stream.writeln()
+    stream.tagContents('samplingNum', "%d" % self.samplingNum)
+    stream.writeln()
+    stream.tagContents('samplingSize', "%d" % self.samplingSize)
+    stream.writeln()
+    stream.tagContents('chains', "%d" % len(chains))
+    stream.writeln()
+    stream.tagContents('pvalue', "%7.4g" % pvalue, type='overall')
+    stream.tagContents('stderr', "%7.4g" % stderr)
+    stream.writeln()
+
+    # switches are weighted by the total steps in each chain
+    steps = np.array([self.dememorizationSteps + chunk * self.samplingSize \
+                      for chunk in chunks], dtype=float)
+    stream.opentag('switches')
+    stream.writeln()
+    for switch in ['percent-partial', 'percent-full', 'percent-all']:
+      percents = np.array([float(chain.find('switches/' + switch).text) for chain in chains])
+      stream.tagContents(switch, "%6.2f" % ((steps * percents).sum() / steps.sum()))
+      stream.writeln()
+    stream.closetag('switches')
+    stream.writeln()
+    if self.stopThresholds:
+      stream.tagContents('stepsUsed', "%d" % (sum(chunks) * self.samplingSize))
+      stream.writeln()
+      # the chains' own precision is combined too, in case they agree
+      # too closely for the between chain error to be useful
+      precisions = np.array([float(chain.find('precision').text) for chain in chains])
+      precision = max(self.stopZ * stderr, sqrt((weights ** 2 * precisions ** 2).sum()))
+      stream.tagContents('precision', "%g" % precision)
+      stream.writeln()
+
+    # individual genotype p-values, in the order gthwe emits them
+    genotypePvals = [chain.findall("pvalue[@type='genotype']") for chain in chains]
+    for i, pval in enumerate(genotypePvals[0]):
+      merged = sum([weight * float(chainPvals[i].text) \
+                    for weight, chainPvals in zip(weights, genotypePvals)])
+      stream.tagContents('pvalue', "%g" % merged, type='genotype',
+                         statistic=pval.get('statistic'),
+                         row=pval.get('row'), col=pval.get('col'))
+      stream.writeln()
+
 class HardyWeinbergEnumeration(HardyWeinbergGuoThompson):
-  """Uses Hazael Maldonado Torres' exact enumeration test
+  """Exact Hardy-Weinberg test, by enumeration of genotype tables.
+
+  The overall p-value is the total probability of all the genotype
+  tables with the same allele counts that are no more probable than
+  the observed one, as per '_TableEnumeration', so is exact rather
+  than estimated.  The individual genotype p-values use the same
+  'diff' and 'chen' statistics as 'gthwe', summed over the exact
+  joint distribution of the i/i, i/j and j/j counts (see
+  '_lumpedGenotypeDistribution()'), which is the same whether or not
+  the overall p-value is calculated.
 
   - 'doOverall': if set to true ('1'), then do overall p-value test
                  default is false ('0')
@@ -917,31 +1429,82 @@ class HardyWeinbergEnumeration(HardyWeinbergGuoThompson):
                alleleCount=None,
                doOverall=0,
                **kw):
-    from PyPop import _HweEnum
 
-    self.HweEnumProcess = _HweEnum
-    
     HardyWeinbergGuoThompson.__init__(self,
                                       locusData=locusData,
                                       alleleCount=alleleCount,
                                       **kw)
     self.doOverall = doOverall
     self.generateFlattenedMatrix()
+    self._calcExact()
 
-    self.HweEnumProcess.run_external(self.flattenedMatrix,
-                                     self.k,
-                                     self.doOverall)
+  def _calcExact(self):
+    """Calculate the exact overall and individual genotype p-values.
 
+    *For internal use only.*"""
     if self.doOverall:
-      self.exactPValue = self.HweEnumProcess.get_p_value()
-      self.observedPValue = self.HweEnumProcess.get_pr_observed()
-      self.diffPvals =  self.HweEnumProcess.get_diff_statistic_pvalue()
-      self.chenPvals =  self.HweEnumProcess.get_chen_statistic_pvalue()
+      enumeration = _TableEnumeration(self.flattenedMatrix, self.k)
+      self.exactPValue = enumeration.pValue()
+      self.observedPValue = float(np.exp(enumeration.lnObserved))
+
+    n = sum(self.flattenedMatrix)
+    self.alleleArray = [0] * self.k
+    for i in range(self.k):
+      for j in range(i + 1):
+        self.alleleArray[i] += self.flattenedMatrix[(i * (i + 1) // 2) + j]
+        self.alleleArray[j] += self.flattenedMatrix[(i * (i + 1) // 2) + j]
+
+    # both statistics are summed in the same pass over the
+    # distribution of each genotype
+    self.diffPvals = []
+    self.chenPvals = []
+    for i in range(self.k):
+      for j in range(i + 1):
+        observed = self._genotypeStatistics(i, j,
+                                            self.flattenedMatrix[(i * (i + 1) // 2) + j],
+                                            self.flattenedMatrix[(i * (i + 1) // 2) + i],
+                                            self.flattenedMatrix[(j * (j + 1) // 2) + j])
+        if i != j:
+          distribution = _lumpedGenotypeDistribution(n, self.alleleArray[i], self.alleleArray[j])
+        else:
+          # only two alleles: 'i' and all the others lumped together
+          hets, lnProbs = _biallelicExactDistribution(n, min(self.alleleArray[i],
+                                                             2 * n - self.alleleArray[i]))
+          homs = (self.alleleArray[i] - hets) // 2
+          distribution = [(homs, homs, homs, lnProbs)]
+
+        diffPval, chenPval = 0.0, 0.0
+        for counts, homsI, homsJ, lnProbs in distribution:
+          probs = np.exp(lnProbs)
+          diffStats, chenStats = self._genotypeStatistics(i, j, counts, homsI, homsJ)
+          diffPval += float(np.where(_fcmp(diffStats, observed[0]) >= 0, probs, 0.0).sum())
+          chenPval += float(np.where(_fcmp(chenStats, observed[1]) >= 0, probs, 0.0).sum())
+        self.diffPvals.append(diffPval)
+        self.chenPvals.append(chenPval)
+
+  def _genotypeStatistics(self, i, j, counts, homsI, homsJ):
+    """The 'diff' and 'chen' statistics for genotype i/j.
+
+    'counts' are the i/j genotype counts, and 'homsI' and 'homsJ' the
+    matching i/i and j/j counts, as arrays or plain numbers.  Chen's
+    statistic is from '_chenStatistics()', on the table of alleles
+    'i' and 'j' only, as the other alleles don't enter into it.
+
+    *For internal use only.*"""
+    n = sum(self.flattenedMatrix)
+    totalGametes = 2.0 * n
+    p = [self.alleleArray[i] / totalGametes, self.alleleArray[j] / totalGametes]
+    counts, homsI, homsJ = np.broadcast_arrays(counts, homsI, homsJ)
+    if i != j:
+      expected = 2 * p[0] * p[1] * totalGametes / 2
+      tables = np.zeros(counts.shape + (2, 2))
+      tables[..., 0, 0], tables[..., 0, 1], tables[..., 1, 1] = homsI, counts, homsJ
+      chens = _chenStatistics(p, tables, totalGametes)[..., 0, 1]
     else:
-      self.diffPvals =  self.HweEnumProcess.get_diff_statistic_pvalue_ext()
-      self.chenPvals =  self.HweEnumProcess.get_chen_statistic_pvalue_ext()
+      expected = p[0] * p[0] * totalGametes / 2
+      chens = _chenStatistics(p[:1], counts[..., None, None], totalGametes)[..., 0, 0]
+    return np.abs(counts - expected), chens
       
-    
   def serializeTo(self, stream, allelelump=0):
     stream.opentag('hardyweinbergEnumeration',
                    allelelump=("%d" % allelelump))
@@ -969,22 +1532,188 @@ class HardyWeinbergEnumeration(HardyWeinbergGuoThompson):
       for j in range(0, i+1):
 
         if self.debug:
-          print("genotype count: %4d" % self.flattenedMatrix[(i*(i+1)/2)+j],
-                "diff pval: %.4f" % self.diffPvals[(i*(i+1)/2)+j],
-                "chen pval: %.4f" % self.chenPvals[(i*(i+1)/2)+j])
+          print("genotype count: %4d" % self.flattenedMatrix[(i*(i+1)//2)+j],
+                "diff pval: %.4f" % self.diffPvals[(i*(i+1)//2)+j],
+                "chen pval: %.4f" % self.chenPvals[(i*(i+1)//2)+j])
 
-        stream.tagContents ("pvalue", "%f" % self.diffPvals[(i*(i+1)/2)+j],
+        stream.tagContents ("pvalue", "%f" % self.diffPvals[(i*(i+1)//2)+j],
                             type='genotype', statistic='diff_statistic',
                             row=("%d" % i), col=("%d" % j), method=method)
 
-        stream.tagContents ("pvalue", "%f" % self.chenPvals[(i*(i+1)/2)+j],
+        stream.tagContents ("pvalue", "%f" % self.chenPvals[(i*(i+1)//2)+j],
                             type='genotype', statistic='chen_statistic',
                             row=("%d" % i), col=("%d" % j), method=method)
 
         stream.writeln()
     stream.closetag('hardyweinbergEnumeration')
-    self.HweEnumProcess.cleanup()
-    
+
+  def dumpTable(self, locusName, stream, allelelump=0):
+    """Output the exact p-values as per 'HardyWeinbergGuoThompson'.
+
+    Produces a '<hardyweinbergGuoThompson>' element for each of the
+    tests enabled by 'runMCMCTest' and 'runPlainMCTest', marked with
+    'method="exact"' as the p-values are no longer estimates.
+    """
+    for runTest, attrs in [(self.runMCMCTest, {}),
+                           (self.runPlainMCTest, {'type': 'monte-carlo'})]:
+      if not runTest:
+        continue
+
+      stream.opentag('hardyweinbergGuoThompson', **attrs,
+                     allelelump=("%d" % allelelump), method='exact')
+      self.serializeXMLTableTo(stream)
+      self._serializePlanTo(stream)
+
+      if self.doOverall:
+        stream.tagContents("pvalue", "%g" % self.exactPValue, type="overall")
+      else:
+        stream.emptytag("pvalue", type="overall", role="not-calculated")
+      if not attrs:
+        stream.tagContents("stderr", "%g" % 0.0)
+      stream.writeln()
+
+      for statistic, pvals in [('chen_statistic', self.chenPvals),
+                               ('diff_statistic', self.diffPvals)]:
+        for i in range(self.k):
+          for j in range(i + 1):
+            stream.tagContents("pvalue", "%g" % pvals[(i*(i+1)//2)+j],
+                               type='genotype', statistic=statistic,
+                               row=("%d" % i), col=("%d" % j))
+            stream.writeln()
+
+      stream.closetag('hardyweinbergGuoThompson')
+      stream.writeln()
+
+class HardyWeinbergBiallelic(HardyWeinbergEnumeration):
+  """Exact Hardy-Weinberg test for loci with two alleles.
+
+  With only two alleles, the genotype table is determined by the
+  number of heterozygotes, so the exact test can be calculated
+  directly from the distribution of heterozygote counts, rather than
+  estimated by 'gthwe' or enumerated in full.
+
+  Accepts the same keywords as 'HardyWeinbergGuoThompson', and
+  'dumpTable()' produces the same '<hardyweinbergGuoThompson>' elements
+  (for each of the tests enabled by 'runMCMCTest' and 'runPlainMCTest')
+  and 'serializeTo()' the same '<hardyweinbergEnumeration>' element as
+  'HardyWeinbergEnumeration'.  The '<hardyweinbergGuoThompson>'
+  elements are marked with 'method="exact"', as they are no longer
+  estimates.  The overall p-value is always calculated, so
+  'doOverall' is ignored.
+  """
+  def __init__(self,
+               locusData=None,
+               alleleCount=None,
+               doOverall=1,
+               **kw):
+
+    HardyWeinbergEnumeration.__init__(self,
+                                      locusData=locusData,
+                                      alleleCount=alleleCount,
+                                      doOverall=1,
+                                      **kw)
+
+  def _calcExact(self):
+    """Calculate the exact overall and individual genotype p-values.
+
+    *For internal use only.*"""
+    if self.k != 2:
+      sys.exit("HardyWeinbergBiallelic: requires exactly 2 alleles, found %d" % self.k)
+
+    # flattened matrix is in the order: 0/0, 1/0, 1/1
+    homs0, hets, homs1 = self.flattenedMatrix
+    n = homs0 + hets + homs1
+    alleleArray = [2 * homs0 + hets, 2 * homs1 + hets]
+    rare = int(alleleArray[1] < alleleArray[0])
+
+    allHets, lnProbs = _biallelicExactDistribution(n, alleleArray[rare])
+    probs = np.exp(lnProbs)
+    lnObserved = lnProbs[(hets - allHets[0]) // 2]
+
+    # tables are at least as extreme if they are no more probable
+    # than the observed one
+    self.exactPValue = float(probs[_fcmp(lnProbs, lnObserved) <= 0].sum())
+    self.observedPValue = float(np.exp(lnObserved))
+
+    # the genotype tables for every possible heterozygote count, as
+    # per flattened matrix
+    homsRare = (alleleArray[rare] - allHets) // 2
+    homsCommon = n - allHets - homsRare
+    if rare == 0:
+      tables = [homsRare, allHets, homsCommon]
+    else:
+      tables = [homsCommon, allHets, homsRare]
+
+    # individual genotype p-values use the same 'diff' and 'chen'
+    # statistics as 'gthwe' (and 'HardyWeinbergEnumeration'), but
+    # summed over the exact distribution
+    self.alleleArray = alleleArray
+    observed = (hets - allHets[0]) // 2
+    self.diffPvals = []
+    self.chenPvals = []
+    for i in range(2):
+      for j in range(i + 1):
+        diffStats, chenStats = self._genotypeStatistics(i, j,
+                                                        tables[(i * (i + 1) // 2) + j],
+                                                        tables[(i * (i + 1) // 2) + i],
+                                                        tables[(j * (j + 1) // 2) + j])
+        for stats, pvals in [(diffStats, self.diffPvals), (chenStats, self.chenPvals)]:
+          extreme = _fcmp(stats, stats[observed]) >= 0
+          pvals.append(float(probs[extreme].sum()))
+
+def makeGuoThompsonTest(genotypeCounts,
+                        runMCMCTest=0,
+                        runPlainMCTest=0,
+                        dememorizationSteps=2000,
+                        samplingNum=1000,
+                        samplingSize=1000,
+                        maxMatrixSize=250,
+                        monteCarloSteps=1000000,
+                        timeBudget=None,
+                        timings=None,
+                        **kw):
+  """Create the Guo & Thompson test object for a locus.
+
+  Loci with two alleles are tested by 'HardyWeinbergBiallelic', others
+  by 'HardyWeinbergGuoThompson'.  If 'timeBudget' is given, only the
+  one test chosen by 'planExactTest()' is run: full enumeration (by
+  'HardyWeinbergEnumeration'), MCMC or plain Monte Carlo, with the
+  planner's 'timings' if given.  Other keywords are as per
+  'HardyWeinbergGuoThompson'.
+  """
+  plan = None
+  if timeBudget is not None and genotypeCounts.k >= 2:
+    plan = planExactTest(genotypeCounts, timeBudget,
+                         dememorizationSteps=dememorizationSteps,
+                         samplingNum=samplingNum,
+                         samplingSize=samplingSize,
+                         maxMatrixSize=maxMatrixSize,
+                         monteCarloSteps=monteCarloSteps,
+                         timings=timings)
+    runMCMCTest = int(plan['engine'] != 'monte-carlo')
+    runPlainMCTest = int(plan['engine'] == 'monte-carlo')
+    samplingNum = plan['samplingNum']
+    monteCarloSteps = plan['monteCarloSteps']
+
+  if genotypeCounts.k == 2:
+    hwClass = HardyWeinbergBiallelic
+  elif plan and plan['engine'] == 'enumeration':
+    hwClass = HardyWeinbergEnumeration
+    kw['doOverall'] = 1
+  else:
+    hwClass = HardyWeinbergGuoThompson
+
+  return hwClass(genotypeCounts=genotypeCounts,
+                 runMCMCTest=runMCMCTest,
+                 runPlainMCTest=runPlainMCTest,
+                 dememorizationSteps=dememorizationSteps,
+                 samplingNum=samplingNum,
+                 samplingSize=samplingSize,
+                 maxMatrixSize=maxMatrixSize,
+                 monteCarloSteps=monteCarloSteps,
+                 plan=plan,
+                 **kw)
+
 class HardyWeinbergGuoThompsonArlequin:
   """Wrapper class for 'Arlequin'.
 
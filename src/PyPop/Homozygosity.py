@@ -37,7 +37,10 @@
 
 """
 
-import string, sys, os, math
+import string, sys, os, re, math, tempfile, hashlib, json
+import numpy as np
+from collections import OrderedDict, namedtuple
+from concurrent.futures import ThreadPoolExecutor
 from operator import add
 from functools import reduce
 from PyPop.Utils import getStreamType
@@ -53,6 +56,167 @@ def getObservedHomozygosityFromAlleleData(alleleData):
   return sum
   
 
+# name of the compiled index of the simulated tables, which is kept
+# in the same directory as the tables themselves
+HOMOZYGOSITY_INDEX = 'homozygosity-index.npy'
+
+# simulated tables exist for 2n in steps of 10, up to 2000, and for
+# up to 100 alleles
+_TWO_EN_STEP = 10
+_MAX_TWO_EN = 2000
+_MAX_ALLELES = 100
+
+# fields of each record in the index, an index saved with any other
+# fields is from an older version and is recompiled
+_INDEX_FIELDS = ('count', 'expected', 'variance', 'numQuantiles', 'quantile', 'mtime', 'size')
+
+def _readHomozygosityFile(path):
+  """Read one simulated homozygosity table.
+
+  Returns a tuple of the number of replicates, the expected
+  homozygosity, its variance and the list of '(homozygosity, pvalue)'
+  quantiles (only read if there are enough replicates to use them).
+
+  *Internal use only*"""
+  lines = open(path, 'r').readlines()
+
+  count = int(lines[0].split(':')[1])
+  expectedHomozygosity = float(lines[1].split(':')[1])
+  varExpectedHomozygosity = float(lines[2].split(':')[1])
+
+  quantile = []
+  if count > 1999:
+    # read until we've reached the end of lines or a blank line
+    for i in range(4, len(lines)):
+      # stop reading quantiles if blank encountered
+      if lines[i] == os.linesep:
+        break
+      obsvHomo, pValue = [float(val) for val in lines[i].split()]
+      quantile.append((obsvHomo, pValue))
+
+  return count, expectedHomozygosity, varExpectedHomozygosity, quantile
+
+def _scanHomozygosityTables(rootPath):
+  """Find the simulated tables under 'rootPath'.
+
+  Yields the '(2n/10, k)' index key, path and 'os.stat()' of each.
+
+  *Internal use only*"""
+  for dir in os.listdir(rootPath):
+    if not re.fullmatch(r'2n\d+', dir) or not os.path.isdir(os.path.join(rootPath, dir)):
+      continue
+    for file in os.listdir(os.path.join(rootPath, dir)):
+      match = re.fullmatch(r'(\d+)_(\d+)\.out', file)
+      if match == None:
+        continue
+      numAlleles, twoEn = int(match.group(1)), int(match.group(2))
+      if dir == "2n%s" % twoEn and twoEn % _TWO_EN_STEP == 0 \
+         and twoEn <= _MAX_TWO_EN and numAlleles <= _MAX_ALLELES:
+        path = os.path.join(rootPath, dir, file)
+        yield (twoEn // _TWO_EN_STEP, numAlleles), path, os.stat(path)
+
+def _buildHomozygosityIndex(rootPath):
+  """Read all the simulated tables under 'rootPath' into one array.
+
+  See 'compileHomozygosityIndex()' for the layout.
+
+  *Internal use only*"""
+  tables = {}
+  for key, path, stat in _scanHomozygosityTables(rootPath):
+    tables[key] = _readHomozygosityFile(path) + (stat.st_mtime_ns, stat.st_size)
+
+  maxQuantiles = max([len(table[3]) for table in tables.values()] + [1])
+  index = np.zeros((_MAX_TWO_EN // _TWO_EN_STEP + 1, _MAX_ALLELES + 1),
+                   dtype=[('count', np.int64),
+                          ('expected', np.float64),
+                          ('variance', np.float64),
+                          ('numQuantiles', np.int64),
+                          ('quantile', np.float64, (maxQuantiles, 2)),
+                          ('mtime', np.int64),
+                          ('size', np.int64)])
+  for key, (count, expected, variance, quantile, mtime, size) in tables.items():
+    index[key] = (count, expected, variance, len(quantile),
+                  quantile + [(0.0, 0.0)] * (maxQuantiles - len(quantile)),
+                  mtime, size)
+  return index
+
+def compileHomozygosityIndex(rootPath, indexPath=None):
+  """Compile all the simulated homozygosity tables into one index.
+
+  Reads every '2n<2n>/<k>_<2n>.out' table under 'rootPath' and saves
+  them as a single NumPy structured array (to 'indexPath', by default
+  'HOMOZYGOSITY_INDEX' in 'rootPath') of one record per (2n/10, k),
+  so that looking up a table is a single array read.  Each record
+  holds the number of replicates in 'count' (0 if there is no
+  table), the 'expected' homozygosity and its 'variance', and the
+  quantiles ('numQuantiles' of them, padded to the longest table),
+  plus the 'mtime' (in nanoseconds) and 'size' of the table file, so
+  that tables changed since can be detected.
+
+  Returns the array."""
+  if indexPath == None:
+    indexPath = os.path.join(rootPath, HOMOZYGOSITY_INDEX)
+  # write to a temporary file first, so the index is never seen half
+  # written by another process; created before reading the tables, so
+  # that an unwritable 'indexPath' fails without reading them all
+  fd, tmpPath = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(indexPath)))
+  try:
+    with os.fdopen(fd, 'wb') as f:
+      index = _buildHomozygosityIndex(rootPath)
+      np.save(f, index)
+    os.replace(tmpPath, indexPath)
+  except BaseException:
+    os.remove(tmpPath)
+    raise
+  return index
+
+# compiled indexes already opened, by root path
+_homozygosityIndexes = {}
+
+def getHomozygosityIndex(rootPath):
+  """Get the compiled index of the simulated tables under 'rootPath'.
+
+  The index is memory-mapped, and shared by every 'Homozygosity'
+  object using the same 'rootPath'.  It is compiled on first use if
+  'rootPath' doesn't have one yet, and recompiled if it is from an
+  older version or the tables have been changed, added or removed
+  since (checked once, when it is first opened).  Returns 'None' if
+  it can't be saved there (e.g. a read-only install), in which case
+  each table is read from its own file."""
+  rootPath = os.path.abspath(rootPath)
+  if rootPath not in _homozygosityIndexes:
+    indexPath = os.path.join(rootPath, HOMOZYGOSITY_INDEX)
+    index = None
+    if os.path.exists(indexPath):
+      try:
+        index = np.load(indexPath, mmap_mode='r')
+      except (OSError, ValueError):
+        pass
+      if index is not None and not _isCurrentIndex(rootPath, index):
+        index = None
+    if index is None:
+      try:
+        compileHomozygosityIndex(rootPath, indexPath)
+        index = np.load(indexPath, mmap_mode='r')
+      except OSError:
+        pass
+    _homozygosityIndexes[rootPath] = index
+  return _homozygosityIndexes[rootPath]
+
+def _isCurrentIndex(rootPath, index):
+  """Whether 'index' is of this version, and of the tables currently
+  under 'rootPath'.
+
+  *Internal use only*"""
+  if index.dtype.names != _INDEX_FIELDS or index.shape != \
+     (_MAX_TWO_EN // _TWO_EN_STEP + 1, _MAX_ALLELES + 1):
+    return False
+  mtime = np.zeros(index.shape, dtype=np.int64)
+  size = np.zeros(index.shape, dtype=np.int64)
+  for key, path, stat in _scanHomozygosityTables(rootPath):
+    mtime[key], size[key] = stat.st_mtime_ns, stat.st_size
+  return bool((index['mtime'] == mtime).all() and (index['size'] == size).all())
+
 class Homozygosity:
   """Calculate homozygosity statistics.
   
@@ -86,23 +250,31 @@ class Homozygosity:
 
     self.expectedStatsFlag = self._parseFile()
 
-  def _genPathName(self, sampleCount, numAlleles):
-    """Generate path name for homozygosity file.
+  def _roundSampleCount(self, sampleCount):
+    """Round 2n to the nearest simulated sample count.
 
     If 2n > 2000, use 2000 anyway.
 
     *Internal use only*"""
-    
-    decade, rem = divmod(sampleCount, 10)
+
+    decade, rem = divmod(sampleCount, _TWO_EN_STEP)
     if rem >= 5:
       decade = decade + 1
 
-    twoEn = decade*10
+    twoEn = decade*_TWO_EN_STEP
 
     # hack because we only have simulated data for 2n <= 2000
-    if twoEn > 2000:
-      twoEn = 2000
+    if twoEn > _MAX_TWO_EN:
+      twoEn = _MAX_TWO_EN
 
+    return twoEn
+
+  def _genPathName(self, sampleCount, numAlleles):
+    """Generate path name for homozygosity file.
+
+    *Internal use only*"""
+
+    twoEn = self._roundSampleCount(sampleCount)
     dir = "2n%s" % twoEn
     file = "%s_%s.out" % (numAlleles, twoEn)
     path = os.path.join(dir, file)
@@ -139,7 +311,8 @@ class Homozygosity:
 
     Checks range and existence (well it will eventually) of
     homozygosity data file for given allele count and total allele
-    count.
+    count.  The data is looked up in the compiled index of all the
+    files (see 'getHomozygosityIndex()').
 
     Returns a boolean.
 
@@ -148,26 +321,29 @@ class Homozygosity:
     if self._checkCountRange(self.sampleCount):
       if self._checkAlleleRange(self.numAlleles):
 
-        # generate relative path name
-        path = self._genPathName(self.sampleCount, self.numAlleles)
-
-        # open file with full path name created in-line
-        lines = open(self.rootPath + os.sep + path, 'r').readlines()
-        
-        self.count = int(lines[0].split(':')[1])
-        self.expectedHomozygosity = float(lines[1].split(':')[1])
-        self.varExpectedHomozygosity = float(lines[2].split(':')[1])
+        # look up the table in the compiled index, tables not in the
+        # index are read from their own file
+        index = getHomozygosityIndex(self.rootPath)
+        record = None
+        if index is not None:
+          record = index[self._roundSampleCount(self.sampleCount) // _TWO_EN_STEP,
+                         self.numAlleles]
+          if record['count'] == 0:
+            record = None
+
+        if record is not None:
+          self.count = int(record['count'])
+          self.expectedHomozygosity = float(record['expected'])
+          self.varExpectedHomozygosity = float(record['variance'])
+          self.quantile = [(float(obsvHomo), float(pValue)) for obsvHomo, pValue \
+                           in record['quantile'][:record['numQuantiles']]]
+        else:
+          # generate relative path name
+          path = self._genPathName(self.sampleCount, self.numAlleles)
+          self.count, self.expectedHomozygosity, self.varExpectedHomozygosity, \
+                      self.quantile = _readHomozygosityFile(self.rootPath + os.sep + path)
 
         if self.count > 1999:
-          self.quantile = []
-          # read until we've reached the end of lines or a blank line
-          for i in range(4, len(lines)):
-            # stop reading quantiles if blank encountered
-            if lines[i] == os.linesep:
-              break
-            obsvHomo, pValue = [float(val) for val in lines[i].split()]
-            self.quantile.append((obsvHomo, pValue))
-
           if self.debug:
             print(self.count, self.expectedHomozygosity, self.varExpectedHomozygosity)
             print(self.sampleCount, self.numAlleles)
@@ -311,16 +487,320 @@ class Homozygosity:
     # always end on a newline
     stream.writeln()
 
+# the Slatkin Monte Carlo ('_EWSlatkinExact') always starts from the
+# same seed, so its results only depend on the allele counts and the
+# number of replicates
+EW_SLATKIN_SEED_POLICY = 'fixed:13840399'
+
+# 'runEwensMonteCarlo' seeds the NumPy generator with this by default,
+# its results are different from (but distributed as) the C code's
+EW_NUMPY_SEED = 13840399
+
+class EWSlatkinCache:
+  """Cache of Ewens-Watterson-Slatkin exact test results.
+
+  The results depend only on the sorted allele counts, the number of
+  replicates and how the random number generator is seeded, so a
+  configuration that recurs (across loci, populations or runs) needn't
+  repeat the Monte Carlo.  The 'maxSize' most recently used results
+  are kept in memory and, if 'cacheDir' is given, every result is also
+  stored there as a small JSON file named by the hash of its key, so
+  is shared between runs and processes.
+  """
+
+  def __init__(self, maxSize=4096, cacheDir=None):
+    self.maxSize = maxSize
+    self.cacheDir = cacheDir
+    self.results = OrderedDict()
+
+  def makeKey(self, alleleData, numReplicates, seedPolicy=EW_SLATKIN_SEED_POLICY,
+              tolerance=None, maxReplicates=None):
+    """Key for the results of a test, as a hex digest.
+
+    The allele counts in 'alleleData' may be in any order.  For an
+    adaptive test, 'numReplicates' is the batch size and 'tolerance'
+    and 'maxReplicates' say when to stop."""
+    counts = sorted([int(count) for count in alleleData], reverse=True)
+    key = json.dumps([seedPolicy, int(numReplicates), tolerance, maxReplicates, counts])
+    return hashlib.sha256(key.encode('utf-8')).hexdigest()
+
+  def get(self, key):
+    """Get the results for 'key', or 'None' if there are none yet."""
+    if key in self.results:
+      self.results.move_to_end(key)
+      return self.results[key]
+    if self.cacheDir != None:
+      try:
+        with open(os.path.join(self.cacheDir, key + '.json')) as f:
+          results = tuple(json.load(f))
+      except (OSError, ValueError):
+        return None
+      self._remember(key, results)
+      return results
+    return None
+
+  def put(self, key, results):
+    """Store the tuple of 'results' for 'key'."""
+    results = tuple([float(result) for result in results])
+    self._remember(key, results)
+    if self.cacheDir != None:
+      os.makedirs(self.cacheDir, exist_ok=True)
+      fd, tmpPath = tempfile.mkstemp(dir=self.cacheDir)
+      try:
+        with os.fdopen(fd, 'w') as f:
+          json.dump(results, f)
+        os.replace(tmpPath, os.path.join(self.cacheDir, key + '.json'))
+      except OSError:
+        # the cache is only an optimisation, so carry on without it
+        os.remove(tmpPath)
+
+  def _remember(self, key, results):
+    """Add to the in-memory cache, dropping the least recently used.
+
+    *Internal use only*"""
+    self.results[key] = results
+    self.results.move_to_end(key)
+    while len(self.results) > self.maxSize:
+      self.results.popitem(last=False)
+
+# caches already in use, by directory ('None' for in-memory only)
+_ewSlatkinCaches = {}
+
+def getEWSlatkinCache(cacheDir=None):
+  """Get the shared 'EWSlatkinCache' for 'cacheDir'."""
+  if cacheDir != None:
+    cacheDir = os.path.abspath(cacheDir)
+  if cacheDir not in _ewSlatkinCaches:
+    _ewSlatkinCaches[cacheDir] = EWSlatkinCache(cacheDir=cacheDir)
+  return _ewSlatkinCaches[cacheDir]
+
+def _runEWSlatkinBlock(args):
+  """Run one block of the Slatkin replicates.
+
+  Called from a worker thread, the results are read back in the same
+  thread, since the C module keeps them per-thread.
+
+  *Internal use only*"""
+  from PyPop import _EWSlatkinExact
+  li, numAlleles, sampleCount, firstRep, numReps = args
+  _EWSlatkinExact.main_proc_range(li, numAlleles, sampleCount, firstRep, numReps)
+  return EWSlatkinResults(_EWSlatkinExact.get_theta(),
+                          _EWSlatkinExact.get_prob_ewens(),
+                          _EWSlatkinExact.get_prob_homozygosity(),
+                          _EWSlatkinExact.get_mean_homozygosity(),
+                          _EWSlatkinExact.get_var_homozygosity(),
+                          numReps)
+
+
+# results of the Ewens-Watterson-Slatkin Monte Carlo: the estimate of
+# theta, the p-values of the exact (Ewens) and homozygosity tests, the
+# mean and variance of the simulated homozygosity, and the number of
+# replicates they are from
+EWSlatkinResults = namedtuple('EWSlatkinResults',
+                              ['theta', 'probEwens', 'probHomozygosity', 'mean', 'var',
+                               'numReplicates'])
+
+def mergeEWSlatkinResults(blockResults):
+  """Merge 'EWSlatkinResults' from separate blocks of replicates.
+
+  The tail counts are added, and the mean and variance pooled, so if
+  the blocks are consecutive stretches of the same random number
+  sequence, the results are those of running them all at once (the
+  mean and variance up to rounding)."""
+  theta, probEwens, probHomozygosity, means, variances, reps = \
+         [np.array(column, dtype=float) for column in zip(*blockResults)]
+  numReplicates = reps.sum()
+
+  # the proportions are exact multiples of the block size, so round
+  # to undo any error in the division
+  ewensCount = np.rint(probEwens * reps).sum()
+  homozygosityCount = np.rint(probHomozygosity * reps).sum()
+  mean = (reps * means).sum() / numReplicates
+  var = (reps * (variances + (means - mean) ** 2)).sum() / numReplicates
+
+  return EWSlatkinResults(float(theta[0]),
+                          float(ewensCount / numReplicates),
+                          float(homozygosityCount / numReplicates),
+                          float(mean), float(var), int(numReplicates))
+
+def _ewensTheta(k, n):
+  """Estimate theta = 4N*mu from 'k' alleles in a sample of 'n'.
+
+  Bisection on formula 9.26 in Ewens' book, exactly as 'theta_est' in
+  the C code.
+
+  *Internal use only*"""
+  def kval(x):
+    with np.errstate(divide='ignore', invalid='ignore'):
+      return (x / (np.arange(n) + x)).sum()
+  xmid = 0.0
+  xlow = 0.1
+  while kval(xlow) > k:
+    xlow /= 10.0
+  xhigh = 10.0
+  while kval(xhigh) < k:
+    xhigh *= 10.0
+  while (xhigh - xlow) > 0.00001:
+    xmid = (xhigh + xlow) / 2.0
+    if kval(xmid) > k:
+      xhigh = xmid
+    else:
+      xlow = xmid
+  return xmid
+
+def _stewartTable(k, n):
+  """Table 'b' used by Stewart's algorithm to sample configurations.
+
+  Fills 'b[i][j]' for 'i' alleles and 'j' genes as the C code does,
+  solving its recurrence 'b[i][j+1] = (i*b[i-1][j] + j*b[i][j])/(j+1)'
+  with a cumulative sum, since 'j*b[i][j]' grows by 'i*b[i-1][j]'.
+
+  *Internal use only*"""
+  b = np.zeros((k + 1, n + 1))
+  b[1, 1:] = 1.0 / np.arange(1, n + 1)
+  for i in range(2, k + 1):
+    partial = np.concatenate(([0.0], np.cumsum(b[i - 1, i:n])))
+    b[i, i:] = i * (1.0 + partial) / np.arange(i, n + 1)
+  return b
+
+# most (replicates x counts) searched at once by '_sampleEwens', which
+# bounds its memory use whatever the sample size
+_EWENS_CHUNK = 1 << 20
+
+def _sampleEwens(b, k, n, uniforms):
+  """Sample one Ewens configuration for each row of 'uniforms'.
+
+  Vectorized version of 'generate' in the C code: the allele counts
+  are drawn one allele at a time, each from its distribution given
+  the genes still left, by inverting the distribution with the
+  corresponding column of 'uniforms' (which has 'k - 1' columns).
+  Returns a (replicates, 'k') array of allele counts.
+
+  As in the C code, each distribution is summed from a count of one
+  upwards only until it reaches the uniform, here a chunk of counts
+  at a time (doubling in size) for all the replicates still
+  searching, so the work is proportional to the counts drawn rather
+  than to the square of the sample size.
+
+  *Internal use only*"""
+  numReps = len(uniforms)
+  counts = np.empty((numReps, k), dtype=np.int64)
+  nleft = np.full(numReps, n, dtype=np.int64)
+  # rows of 'b' reversed and padded with zeros, so that 'b[i][j - c]'
+  # is 'bReversed[i][n - j + c]', which is zero past a count 'c' of 'j'
+  bReversed = np.zeros((k + 1, 2 * n + 1))
+  bReversed[:, :n + 1] = b[:, ::-1]
+  for l in range(1, k):
+    m = k - l + 1
+    active = np.arange(numReps)
+    cum = np.zeros(numReps)
+    start, width = 1, 16
+    while len(active):
+      sizes = np.arange(start, min(start + width, n + 1))
+      left = nleft[active]
+
+      # add to the running sum in the same order as the C code
+      cdf = np.empty((len(active), len(sizes) + 1))
+      cdf[:, 0] = cum[active]
+      np.divide(bReversed[m - 1][(n - left)[:, None] + sizes],
+                sizes * b[m][left][:, None], out=cdf[:, 1:])
+      np.cumsum(cdf, axis=1, out=cdf)
+      cdf = cdf[:, 1:]
+
+      # stop at the uniform, or the largest count possible
+      stop = (cdf >= uniforms[active, l - 1][:, None]) | (sizes >= (left - m + 1)[:, None])
+      done = stop.any(axis=1)
+      counts[active[done], l - 1] = sizes[stop[done].argmax(axis=1)]
+      cum[active[~done]] = cdf[~done, -1]
+      active = active[~done]
+      # double the chunk, within the memory bound
+      start += width
+      width = max(16, min(2 * width, _EWENS_CHUNK // max(len(active), 1)))
+    nleft -= counts[:, l - 1]
+  counts[:, k - 1] = nleft
+  return counts
+
+def runEwensMonteCarlo(alleleData, numReplicates=10000, seed=EW_NUMPY_SEED, batchSize=10000,
+                       firstReplicate=0):
+  """Ewens-Watterson-Slatkin exact test, in NumPy.
+
+  An alternative to the '_EWSlatkinExact' C module, using the same
+  algorithm and test statistics, but simulating 'batchSize'
+  configurations at a time with a NumPy generator seeded with
+  'seed'.  It keeps no state between calls, so is safe to call from
+  several threads at once.  Returns an 'EWSlatkinResults'.
+
+  As 'main_proc_range' in the C code, 'firstReplicate' skips the
+  generator ahead, so that runs can be split into blocks and merged
+  with 'mergeEWSlatkinResults'."""
+  observed = np.array([int(count) for count in alleleData], dtype=np.int64)
+  k, n = len(observed), int(observed.sum())
+  b = _stewartTable(k, n)
+  rng = np.random.Generator(np.random.PCG64(seed))
+  rng.bit_generator.advance(firstReplicate * (k - 1))
+
+  # as the C code, the homozygosity test counts configurations that
+  # are no more homozygous than observed, and the exact test those
+  # that are no more probable, i.e. with product of counts as large
+  homozygosityObs = (observed ** 2).sum() / float(n * n)
+  logProductObs = np.log(observed).sum()
+  ewensCount = homozygosityCount = 0
+  total = totalSquares = 0.0
+  for start in range(0, numReplicates, batchSize):
+    numBatch = min(batchSize, numReplicates - start)
+    counts = _sampleEwens(b, k, n, rng.random((numBatch, k - 1)))
+    homozygosity = (counts ** 2).sum(axis=1) / float(n * n)
+    ewensCount += int((np.log(counts).sum(axis=1) >= logProductObs - 1e-9).sum())
+    homozygosityCount += int((homozygosity <= homozygosityObs).sum())
+    total += homozygosity.sum()
+    totalSquares += (homozygosity ** 2).sum()
+
+  return EWSlatkinResults(theta=_ewensTheta(k, n),
+                          probEwens=ewensCount / numReplicates,
+                          probHomozygosity=homozygosityCount / numReplicates,
+                          mean=total / numReplicates,
+                          var=(totalSquares - total * total / numReplicates) / numReplicates,
+                          numReplicates=numReplicates)
+
+
 class HomozygosityEWSlatkinExact(Homozygosity):
 
+    """Slatkin's implementation of the Ewens-Watterson exact test.
+
+    Results are looked up in 'cache' (an 'EWSlatkinCache', by default
+    the shared in-memory one) before running the Monte Carlo.  The
+    replicates are split between 'numThreads' threads, which give the
+    same results as a single thread (see '_runReplicates').
+
+    'engine' is either 'slatkin', the original C code, or 'numpy' for
+    'runEwensMonteCarlo' ('numThreads' only applies to the C code).
+
+    If 'tolerance' is set, batches of 'numReplicates' are run until
+    the standard errors of both p-values are at most 'tolerance', or
+    'maxReplicates' have been run (see '_runAdaptive')."""
+
     def __init__(self,
                  alleleData=None,
                  numReplicates=10000,
+                 cache=None,
+                 numThreads=1,
+                 engine='slatkin',
+                 tolerance=None,
+                 maxReplicates=100000,
                  debug=0):
 
       self.alleleData = alleleData
       
       self.numReplicates = numReplicates
+      self.numThreads = numThreads
+      self.tolerance = tolerance
+      self.maxReplicates = maxReplicates
+      if engine not in ['slatkin', 'numpy']:
+        sys.exit("Unknown Ewens-Watterson-Slatkin engine: %s, must be 'slatkin' or 'numpy'" % engine)
+      self.engine = engine
+      if cache == None:
+        cache = getEWSlatkinCache()
+      self.cache = cache
       self.debug = debug
 
     def doCalcs(self,alleleData):
@@ -334,32 +814,89 @@ class HomozygosityEWSlatkinExact(Homozygosity):
       
       if self.sampleCount > 0:
 
-        from PyPop import _EWSlatkinExact
-        
-        self.EW = _EWSlatkinExact
-
-        # create the correct array that module expect,
-        # by pre- and appending zeroes to the list
-        if self.debug:
-          print(list(self.alleleData))
-          print(type(self.alleleData))
-          
-        li = [0] + list(self.alleleData) + [0] 
-
-        if self.debug:
-          print('args to slatkin exact test:' , li, self.numAlleles, self.sampleCount, self.numReplicates)
-
-        self.EW.main_proc(li, self.numAlleles, \
-                          self.sampleCount, self.numReplicates)
+        if self.engine == 'numpy':
+          seedPolicy = 'numpy:%d' % EW_NUMPY_SEED
+        else:
+          seedPolicy = EW_SLATKIN_SEED_POLICY
+        if self.tolerance:
+          key = self.cache.makeKey(self.alleleData, self.numReplicates, seedPolicy,
+                                   self.tolerance, self.maxReplicates)
+        else:
+          key = self.cache.makeKey(self.alleleData, self.numReplicates, seedPolicy)
+        results = self.cache.get(key)
 
-        self.theta = self.EW.get_theta()
-        self.prob_ewens = self.EW.get_prob_ewens()
-        self.prob_homozygosity = self.EW.get_prob_homozygosity()
-        self.mean_homozygosity = self.EW.get_mean_homozygosity()
+        if results == None:
+          if self.debug:
+            print('args to slatkin exact test:', list(self.alleleData), self.numAlleles,
+                  self.sampleCount, self.numReplicates, self.engine)
+
+          if self.tolerance:
+            results = self._runAdaptive()
+          else:
+            results = self._runReplicates(0, self.numReplicates)
+          self.cache.put(key, results)
+
+        self.theta, self.prob_ewens, self.prob_homozygosity, \
+                    self.mean_homozygosity, self.var_homozygosity, \
+                    self.replicatesUsed = results
+        self.replicatesUsed = int(self.replicatesUsed)
         self.obsv_homozygosity = self.getObservedHomozygosity()
-        self.var_homozygosity = self.EW.get_var_homozygosity()
 
 
+    def _runReplicates(self, firstRep, numReps):
+      """Run replicates 'firstRep' to 'firstRep + numReps - 1'.
+
+      With the C code, these are split into 'numThreads' blocks, run in
+      a thread pool.  Each block is a consecutive stretch of the single
+      random number sequence used by 'main_proc' (the C code skips the
+      generator ahead to the block's first replicate), so the blocks
+      are independent and together give the same results as one run.
+
+      *Internal use only*"""
+      if self.engine == 'numpy':
+        return runEwensMonteCarlo(self.alleleData, numReps, firstReplicate=firstRep)
+
+      # create the correct array that module expect,
+      # by pre- and appending zeroes to the list
+      li = [0] + list(self.alleleData) + [0]
+
+      blocks = [numReps // self.numThreads + (i < numReps % self.numThreads) \
+                for i in range(self.numThreads)]
+      blocks = [block for block in blocks if block > 0]
+      firstReps = firstRep + np.cumsum([0] + blocks[:-1])
+      args = [(li, self.numAlleles, self.sampleCount, int(blockFirstRep), block) \
+              for blockFirstRep, block in zip(firstReps, blocks)]
+
+      if len(args) == 1:
+        return _runEWSlatkinBlock(args[0])
+      with ThreadPoolExecutor(max_workers=len(args)) as executor:
+        return mergeEWSlatkinResults(list(executor.map(_runEWSlatkinBlock, args)))
+
+    def _runAdaptive(self):
+      """Run batches of replicates until the p-values are precise enough.
+
+      The batches continue the same random number sequence, so the
+      results are the same as a fixed run of the replicates used.  The
+      standard errors are estimated from '(count + 1)/(replicates + 2)'
+      rather than the p-value itself, so that a p-value of zero (or
+      one) doesn't stop the test after the first batch.
+
+      *Internal use only*"""
+      blockResults = []
+      used = 0
+      while True:
+        numReps = min(self.numReplicates, self.maxReplicates - used)
+        blockResults.append(self._runReplicates(used, numReps))
+        used += numReps
+        results = mergeEWSlatkinResults(blockResults)
+
+        stderrs = []
+        for pvalue in [results.probEwens, results.probHomozygosity]:
+          estimate = (pvalue * used + 1.0) / (used + 2.0)
+          stderrs.append(math.sqrt(estimate * (1.0 - estimate) / used))
+        if max(stderrs) <= self.tolerance or used >= self.maxReplicates:
+          return results
+
     def getHomozygosity(self):
 
       return self.theta, self.prob_ewens, self.prob_homozygosity, \
@@ -396,11 +933,11 @@ class HomozygosityEWSlatkinExact(Homozygosity):
         stream.writeln()
 
         # calculate normalized deviate of homozygosity (F_nd)
-        sqrtVar = math.sqrt(math.fabs(self.EW.get_var_homozygosity()))
+        sqrtVar = math.sqrt(math.fabs(self.var_homozygosity))
 
         try:
           normDevHomozygosity = (self.getObservedHomozygosity() - \
-                                self.EW.get_mean_homozygosity()) / sqrtVar
+                                self.mean_homozygosity) / sqrtVar
           normDevStr =  "%.4f" % normDevHomozygosity
         except:
           normDevStr = '****'
@@ -408,6 +945,10 @@ class HomozygosityEWSlatkinExact(Homozygosity):
           
         stream.writeln()
 
+        if self.tolerance:
+          stream.tagContents('replicates', "%d" % self.replicatesUsed)
+          stream.writeln()
+
         stream.closetag('homozygosityEWSlatkinExact')
 
       else:
@@ -434,8 +975,8 @@ class HomozygosityEWSlatkinExact(Homozygosity):
         self.alleleData = list(i)
         self.doCalcs(self.alleleData)
         # calculate normalized deviate of homozygosity (F_nd)
-        sqrtVar = math.sqrt(math.fabs(self.EW.get_var_homozygosity()))
-        normDevHomozygosity = (self.getObservedHomozygosity() - self.EW.get_mean_homozygosity()) / sqrtVar
+        sqrtVar = math.sqrt(math.fabs(self.var_homozygosity))
+        normDevHomozygosity = (self.getObservedHomozygosity() - self.mean_homozygosity) / sqrtVar
 
         #package the results
         resultsDict[(resultType, self.theta, self.prob_ewens, self.prob_homozygosity, self.mean_homozygosity, self.obsv_homozygosity, self.var_homozygosity, normDevHomozygosity)] = multiplier
@@ -449,10 +990,20 @@ class HomozygosityEWSlatkinExactPairwise:
                  matrix=None,
                  numReplicates=10000,
                  untypedAllele='****',
+                 cache=None,
+                 numThreads=1,
+                 engine='slatkin',
+                 tolerance=None,
+                 maxReplicates=100000,
                  debug=0):
 
       self.matrix = matrix
       self.numReplicates = numReplicates
+      self.cache = cache
+      self.numThreads = numThreads
+      self.engine = engine
+      self.tolerance = tolerance
+      self.maxReplicates = maxReplicates
       self.debug = debug
       self.untypedAllele = untypedAllele
       self.sequenceData = checkIfSequenceData(self.matrix)
@@ -478,7 +1029,8 @@ class HomozygosityEWSlatkinExactPairwise:
 
         # generate allele frequency counts via Genotypes class
         g = Genotypes(matrix=subMat,
-                      untypedAllele=self.untypedAllele)
+                      untypedAllele=self.untypedAllele,
+                      lazy=1)
 
         # get allele count data
         countData = g.getAlleleCountAt(colName)[0]
@@ -486,6 +1038,11 @@ class HomozygosityEWSlatkinExactPairwise:
         # only pass in count frequencies
         hz = HomozygosityEWSlatkinExact(countData.values(),
                                         numReplicates=self.numReplicates,
+                                        cache=self.cache,
+                                        numThreads=self.numThreads,
+                                        engine=self.engine,
+                                        tolerance=self.tolerance,
+                                        maxReplicates=self.maxReplicates,
                                         debug=self.debug)
 
         hz.serializeHomozygosityTo(stream)
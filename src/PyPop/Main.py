@@ -36,15 +36,15 @@
 """Python population genetics statistics.
 """
 
-import sys, os, time
+import sys, os, time, re
 from configparser import ConfigParser, NoOptionError, NoSectionError
 
-from PyPop.ParseFile import ParseGenotypeFile, ParseAlleleCountFile
+from PyPop.ParseFile import ParseGenotypeFile, ParseAlleleCountFile, ParsePlinkFile, stripCompressedSuffix, isPlinkFile
 from PyPop.DataTypes import Genotypes, AlleleCounts, getLumpedDataLevels
 from PyPop.Arlequin import ArlequinExactHWTest
 from PyPop.Haplo import Emhaplofreq, HaploArlequin, Haplostats
-from PyPop.HardyWeinberg import HardyWeinberg, HardyWeinbergGuoThompson, HardyWeinbergGuoThompsonArlequin, HardyWeinbergEnumeration
-from PyPop.Homozygosity import Homozygosity, HomozygosityEWSlatkinExact, HomozygosityEWSlatkinExactPairwise
+from PyPop.HardyWeinberg import HardyWeinberg, HardyWeinbergGuoThompson, HardyWeinbergGuoThompsonArlequin, HardyWeinbergEnumeration, HardyWeinbergBiallelic, makeGuoThompsonTest
+from PyPop.Homozygosity import Homozygosity, HomozygosityEWSlatkinExact, HomozygosityEWSlatkinExactPairwise, getEWSlatkinCache
 from PyPop.Utils import XMLOutputStream, TextOutputStream, convertLineEndings, StringMatrix, checkXSLFile, getUserFilenameInput, unique_elements
 from PyPop.Filter import PassThroughFilter, AnthonyNolanFilter, AlleleCountAnthonyNolanFilter, BinningFilter
 from PyPop.RandomBinning import RandomBinsForHomozygosity
@@ -96,7 +96,8 @@ class Main:
                  thread=None,
                  outputDir=None,
                  version=None,
-                 testMode=False):
+                 testMode=False,
+                 parsed=None):
 
         self.config = config
         self.debugFlag = debugFlag
@@ -108,6 +109,13 @@ class Main:
         self.version = version
         self.testMode = testMode
 
+        # an already parsed population (used when splitting a file
+        # by population)
+        self.parsed = parsed
+
+        # by default each instance analyses a single population
+        self.populations = None
+
         # for threading to work
         self.thread = thread
 
@@ -115,9 +123,15 @@ class Main:
         self.filteringFlag = 0
         self.randomBinningFlag = 0
 
-        # parse out the parts of the filename
+        # parse out the parts of the filename, ignoring any suffix
+        # for compressed files (e.g. '.pop.gz')
         baseFileName = os.path.basename(self.fileName)
-        prefixFileName = '.'.join(baseFileName.split(".")[:-1])
+        prefixFileName = '.'.join(stripCompressedSuffix(baseFileName).split(".")[:-1])
+
+        # when analysing one population from a file, add its name
+        if self.parsed:
+            prefixFileName = prefixFileName + '-' + \
+                             re.sub('[^A-Za-z0-9._-]', '_', self.parsed.popName)
         
         # generate date and time
 
@@ -252,7 +266,10 @@ class Main:
         try:
             validSampleFields = self.config.get(self.fileType, "validSampleFields")
         except NoOptionError:
-            sys.exit("No valid sample fields defined")
+            # PLINK binary files define their own loci and samples
+            if not isPlinkFile(self.fileName):
+                sys.exit("No valid sample fields defined")
+            validSampleFields = None
 
         try:
           self.alleleDesignator = self.config.get(self.fileType, "alleleDesignator")
@@ -281,22 +298,75 @@ class Main:
             except NoOptionError:
               fieldPairDesignator = '_1:_2'
 
+            try:
+              encodeAlleles = self.config.getboolean(self.fileType, "encodeAlleles")
+            except NoOptionError:
+              encodeAlleles = 0
+            except ValueError:
+              sys.exit("require a 0 or 1 as a flag for encodeAlleles")
+
+            try:
+              cacheDir = self.config.get(self.fileType, "cacheDir")
+            except NoOptionError:
+              cacheDir = None
+
+            try:
+              splitPopulations = self.config.getboolean(self.fileType, "splitPopulations")
+            except NoOptionError:
+              splitPopulations = 0
+            except ValueError:
+              sys.exit("require a 0 or 1 as a flag for splitPopulations")
+
 
             # Generate the parse file object, which simply creates
             # a matrix (no allele count stuff done!)
-            self.parsed = ParseGenotypeFile(self.fileName,
+            if self.parsed:
+              # already parsed, nothing to do
+              pass
+            elif isPlinkFile(self.fileName):
+              # PLINK binary genotypes are read directly, and are
+              # integer-coded unless explicitly disabled
+              if not self.config.has_option(self.fileType, "encodeAlleles"):
+                encodeAlleles = 1
+              self.parsed = ParsePlinkFile(self.fileName,
+                                untypedAllele=self.untypedAllele,
+                                encodeAlleles=encodeAlleles,
+                                debug=self.debug)
+            else:
+              self.parsed = ParseGenotypeFile(self.fileName,
                                 validPopFields=validPopFields,
                                 validSampleFields=validSampleFields,
                                 alleleDesignator=self.alleleDesignator, 
                                 untypedAllele=self.untypedAllele,
                                 popNameDesignator=popNameDesignator,
                                 fieldPairDesignator=fieldPairDesignator,
+                                encodeAlleles=encodeAlleles,
+                                cacheDir=cacheDir,
                                 debug=self.debug)
 
             # if we are dealing with data that is originally genotyped
             # we dis-allow individuals that are typed at only allele
             allowSemiTyped = 0
 
+            # run each population in the file as a separate analysis
+            # with its own output files, all sharing the parsed data
+            if splitPopulations and not parsed:
+              self.populations = []
+              for popName in self.parsed.getPopulationNames():
+                print("LOG: analysing population %s" % popName)
+                self.populations.append(Main(config=config,
+                                             xslFilename=xslFilename,
+                                             xslFilenameDefault=xslFilenameDefault,
+                                             debugFlag=debugFlag,
+                                             fileName=fileName,
+                                             datapath=datapath,
+                                             thread=thread,
+                                             outputDir=outputDir,
+                                             version=version,
+                                             testMode=testMode,
+                                             parsed=self.parsed.getPopulation(popName)))
+              return
+
         # END PARSE for a genotype file (ParseGenotypeFile)
 
         # BEGIN PARSE: allelecount file (ParseAlleleCountFile)
@@ -359,12 +429,15 @@ class Main:
                 self._runFilters()
 
         # now convert into DataType: and then we pass the filtered
-        # matrix to be put in format for rest of processing
+        # matrix to be put in format for rest of processing, each
+        # locus is only processed when first used (so that, e.g.,
+        # genotype lists are never built for monomorphic loci)
 
         self.input = Genotypes(matrix=self.matrixHistory[-1],
                                untypedAllele=self.untypedAllele,
                                unsequencedSite=self.unsequencedSite,
                                allowSemiTyped=allowSemiTyped,
+                               lazy=1,
                                debug=self.debug)
 
         # BEGIN common XML output section
@@ -650,8 +723,8 @@ class Main:
             except ValueError:
               sys.exit("require a 0 or 1 as a Boolean flag")
 
-            hwObject = HardyWeinberg(self.input.getLocusDataAt(locus), 
-                                     self.input.getAlleleCountAt(locus), 
+            hwObject = HardyWeinberg(alleleCount=self.input.getAlleleCountAt(locus), 
+                                     genotypeCounts=self.input.getGenotypeCountsAt(locus),
                                      lumpBelow=lumpBelow,
                                      flagChenTest=flagChenTest,
                                      debug=self.debug)
@@ -671,6 +744,7 @@ class Main:
                   hwObjectLump = HardyWeinberg(locusData,
                                                alleleData,
                                                lumpBelow=lumpBelow,
+                                               genotypeCounts=self.input.getGenotypeCountsAt(locus, level),
                                                debug=self.debug)
 
                   # serialize HardyWeinberg
@@ -736,10 +810,43 @@ class Main:
             except ValueError:
               sys.exit("require integer value")
 
-            # Guo & Thompson implementation
-            hwObject= HardyWeinbergGuoThompson(\
-                locusData=self.input.getLocusDataAt(locus), 
+            try:
+              numChains = self.config.getint("HardyWeinbergGuoThompson", "numChains")
+            except (NoOptionError, NoSectionError):
+              numChains=1
+            except ValueError:
+              sys.exit("require integer value")
+
+            # significance thresholds for stopping early, if any
+            try:
+              stopThresholds = [float(i) for i in self.config.get("HardyWeinbergGuoThompson", "stopThresholds").split(",")]
+            except (NoOptionError, NoSectionError):
+              stopThresholds=None
+            except ValueError:
+              sys.exit("stopThresholds: require comma-separated list of numbers")
+
+            try:
+              monteCarloStopThresholds = [float(i) for i in self.config.get("HardyWeinbergGuoThompsonMonteCarlo", "stopThresholds").split(",")]
+            except (NoOptionError, NoSectionError):
+              monteCarloStopThresholds=None
+            except ValueError:
+              sys.exit("stopThresholds: require comma-separated list of numbers")
+
+            # time budget (in seconds) per locus, if the test is to
+            # be chosen by the planner
+            try:
+              timeBudget = self.config.getfloat("HardyWeinbergGuoThompson", "timeBudget")
+            except (NoOptionError, NoSectionError):
+              timeBudget=None
+            except ValueError:
+              sys.exit("timeBudget: require number of seconds")
+
+            # Guo & Thompson implementation, or the exact test
+            # directly, if there are only two alleles (or the test
+            # chosen by the planner, given a time budget)
+            hwObject= makeGuoThompsonTest(\
                 alleleCount=self.input.getAlleleCountAt(locus),
+                genotypeCounts=self.input.getGenotypeCountsAt(locus),
                 runMCMCTest=runMCMCTest,
                 runPlainMCTest=runPlainMCTest,
                 dememorizationSteps=dememorizationSteps,
@@ -747,6 +854,10 @@ class Main:
                 samplingSize=samplingSize,
                 maxMatrixSize=maxMatrixSize,
                 monteCarloSteps=monteCarloSteps,
+                numChains=numChains,
+                stopThresholds=stopThresholds,
+                monteCarloStopThresholds=monteCarloStopThresholds,
+                timeBudget=timeBudget,
                 debug=self.debug,
                 testing=self.testMode)
             
@@ -782,10 +893,10 @@ class Main:
                     lumpData = getLumpedDataLevels(self.input, locus, li)
                     for level in lumpData.keys():
                         locusData, alleleData = lumpData[level]
-
-                        hwObjectLump = HardyWeinbergGuoThompson(\
+                        hwObjectLump = makeGuoThompsonTest(\
                                locusData=locusData, 
                                alleleCount=alleleData,
+                               genotypeCounts=self.input.getGenotypeCountsAt(locus, level),
                                runMCMCTest=runMCMCTest,
                                runPlainMCTest=runPlainMCTest,
                                dememorizationSteps=dememorizationSteps,
@@ -793,6 +904,10 @@ class Main:
                                samplingSize=samplingSize,
                                maxMatrixSize=maxMatrixSize,
                                monteCarloSteps=monteCarloSteps,
+                               numChains=numChains,
+                               stopThresholds=stopThresholds,
+                               monteCarloStopThresholds=monteCarloStopThresholds,
+                               timeBudget=timeBudget,
                                debug=self.debug,
                                testing=self.testMode)
                         
@@ -821,9 +936,16 @@ class Main:
               except ValueError:
                   sys.exit("doOverall: requires 0 or 1 as a boolean flag")
               
-              hwEnum = HardyWeinbergEnumeration(\
-                     locusData=self.input.getLocusDataAt(locus), 
+              # two allele loci are enumerated directly
+              genotypeCounts = self.input.getGenotypeCountsAt(locus)
+              if genotypeCounts.k == 2:
+                  hwClass = HardyWeinbergBiallelic
+              else:
+                  hwClass = HardyWeinbergEnumeration
+
+              hwEnum = hwClass(\
                      alleleCount=self.input.getAlleleCountAt(locus),
+                     genotypeCounts=genotypeCounts,
                      doOverall=doOverall,
                      debug=self.debug)
 
@@ -839,10 +961,16 @@ class Main:
             
                   for level in lumpData.keys():
                       locusData, alleleData = lumpData[level]
+                      genotypeCounts = self.input.getGenotypeCountsAt(locus, level)
+                      if genotypeCounts.k == 2:
+                          hwClass = HardyWeinbergBiallelic
+                      else:
+                          hwClass = HardyWeinbergEnumeration
                       
-                      hwEnumLump = HardyWeinbergEnumeration(\
+                      hwEnumLump = hwClass(\
                                     locusData=locusData,
                                     alleleCount=alleleData,
+                                    genotypeCounts=genotypeCounts,
                                     doOverall=doOverall,
                                     debug=self.debug)
                       
@@ -904,6 +1032,37 @@ class Main:
             except NoOptionError:
               numReplicates=10000
 
+            # results are cached in memory, and on disk if asked
+            try:
+              ewSlatkinCache = getEWSlatkinCache(self.config.get("HomozygosityEWSlatkinExact",
+                                                                 "cacheDir"))
+            except NoOptionError:
+              ewSlatkinCache = getEWSlatkinCache()
+
+            try:
+              ewSlatkinThreads=self.config.getint("HomozygosityEWSlatkinExact",
+                                                  "numThreads")
+            except NoOptionError:
+              ewSlatkinThreads=1
+
+            try:
+              ewSlatkinEngine=self.config.get("HomozygosityEWSlatkinExact",
+                                              "engine")
+            except NoOptionError:
+              ewSlatkinEngine='slatkin'
+
+            # adaptive number of replicates, off unless a tolerance is given
+            try:
+              ewSlatkinTolerance=self.config.getfloat("HomozygosityEWSlatkinExact",
+                                                      "tolerance")
+            except NoOptionError:
+              ewSlatkinTolerance=None
+            try:
+              ewSlatkinMaxReplicates=self.config.getint("HomozygosityEWSlatkinExact",
+                                                        "maxReplicates")
+            except NoOptionError:
+              ewSlatkinMaxReplicates=100000
+
             # make a dictionary of allele counts (don't need the last
             # two elements that are returned by this method)            
             alleleCounts = self.input.getAlleleCountAt(locus)[0]
@@ -913,6 +1072,11 @@ class Main:
             # random binning.
             hzExactObj = HomozygosityEWSlatkinExact(alleleCounts.values(),
                                                     numReplicates=numReplicates,
+                                                    cache=ewSlatkinCache,
+                                                    numThreads=ewSlatkinThreads,
+                                                    engine=ewSlatkinEngine,
+                                                    tolerance=ewSlatkinTolerance,
+                                                    maxReplicates=ewSlatkinMaxReplicates,
                                                     debug=self.debug)
 
             hzExactObj.serializeHomozygosityTo(self.xmlStream)
@@ -922,6 +1086,7 @@ class Main:
 
                 inputInitial = Genotypes(matrix=self.matrixHistory[self.binningStartPoint],
                                          untypedAllele=self.untypedAllele,
+                                         lazy=1,
                                          debug=self.debug)
 
                 # as above, we create a dictionary of allele counts
@@ -1004,6 +1169,11 @@ class Main:
                 matrix=self.input.getIndividualsData(),
                 numReplicates=numReplicates,
                 untypedAllele=self.untypedAllele,
+                cache=ewSlatkinCache,
+                numThreads=ewSlatkinThreads,
+                engine=ewSlatkinEngine,
+                tolerance=ewSlatkinTolerance,
+                maxReplicates=ewSlatkinMaxReplicates,
                 debug=self.debug)
             hz.serializeTo(self.xmlStream)
 
@@ -1257,3 +1427,16 @@ at least 1000 is recommended.  A value of '1' is not permitted.""")
         # return the name of the generated plain text (.txt) file
         return self.txtOutPath
 
+    def getXmlOutPaths(self):
+        # return the names of all generated XML files (one per
+        # population if the file was split by population)
+        if self.populations != None:
+            return [population.getXmlOutPath() for population in self.populations]
+        return [self.xmlOutPath]
+
+    def getTxtOutPaths(self):
+        # return the names of all generated plain text (.txt) files
+        if self.populations != None:
+            return [population.getTxtOutPath() for population in self.populations]
+        return [self.txtOutPath]
+
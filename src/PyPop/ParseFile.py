@@ -39,9 +39,52 @@
    and classes for parsing literature data which only includes allele
    counts."""
 
-import sys, os, string, types, re, operator
-
-from PyPop.Utils import getStreamType, StringMatrix, OrderedDict, TextOutputStream
+import sys, os, string, types, re, operator, hashlib, json, tempfile, shutil
+import gzip, bz2, lzma, copy
+import numpy as np
+
+from PyPop.Utils import getStreamType, StringMatrix, EncodedStringMatrix, OrderedDict, TextOutputStream
+
+# version of the binary format used by the ParseGenotypeFile cache
+CACHE_VERSION = 1
+
+# compressed input formats: file suffix, leading `magic' bytes and
+# function to open the file
+COMPRESSED_FORMATS = [('.gz', b'\x1f\x8b', gzip.open),
+                      ('.bz2', b'BZh', bz2.open),
+                      ('.xz', b'\xfd7zXZ\x00', lzma.open)]
+
+def openDataFile(filename):
+    """Open a data file for reading as text.
+
+    Files compressed with gzip, bzip2 or xz, recognised either by
+    their suffix or by their leading `magic' bytes, are decompressed
+    on the fly as they are read."""
+    with open(filename, 'rb') as f:
+        magic = f.read(6)
+    for suffix, signature, opener in COMPRESSED_FORMATS:
+        if filename.endswith(suffix) or magic.startswith(signature):
+            return opener(filename, 'rt')
+    return open(filename, 'r')
+
+def stripCompressedSuffix(filename):
+    """Returns filename without any compression suffix."""
+    for suffix, signature, opener in COMPRESSED_FORMATS:
+        if filename.endswith(suffix):
+            return filename[:-len(suffix)]
+    return filename
+
+# leading bytes of a SNP-major PLINK .bed file
+PLINK_BED_MAGIC = b'\x6c\x1b\x01'
+
+def isPlinkFile(filename):
+    """Returns true if 'filename' names a PLINK binary fileset.
+
+    The fileset may be given either by its '.bed' file, or by the
+    common prefix of the '.bed', '.bim' and '.fam' files."""
+    if filename.endswith('.bed'):
+        return True
+    return not os.path.exists(filename) and os.path.exists(filename + '.bed')
 
 class ParseFile:
     """*Abstract* class for parsing a datafile.
@@ -101,6 +144,15 @@ class ParseFile:
         self.sampleMap = None
     
         # Reads and parses a given filename.
+        self._parseFile()
+
+    def _parseFile(self):
+        """Reads and parses the file.
+
+        Reads the file and parses the population and sample headers,
+        subclasses extend this to generate their data structures.
+
+        *For internal use only.*"""
 
         self._sampleFileRead(self.filename)
 
@@ -222,12 +274,14 @@ class ParseFile:
     def _sampleFileRead(self, filename):
         """Reads filename into object.
 
-        Takes a filename and reads the file data into an instance variable.
+        Takes a filename and reads the file data into an instance
+        variable.  Compressed files are decompressed as they are read,
+        without first being written out or read into memory in full.
 
         *For internal use only*.
         """
-        f = open(filename, 'r')
-        self.fileData = f.readlines()
+        with openDataFile(filename) as f:
+            self.fileData = f.readlines()
 
     def _mapPopHeaders(self):
 
@@ -293,8 +347,11 @@ class ParseFile:
             print(self.sampleMap)
 
         # check file data to see that correct number of fields are
-        # present for each sample
+        # present for each sample, keeping the tokenized fields so
+        # that subclasses never need to split the same line again
+        # (each subclass drops them once its data structures are built)
 
+        self.sampleTokens = []
         for lineCount in range(self.sampleFirstLine, len(self.fileData)):
 
             # retrieve and strip newline
@@ -308,6 +365,7 @@ class ParseFile:
                 print("error: incorrect number of fields:", len(fields),
                       "found, should have:", fieldCount,
                       "\noffending line is:\n", line)
+            self.sampleTokens.append(fields)
 
 
     def getPopData(self):
@@ -333,7 +391,12 @@ class ParseFile:
 
         - raw sample lines, *without*  header metadata.
         
-        - the field separator."""
+        - the field separator.
+
+        Raises 'ValueError' if the text file wasn't read, i.e. the
+        data was loaded from the cache or a PLINK fileset."""
+        if self.fileData == None:
+            raise ValueError("raw file data isn't available for %s: it was loaded from the cache or a PLINK fileset, not parsed as text" % self.filename)
         return self.fileData[self.sampleFirstLine:], self.separator
     
     def genSampleOutput(self, fieldList):
@@ -378,6 +441,8 @@ class ParseGenotypeFile(ParseFile):
     def __init__(self,
                  filename,
                  untypedAllele='****',
+                 encodeAlleles=0,
+                 cacheDir=None,
                  **kw):
         """Constructor for ParseGenotypeFile.
 
@@ -388,13 +453,189 @@ class ParseGenotypeFile(ParseFile):
 
         - 'untypedAllele': The designator for an untyped locus.  Defaults
         to '****'.
+
+        - 'encodeAlleles': If set to '1', store the genotype data in
+        an 'EncodedStringMatrix' (per-locus allele dictionary plus
+        integer codes) rather than a 'StringMatrix'.  Defaults to '0'.
+
+        - 'cacheDir': If set, a directory used to cache the parsed
+        genotype data in binary form.  The cache is keyed on the
+        contents of the file and the settings that affect parsing; on
+        a cache hit the text file is not parsed at all.  Defaults to
+        'None' (no caching).
         """
         self.untypedAllele=untypedAllele
+        self.encodeAlleles=encodeAlleles
+        self.cacheDir=cacheDir
         
         ParseFile.__init__(self, filename, **kw)
 
+    def _parseFile(self):
+        """Parses the file, or loads it from the cache if enabled.
+
+        *For internal use only.*"""
+
+        if self.cacheDir:
+            cachePath = self._getCachePath()
+            if os.path.isdir(cachePath):
+                try:
+                    self._loadCache(cachePath)
+                    return
+                except (OSError, ValueError, KeyError) as e:
+                    print("LOG: ignoring unreadable cache %s: %s" % (cachePath, e))
+
+        ParseFile._parseFile(self)
         self._genDataStructures()
 
+        if self.cacheDir:
+            self._saveCache(cachePath)
+
+    def _getCachePath(self):
+        """Returns the cache location for the current file and settings.
+
+        The key is a hash of the file contents along with all the
+        settings that affect the parsed result.
+
+        *For internal use only.*"""
+
+        digest = hashlib.sha256()
+        with open(self.filename, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                digest.update(block)
+
+        settings = [CACHE_VERSION, self.validPopFields, self.validSampleFields,
+                    self.separator, self.fieldPairDesignator,
+                    self.alleleDesignator, self.popNameDesignator]
+        digest.update(json.dumps(settings).encode('utf-8'))
+
+        return os.path.join(self.cacheDir, digest.hexdigest())
+
+    def _saveCache(self, cachePath):
+        """Save the parsed data to the cache in columnar form.
+
+        The cache is a directory holding the metadata (as JSON), the
+        non-allele columns and concatenated per-locus allele labels
+        (as fixed-width string arrays) and the integer allele codes,
+        each as a NumPy '.npy' file that can be memory-mapped.
+
+        *For internal use only.*"""
+
+        if isinstance(self.matrix, EncodedStringMatrix):
+            encoded = self.matrix
+        else:
+            encoded = EncodedStringMatrix(self.totalIndivCount,
+                                          self.locusKeys,
+                                          self.extraKeys)
+            encoded.setRows(self.matrix.array.tolist())
+
+        # code 0 (unassigned) is never stored
+        labels = []
+        labelOffsets = [0]
+        for locusLabels in encoded.alleleLabels:
+            labels.extend(locusLabels[1:])
+            labelOffsets.append(len(labels))
+
+        def flatten(d):
+            li = []
+            for key in d.keys():
+                li.extend([key, d[key]])
+            return li
+
+        if self.popData == None:
+            popData = None
+        else:
+            popData = flatten(self.popData)
+
+        meta = {'version': CACHE_VERSION,
+                'popData': popData,
+                'popName': self.popName,
+                'sampleMap': flatten(self.sampleMap),
+                'alleleMap': flatten(self.alleleMap),
+                'nonAlleleMap': flatten(self.nonAlleleMap),
+                'headerLines': self.matrix.headerLines,
+                'sampleFirstLine': self.sampleFirstLine,
+                'totalIndivCount': self.totalIndivCount}
+
+        os.makedirs(self.cacheDir, exist_ok=True)
+        tmpPath = tempfile.mkdtemp(dir=self.cacheDir)
+        try:
+            with open(os.path.join(tmpPath, 'meta.json'), 'w') as f:
+                json.dump(meta, f)
+            np.save(os.path.join(tmpPath, 'extras.npy'),
+                    np.array(encoded.extraArray.tolist(), dtype=str).reshape(encoded.extraArray.shape))
+            np.save(os.path.join(tmpPath, 'labels.npy'), np.array(labels, dtype=str))
+            np.save(os.path.join(tmpPath, 'labelOffsets.npy'), np.array(labelOffsets))
+            np.save(os.path.join(tmpPath, 'codes.npy'), encoded.codes)
+            os.rename(tmpPath, cachePath)
+        except OSError:
+            # another process may have written the same entry already
+            shutil.rmtree(tmpPath, ignore_errors=True)
+
+    def _loadCache(self, cachePath):
+        """Load the parsed data from the cache.
+
+        The allele codes are memory-mapped (copy-on-write), the
+        original text file is not read.
+
+        *For internal use only.*"""
+
+        with open(os.path.join(cachePath, 'meta.json')) as f:
+            meta = json.load(f)
+        if meta['version'] != CACHE_VERSION:
+            raise ValueError("cache version %s not supported" % meta['version'])
+
+        def unflatten(li):
+            # JSON turns tuples into lists
+            return OrderedDict([tuple(v) if type(v) == list else v for v in li])
+
+        extras = np.load(os.path.join(cachePath, 'extras.npy'))
+        labels = np.load(os.path.join(cachePath, 'labels.npy')).tolist()
+        labelOffsets = np.load(os.path.join(cachePath, 'labelOffsets.npy')).tolist()
+        codes = np.load(os.path.join(cachePath, 'codes.npy'), mmap_mode='c')
+
+        # restore the state that parsing would have created
+        self.fileData = None
+        if meta['popData'] == None:
+            self.popData = None
+        else:
+            self.popData = unflatten(meta['popData'])
+        self.popName = meta['popName']
+        self.sampleMap = unflatten(meta['sampleMap'])
+        self.alleleMap = unflatten(meta['alleleMap'])
+        self.nonAlleleMap = unflatten(meta['nonAlleleMap'])
+        self.sampleFirstLine = meta['sampleFirstLine']
+        self.totalIndivCount = meta['totalIndivCount']
+        self.totalLocusCount = len(self.alleleMap)
+        self.locusKeys = self.alleleMap.keys()
+        self.extraKeys = self.nonAlleleMap.keys()
+        self.popNameKey = None
+        for key in self.sampleMap.keys():
+            if key[0] == self.popNameDesignator:
+                self.popNameKey = key[1:]
+
+        encoded = EncodedStringMatrix(self.totalIndivCount,
+                                      self.locusKeys,
+                                      self.extraKeys,
+                                      self.separator,
+                                      meta['headerLines'])
+        if encoded.extraCount > 0:
+            encoded.extraArray[:, :] = extras.tolist()
+        encoded.codes = codes
+        for locusPos in range(encoded.colCount):
+            locusLabels = [0] + labels[labelOffsets[locusPos]:labelOffsets[locusPos+1]]
+            encoded.alleleLabels[locusPos] = locusLabels
+            encoded.alleleCodes[locusPos] = dict(zip(locusLabels, range(len(locusLabels))))
+
+        if self.encodeAlleles:
+            self.matrix = encoded
+        else:
+            self.matrix = StringMatrix(self.totalIndivCount,
+                                       self.locusKeys,
+                                       self.extraKeys,
+                                       self.separator,
+                                       meta['headerLines'])
+            self.matrix.array = encoded.array.copy()
+
     def _genInternalMaps(self):
         """Returns dictionary containing 2-tuple of column position.
 
@@ -410,6 +651,7 @@ class ParseGenotypeFile(ParseFile):
         # assume there is no population column
         
         popNameCol = None
+        self.popNameKey = None
 
         # create a map that only contains non-allele fields
         self.nonAlleleMap = OrderedDict()
@@ -426,6 +668,7 @@ class ParseGenotypeFile(ParseFile):
                 self.alleleMap[locusKey] = self.sampleMap[key]
             elif key[0] == self.popNameDesignator:
                 popNameCol = self.sampleMap[key]
+                self.popNameKey = key[1:]
                 self.nonAlleleMap[key[1:]] = self.sampleMap[key]
             else:
                 self.nonAlleleMap[key] = self.sampleMap[key]
@@ -467,56 +710,48 @@ class ParseGenotypeFile(ParseFile):
 
         # create an empty-list of lists to store all the row data
         #self.individualsList = [[] for line in range(0, self.totalIndivCount)]
-        self.matrix = StringMatrix(self.totalIndivCount,
-                                   self.locusKeys,
-                                   self.extraKeys,
-                                   self.separator,
-                                   self.fileData[:self.sampleFirstLine-1])
-
-        rowCount = 0
-        # store all the non-allele meta-data
-        for line in sampleDataLines:
-            fields = line.split(self.separator)
-            for key in self.nonAlleleMap.keys():
-                self.matrix[rowCount, key] = fields[self.nonAlleleMap[key]]
-
-            rowCount += 1
-
-        if self.debug:
-            print("before filling matrix with allele data")
-            print(self.matrix)
-
+        if self.encodeAlleles:
+            matrixClass = EncodedStringMatrix
+        else:
+            matrixClass = StringMatrix
+        self.matrix = matrixClass(self.totalIndivCount,
+                                  self.locusKeys,
+                                  self.extraKeys,
+                                  self.separator,
+                                  self.fileData[:self.sampleFirstLine-1])
+
+        # build the list of input columns in the same order as the
+        # underlying array: non-allele meta-data first, then each
+        # locus as a pair of adjacent allele columns
+        extraCols = [self.nonAlleleMap[key] for key in self.extraKeys]
+        alleleCols = []
         for locus in self.locusKeys:
             if self.debug:
                print("locus name:", locus)
                print("column tuple:", self.alleleMap[locus])
 
             col1, col2 = self.alleleMap[locus]
+            alleleCols.extend([col1, col2])
 
-            # re-initialise the row count on each iteration of the locus
-            rowCount = 0
-            for line in sampleDataLines:
-                fields = line.split(self.separator)
+        # each line has already been tokenized exactly once (in
+        # _mapSampleHeaders), so simply pick out the columns of each
+        # row (stripping whitespace from alleles only) and fill the
+        # whole matrix in one assignment, rather than going through
+        # __setitem__ cell-by-cell
+        rows = []
+        for fields in self.sampleTokens:
+            row = [fields[col] for col in extraCols]
+            row.extend([fields[col].strip() for col in alleleCols])
+            rows.append(row)
 
-                # create data structures
+        self.matrix.setRows(rows)
 
-                allele1 = fields[col1].strip()
-                allele2 = fields[col2].strip()
+        # tokens are no longer needed once the matrix is filled
+        del self.sampleTokens
 
-                # underlying NumPy array data type won't allow storage
-                # of any sequence-type object (e.g. list or tuple) but
-                # we can workaround this by overriding the __setitem__
-                # method of the UserArray wrapper class used for
-                # subtyping and storing tuple internally as two
-                # separate columns in the underlying array.
-
-                self.matrix[rowCount,locus] = (allele1, allele2)
-                
-                if self.debug:
-                    print(rowCount, self.matrix[rowCount,locus])
-
-                # increment row count
-                rowCount += 1
+        if self.debug:
+            print("after filling matrix with allele data")
+            print(self.matrix)
 
     def genValidKey(self, field, fieldList):
         """Check and validate key.
@@ -582,6 +817,52 @@ class ParseGenotypeFile(ParseFile):
         """
         return self.matrix
 
+    def _genPopulationIndex(self):
+        """Index the rows of the matrix by population name.
+
+        Builds an ordered dictionary of population name (in order of
+        first appearance) to an array of the rows for that population
+        in a single pass over the population name column.
+
+        *For internal use only.*"""
+
+        if self.popNameKey == None:
+            sys.exit("splitting by population requires a population name field (prefixed with '%s')" % self.popNameDesignator)
+
+        col = self.extraKeys.index(self.popNameKey)
+        rowsByPopulation = {}
+        for row, popName in enumerate(self.matrix._getColumns((col,))[:, 0]):
+            rowsByPopulation.setdefault(popName, []).append(row)
+
+        self.populationIndex = OrderedDict()
+        for popName in rowsByPopulation:
+            self.populationIndex[popName] = np.array(rowsByPopulation[popName])
+
+    def getPopulationNames(self):
+        """Returns the list of population names in the file.
+
+        Names are in order of first appearance in the population
+        name column."""
+        if not hasattr(self, 'populationIndex'):
+            self._genPopulationIndex()
+        return self.populationIndex.keys()
+
+    def getPopulation(self, popName):
+        """Returns the data for a single population.
+
+        Returns a copy of this object restricted to the individuals
+        in population 'popName', which can be used in place of a
+        'ParseGenotypeFile' parsed from a file containing only that
+        population.  The file is not re-read."""
+        if not hasattr(self, 'populationIndex'):
+            self._genPopulationIndex()
+
+        population = copy.copy(self)
+        population.popName = popName
+        population.matrix = self.matrix.getRowMatrix(self.populationIndex[popName])
+        population.totalIndivCount = len(self.populationIndex[popName])
+        return population
+
     def serializeSubclassMetadataTo(self, stream):
         """Serialize subclass-specific metadata."""
 
@@ -611,12 +892,10 @@ class ParseAlleleCountFile(ParseFile):
         self._genDataStructures()
 
     def _genDataStructures(self):
-        sampleDataLines, separator = self.getFileData()
-
+        # each line has already been tokenized (in _mapSampleHeaders)
         self.alleleTable = {}
         totalAlleles = 0
-        for line in sampleDataLines:
-            allele, count = line.split(separator)
+        for allele, count in self.sampleTokens:
             # convert to integer
             count = int(count)
             # check to see if key already exists
@@ -630,6 +909,9 @@ class ParseAlleleCountFile(ParseFile):
             # increment total alleles found
             totalAlleles += count
 
+        # tokens are no longer needed once the table is filled
+        del self.sampleTokens
+
         if self.debug:
             print('alleleTable', self.alleleTable)
             print('sampleMap keys:', self.sampleMap.keys())
@@ -726,10 +1008,137 @@ class ParseAlleleCountFile(ParseFile):
         """
         return self.matrix
 
+class ParsePlinkFile(ParseFile):
+    """Class to parse PLINK binary (.bed/.bim/.fam) genotype files.
+
+    Each SNP in the '.bim' file becomes a locus, named by its SNP
+    identifier (made uppercase, with any ':' replaced by '-', since
+    ':' separates loci in 'StringMatrix' keys), with the two alleles
+    listed in the '.bim' file.  Each individual in the '.fam' file
+    becomes a row, with the family and individual ids stored as the
+    non-allele fields 'fid' and 'id'.
+
+    The 2-bit packed genotypes in the '.bed' file are decoded
+    directly into the integer codes of an 'EncodedStringMatrix',
+    without going via text.  Only SNP-major '.bed' files (the PLINK
+    default) are supported."""
+
+    def __init__(self,
+                 filename,
+                 untypedAllele='****',
+                 encodeAlleles=1,
+                 **kw):
+        """Constructor for ParsePlinkFile.
+
+        - 'filename': either the '.bed' file or the common prefix of
+          the PLINK fileset.
+
+        In addition to the arguments for the base class, this class
+        accepts the following additional keywords:
+
+        - 'untypedAllele': The designator used for missing genotypes.
+        Defaults to '****'.
+
+        - 'encodeAlleles': If set to '0', decode the genotypes into a
+        plain 'StringMatrix'.  Defaults to '1', i.e. keep them in
+        an 'EncodedStringMatrix'.
+        """
+        self.untypedAllele=untypedAllele
+        self.encodeAlleles=encodeAlleles
+
+        ParseFile.__init__(self, filename, **kw)
+
+    def _parseFile(self):
+        """Reads the PLINK fileset and generates the matrix.
+
+        *For internal use only.*"""
+
+        if self.filename.endswith('.bed'):
+            prefix = self.filename[:-len('.bed')]
+        else:
+            prefix = self.filename
+
+        # individuals: FID IID PAT MAT SEX PHENOTYPE
+        with open(prefix + '.fam', 'r') as f:
+            famFields = [line.split() for line in f if line.strip()]
+
+        # SNPs: CHR SNP CM BP ALLELE1 ALLELE2
+        with open(prefix + '.bim', 'r') as f:
+            bimFields = [line.split() for line in f if line.strip()]
+
+        self.fileData = None
+        self.sampleFirstLine = 0
+        self.totalIndivCount = len(famFields)
+        self.totalLocusCount = len(bimFields)
+        self.locusKeys = [fields[1].upper().replace(':', '-') for fields in bimFields]
+        self.extraKeys = ['fid', 'id']
+
+        self.alleleMap = OrderedDict()
+        for locusPos in range(self.totalLocusCount):
+            self.alleleMap[self.locusKeys[locusPos]] = (4 + 2*locusPos, 5 + 2*locusPos)
+        self.nonAlleleMap = OrderedDict(['fid', 0, 'id', 1])
+        self.sampleMap = self.nonAlleleMap
+        self.popName = None
+
+        # each SNP is stored in ceil(individuals / 4) bytes
+        bytesPerLocus = (self.totalIndivCount + 3) // 4
+        with open(prefix + '.bed', 'rb') as f:
+            magic = f.read(len(PLINK_BED_MAGIC))
+            if magic != PLINK_BED_MAGIC:
+                sys.exit("%s.bed is not a SNP-major PLINK .bed file" % prefix)
+            packed = np.fromfile(f, dtype=np.uint8)
+        if len(packed) != bytesPerLocus * self.totalLocusCount:
+            sys.exit("%s.bed has %d bytes of genotype data, expected %d" % \
+                     (prefix, len(packed), bytesPerLocus * self.totalLocusCount))
+        packed = packed.reshape(self.totalLocusCount, bytesPerLocus)
+
+        # unpack four 2-bit genotypes per byte, lowest bits first,
+        # giving a (loci x individuals) array of values 0-3
+        genotypes = (packed[:, :, np.newaxis] >> np.array([0, 2, 4, 6], dtype=np.uint8)) & 3
+        genotypes = genotypes.reshape(self.totalLocusCount, -1)[:, :self.totalIndivCount]
+
+        # 00: homozygous allele 1, 01: missing, 10: heterozygous,
+        # 11: homozygous allele 2; as codes into the per-locus
+        # labels [0, allele1, allele2, untypedAllele]
+        firstCode = np.array([1, 3, 1, 2], dtype=np.int16)
+        secondCode = np.array([1, 3, 2, 2], dtype=np.int16)
+
+        self.matrix = EncodedStringMatrix(self.totalIndivCount,
+                                          self.locusKeys,
+                                          self.extraKeys,
+                                          self.separator)
+        if self.totalIndivCount > 0:
+            self.matrix.extraArray[:, :] = [fields[0:2] for fields in famFields]
+        self.matrix.codes[:, 0::2] = firstCode[genotypes].T
+        self.matrix.codes[:, 1::2] = secondCode[genotypes].T
+        for locusPos in range(self.totalLocusCount):
+            labels = [0, bimFields[locusPos][4], bimFields[locusPos][5],
+                      self.untypedAllele]
+            self.matrix.alleleLabels[locusPos] = labels
+            self.matrix.alleleCodes[locusPos] = dict(zip(labels, range(len(labels))))
+
+        if not self.encodeAlleles:
+            matrix = StringMatrix(self.totalIndivCount,
+                                  self.locusKeys,
+                                  self.extraKeys,
+                                  self.separator)
+            matrix.array = self.matrix.array.copy()
+            self.matrix = matrix
+
+    def getMatrix(self):
+        """Returns the genotype data.
+
+        Returns the genotype data in a 'StringMatrix' (or
+        'EncodedStringMatrix') NumPy array.
+        """
+        return self.matrix
+
+    def serializeSubclassMetadataTo(self, stream):
+        """Serialize subclass-specific metadata."""
+        pass
+
 # this test harness is called if this module is executed standalone
 if __name__ == "__main__":
 
     print("dummy test harness, currently a no-op")
     #parsefile = ParseGenotypeFile(sys.argv[1], debug=1)
-
-
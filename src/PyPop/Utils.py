@@ -512,14 +512,29 @@ class StringMatrix(container):
           if len(colNames) == 1:
               # return simply the pair of columns at that location as
               # a list
-              return take(self.array, tuple(li[0:2]), 1).tolist()
+              return self._getColumns(li[0:2]).tolist()
           else:
               # return the matrix consisting of column vectors
               # of the designated keys
-              return take(self.array, tuple(li), 1).tolist()
+              return self._getColumns(li).tolist()
       else:
           raise KeyError("keys must be a string or tuple")
 
+  def _getColumns(self, cols):
+      """Returns an array of the given (absolute) column positions.
+
+      *For internal use only.*"""
+      return take(self.array, tuple(cols), 1)
+
+  def setRows(self, rows):
+      """Fill the entire matrix in one assignment.
+
+      'rows' is a sequence of rows, each containing the non-allele
+      metadata columns (in 'extraList' order) followed by the pair of
+      allele columns for each locus (in 'colList' order)."""
+      if len(rows) > 0:
+          self.array[:, :] = rows
+
   def getNewStringMatrix(self, key):
       """Create an entirely new StringMatrix using only the columns supplied
       in the keys.
@@ -565,6 +580,19 @@ class StringMatrix(container):
       newMatrix.array = self.array[:,newExtraPos]
       return newMatrix
 
+  def getRowMatrix(self, rows):
+      """Create an entirely new StringMatrix using only the given rows.
+
+      'rows' is a sequence of row positions (in the order required),
+      all columns and metadata are retained."""
+      newMatrix = StringMatrix(rowCount=len(rows),
+                               colList=self.colList,
+                               extraList=self.extraList,
+                               colSep=self.colSep,
+                               headerLines=self.headerLines)
+      newMatrix.array = self.array[np.asarray(rows, dtype=int)]
+      return newMatrix
+
   def __setitem__(self, index, value):
       """Override built in.
 
@@ -603,6 +631,9 @@ class StringMatrix(container):
       """
       Return a list of unique integers for given key sorted by allele name using natural sort
       """
+      if key in self.colList:
+          return self.getAlleleCodes(key)[key][0]
+
       uniqueAlleles = []
       for genotype in self.__getitem__(key):
           for allele in genotype:
@@ -612,25 +643,58 @@ class StringMatrix(container):
       uniqueAlleles.sort(key=natural_sort_key) # natural sort
       return uniqueAlleles
 
-  def convertToInts(self):
+  def getAlleleCodes(self, key=None):
+      """Factorize the alleles at each locus in a single pass.
+
+      'key' is a colon-separated list of loci (default: all loci).
+
+      Returns a dictionary keyed by locus, each entry being a 2-tuple:
+
+      - the list of unique alleles (as strings) sorted using natural
+        sort, ties being broken by order of first appearance
+        (i.e. the same as 'getUniqueAlleles')
+
+      - a (rowCount x 2) integer array of codes for each allele,
+        starting at 1, i.e. the position in the above list plus one.
+      """
+      if key == None:
+          colNames = self.colList
+      else:
+          colNames = key.split(":")
+
+      alleleCodes = {}
+      for colName in colNames:
+          if colName not in self.colList:
+              raise KeyError("can't find %s column" % colName)
+          alleles = self._getLocusStrings(self.colList.index(colName))
+          alleleCodes[colName] = _factorizeAlleles(alleles)
+      return alleleCodes
+
+  def _getLocusStrings(self, locusPos):
+      """Returns the pair of allele columns of a locus as strings.
+
+      *For internal use only.*"""
+      col1 = locusPos * 2 + self.extraCount
+      return self._getColumns((col1, col1 + 1)).astype(str)
+
+  def convertToInts(self, alleleCodes=None):
       """
       Convert matrix to integers: needed for haplo-stats
       Note that integers start at 1 for compatibility with haplo-stats module
+      If 'alleleCodes' (as returned by 'getAlleleCodes') is supplied it is
+      used rather than recomputed.
       FIXME: check whether we need to release memory
       """
       
+      if alleleCodes == None:
+          alleleCodes = self.getAlleleCodes()
+
       # create a new copy
       newMatrix = self.copy()
       for colName in self.colList:
-          uniqueAlleles = self.getUniqueAlleles(colName)
-          row = 0
-          for genotype in self.__getitem__(colName):
-              factor_genotype = []
-              for allele in genotype:
-                  pos = uniqueAlleles.index(str(allele)) + 1
-                  factor_genotype.append(pos)
-              newMatrix[row, colName] = tuple(factor_genotype)
-              row += 1
+          col1 = self.colList.index(colName) * 2 + self.extraCount
+          uniqueAlleles, codes = alleleCodes[colName]
+          newMatrix.array[:, col1:col1+2] = codes
 
       return newMatrix
 
@@ -664,17 +728,10 @@ class StringMatrix(container):
       """Flatten columns into a single list
       FIXME: assumes entries are integers
       """
-      flattened_matrix = []
-
-      for col in self.colList:  # FIXME: currently assume we want whole matrix
-          # FIXME: possibly refactor extracting column logic with __getitem__
-          relativeLoc = self.colList.index(col)
-          col1 = relativeLoc * 2 + self.extraCount
-          col2 = col1 + 1
-          first_col = [int(x) for x in self.array[:,col1]]
-          flattened_matrix.extend(first_col)
-          second_col = [int(x) for x in self.array[:,col2]]
-          flattened_matrix.extend(second_col)
+      # FIXME: currently assume we want whole matrix
+      # take all allele columns, and read them column-by-column
+      cols = self._getColumns(range(self.extraCount, self.shape[1]))
+      flattened_matrix = cols.astype(int).T.ravel().tolist()
 
       return flattened_matrix
 
@@ -720,6 +777,304 @@ class StringMatrix(container):
       return newMatrix
       
       
+class EncodedStringMatrix(StringMatrix):
+  """Dictionary-encoded variant of StringMatrix.
+
+  Rather than storing every allele as a Python object, each locus
+  keeps its own allele dictionary and the allele columns are stored
+  as a compact integer array of codes into that dictionary (int16,
+  promoted to int32 only when a locus has more distinct alleles than
+  fit).  Non-allele metadata columns are stored as Python objects as
+  before.
+
+  Code 0 is reserved for the unassigned value (integer 0), so a newly
+  created matrix reads back exactly like a 'StringMatrix'.  The
+  string-based API is unchanged; the full object array is still
+  available as the 'array' attribute, but is decoded on demand and
+  so read-only (assign via item assignment or 'setRows()' instead).
+  """
+
+  def __init__(self,
+               rowCount=None,
+               colList=None,
+               extraList=None,
+               colSep='\t',
+               headerLines=None):
+      """Constructor for EncodedStringMatrix.
+
+      Takes the same arguments as 'StringMatrix'."""
+
+      self.colList = colList[:]
+      
+      self.colCount = len(self.colList)
+      self.rowCount = rowCount
+
+      if extraList:
+          self.extraList = extraList[:]
+          self.extraCount = len(self.extraList)
+      else:
+          self.extraList = None
+          self.extraCount = 0
+
+      self.colSep = colSep
+      self.headerLines = headerLines
+
+      # metadata stays as objects, alleles are stored as codes
+      self.extraArray = zeros((self.rowCount, self.extraCount), dtype='O')
+      self.codes = zeros((self.rowCount, self.colCount*2), dtype=np.int16)
+
+      # per-locus dictionaries: code -> allele and allele -> code
+      self.alleleLabels = [[0] for col in self.colList]
+      self.alleleCodes = [{0: 0} for col in self.colList]
+
+      self.shape = (self.rowCount, self.colCount*2+self.extraCount)
+      self.dtype = np.dtype('O')
+      self._typecode = self.dtype
+      self.name = str(self.__class__).split()[0]
+
+  def __setattr__(self, attr, value):
+      # attributes are stored on the instance, rather than being
+      # forwarded to the (decoded) array as 'container' does
+      object.__setattr__(self, attr, value)
+
+  def __len__(self):
+      return self.rowCount
+
+  def _getArray(self):
+      # a fresh decoding, writes to it would be silently lost
+      array = self._getColumns(range(self.shape[1]))
+      array.setflags(write=False)
+      return array
+
+  def _setArray(self, array):
+      # re-encode a full object array from scratch
+      self.rowCount, cols = array.shape
+      self.shape = (self.rowCount, cols)
+      self.extraArray = array[:, :self.extraCount].copy()
+      self.codes = zeros((self.rowCount, self.colCount*2), dtype=np.int16)
+      self.alleleLabels = [[0] for col in self.colList]
+      self.alleleCodes = [{0: 0} for col in self.colList]
+      for pos in range(self.colCount*2):
+          self._encodeColumn(pos, array[:, self.extraCount + pos].tolist())
+
+  array = property(_getArray, _setArray)
+
+  def _labelArray(self, locusPos):
+      """Returns the allele labels of a locus as an object array.
+
+      *For internal use only.*"""
+      labels = self.alleleLabels[locusPos]
+      labelArray = np.empty(len(labels), dtype='O')
+      labelArray[:] = labels
+      return labelArray
+
+  def _encode(self, locusPos, allele):
+      """Returns the code for an allele, adding it if necessary.
+
+      *For internal use only.*"""
+      codes = self.alleleCodes[locusPos]
+      if allele not in codes:
+          labels = self.alleleLabels[locusPos]
+          codes[allele] = len(labels)
+          labels.append(allele)
+          self._checkCodeType(len(labels))
+      return codes[allele]
+
+  def _checkCodeType(self, labelCount):
+      """Promote the code array if 'labelCount' codes no longer fit.
+
+      *For internal use only.*"""
+      if labelCount > np.iinfo(self.codes.dtype).max:
+          self.codes = self.codes.astype(np.int32)
+
+  def _encodeColumn(self, pos, column):
+      """Encode a list of alleles into allele column 'pos'.
+
+      *For internal use only.*"""
+      locusPos = pos // 2
+      codes = self.alleleCodes[locusPos]
+      labels = self.alleleLabels[locusPos]
+      # add new alleles in order of first appearance
+      for allele in dict.fromkeys(column):
+          if allele not in codes:
+              codes[allele] = len(labels)
+              labels.append(allele)
+      self._checkCodeType(len(labels))
+      self.codes[:, pos] = np.fromiter(map(codes.__getitem__, column),
+                                       dtype=self.codes.dtype,
+                                       count=len(column))
+
+  def _getColumns(self, cols):
+      result = zeros((self.rowCount, len(cols)), dtype='O')
+      for i, col in enumerate(cols):
+          if col < self.extraCount:
+              result[:, i] = self.extraArray[:, col]
+          else:
+              pos = col - self.extraCount
+              result[:, i] = self._labelArray(pos // 2)[self.codes[:, pos]]
+      return result
+
+  def setRows(self, rows):
+      if len(rows) == 0:
+          return
+      for col in range(self.extraCount):
+          self.extraArray[:, col] = [row[col] for row in rows]
+      for pos in range(self.colCount*2):
+          col = self.extraCount + pos
+          self._encodeColumn(pos, [row[col] for row in rows])
+
+  def __getitem__(self, key):
+      if type(key) == tuple:
+          # same column arithmetic as StringMatrix
+          row, colName = key
+          if colName in self.colList:
+              col = self.extraCount+self.colList.index(colName)
+          else:
+              raise KeyError("can't find %s column" % colName)
+          return self._getColumns((col,))[row, 0]
+      else:
+          return StringMatrix.__getitem__(self, key)
+
+  def __setitem__(self, index, value):
+      if type(index) == tuple:
+          row, colName = index
+      else:
+          raise IndexError("index is not a tuple")
+      if type(value) == tuple:
+          value1, value2 = value
+      elif type(value) != str:
+          raise ValueError("value being assigned is not a tuple")
+
+      if colName in self.colList:
+          locusPos = self.colList.index(colName)
+          self.codes[row, locusPos*2] = self._encode(locusPos, value1)
+          self.codes[row, locusPos*2+1] = self._encode(locusPos, value2)
+      elif colName in self.extraList:
+          self.extraArray[row, self.extraList.index(colName)] = value
+      else:
+          raise KeyError("can't find %s column" % colName)
+
+  def copy(self):
+      """Make a (deep) copy of the EncodedStringMatrix"""
+      thecopy = EncodedStringMatrix(self.rowCount,
+                                    self.colList,
+                                    self.extraList,
+                                    self.colSep,
+                                    self.headerLines)
+      thecopy.extraArray = self.extraArray.copy()
+      thecopy.codes = self.codes.copy()
+      thecopy.alleleLabels = [labels[:] for labels in self.alleleLabels]
+      thecopy.alleleCodes = [codes.copy() for codes in self.alleleCodes]
+      return thecopy
+
+  def getNewStringMatrix(self, key):
+      colNames = key.split(":")
+
+      newLocusPos = []; newColList = []
+      newExtraPos = []; newExtraList = []
+      for col in colNames:
+          if col in self.colList:
+              newLocusPos.append(self.colList.index(col))
+              newColList.append(col)
+          elif col in self.extraList:
+              newExtraPos.append(self.extraList.index(col))
+              newExtraList.append(col)
+          else:
+              raise KeyError("can't find %s column" % col)
+
+      newMatrix = EncodedStringMatrix(rowCount=self.rowCount,
+                                      colList=newColList,
+                                      extraList=newExtraList,
+                                      colSep=self.colSep,
+                                      headerLines=self.headerLines)
+
+      # copy just the columns we requested, along with their dictionaries
+      newMatrix.extraArray = self.extraArray[:, newExtraPos]
+      codePos = []
+      for locusPos in newLocusPos:
+          codePos.extend([locusPos*2, locusPos*2+1])
+      newMatrix.codes = self.codes[:, codePos]
+      newMatrix.alleleLabels = [self.alleleLabels[pos][:] for pos in newLocusPos]
+      newMatrix.alleleCodes = [self.alleleCodes[pos].copy() for pos in newLocusPos]
+      return newMatrix
+
+  def getAlleleCodes(self, key=None):
+      # sort the (few) allele labels rather than the decoded alleles,
+      # then remap the stored codes through a lookup array
+      if key == None:
+          colNames = self.colList
+      else:
+          colNames = key.split(":")
+
+      alleleCodes = {}
+      for colName in colNames:
+          if colName not in self.colList:
+              raise KeyError("can't find %s column" % colName)
+          locusPos = self.colList.index(colName)
+          labels = self.alleleLabels[locusPos]
+          codes = self.codes[:, locusPos*2:locusPos*2+2]
+
+          # only labels still in use, by position of first appearance;
+          # distinct labels may have the same string form (e.g. 0 and '0')
+          present, first = np.unique(codes.ravel(), return_index=True)
+          firstSeen = {}
+          for code, pos in zip(present.tolist(), first.tolist()):
+              allele = str(labels[code])
+              firstSeen[allele] = min(pos, firstSeen.get(allele, pos))
+          uniqueAlleles = sorted(firstSeen, key=lambda allele: (natural_sort_key(allele), firstSeen[allele]))
+
+          rank = dict(zip(uniqueAlleles, range(1, len(uniqueAlleles) + 1)))
+          lookup = np.zeros(len(labels), dtype=int)
+          for code in present.tolist():
+              lookup[code] = rank[str(labels[code])]
+          alleleCodes[colName] = (uniqueAlleles, lookup[codes])
+      return alleleCodes
+
+  def convertToInts(self, alleleCodes=None):
+      if alleleCodes == None:
+          alleleCodes = self.getAlleleCodes()
+
+      # the 1-based integer codes become both the new codes and
+      # the new labels
+      newMatrix = self.copy()
+      for locusPos in range(self.colCount):
+          uniqueAlleles, codes = alleleCodes[self.colList[locusPos]]
+          labelCount = len(uniqueAlleles) + 1
+          newMatrix._checkCodeType(labelCount)
+          newMatrix.codes[:, locusPos*2:locusPos*2+2] = codes
+          newMatrix.alleleLabels[locusPos] = list(range(labelCount))
+          newMatrix.alleleCodes[locusPos] = dict(zip(range(labelCount), range(labelCount)))
+
+      return newMatrix
+
+  def getRowMatrix(self, rows):
+      rows = np.asarray(rows, dtype=int)
+      newMatrix = EncodedStringMatrix(rowCount=len(rows),
+                                      colList=self.colList,
+                                      extraList=self.extraList,
+                                      colSep=self.colSep,
+                                      headerLines=self.headerLines)
+      newMatrix.extraArray = self.extraArray[rows]
+      newMatrix.codes = self.codes[rows]
+      newMatrix.alleleLabels = [labels[:] for labels in self.alleleLabels]
+      newMatrix.alleleCodes = [codes.copy() for codes in self.alleleCodes]
+      return newMatrix
+
+  def countPairs(self):
+      if self.extraCount > 0:
+          return StringMatrix.countPairs(self)
+
+      # codes are unique per allele within a locus, so compare
+      # the integer codes directly
+      h1 = self.codes[:, 0::2]
+      h2 = self.codes[:, 1::2]
+      n_het = np.sum(np.not_equal(h1, h2), 1)
+      n_het = np.where(n_het == 0, 1, n_het)
+      n_pairs = 2 ** (n_het - 1)
+
+      return n_pairs.tolist()
+      
+
 class Group:
   # group a list or sequence by a given size
   # example usage:
@@ -738,6 +1093,23 @@ class Group:
 
 ### global FUNCTIONS start here
 
+def _factorizeAlleles(alleles):
+    """Returns natural-sorted unique alleles and their 1-based codes.
+
+    'alleles' is a NumPy array of strings; ties in the natural sort
+    are broken by first appearance (in row order).
+
+    *For internal use only.*"""
+    flat = alleles.ravel()
+    labels, first, inverse = np.unique(flat, return_index=True,
+                                       return_inverse=True)
+    order = sorted(range(len(labels)),
+                   key=lambda i: (natural_sort_key(str(labels[i])), first[i]))
+    rank = np.empty(len(labels), dtype=int)
+    rank[order] = np.arange(1, len(labels) + 1)
+    codes = rank[inverse.ravel()].reshape(alleles.shape)
+    return [str(labels[i]) for i in order], codes
+
 def natural_sort_key(s, _nsre=re.compile('([0-9]+)')):
     return [int(text) if text.isdigit() else text.lower()
             for text in re.split(_nsre, s)]
@@ -267,8 +267,8 @@ return for each prompt.""")
                          version=version,
                          testMode=testMode)
 
-      xmlOutPaths.append(application.getXmlOutPath())
-      txtOutPaths.append(application.getTxtOutPath())
+      xmlOutPaths.extend(application.getXmlOutPaths())
+      txtOutPaths.extend(application.getTxtOutPaths())
 
     if generateTSV:
 
@@ -56,6 +56,9 @@ MODIFICATIONS.
   <text col="dememorizationSteps">Dememorization steps</text>
   <text col="samplingNum">Number of Markov chain samples</text>
   <text col="samplingSize">Markov chain sample size</text>
+  <text col="chains">Number of Markov chains</text>
+  <text col="stepsUsed">Steps used before stopping</text>
+  <text col="precision">Precision (half-width of p-value interval)</text>
   <text col="steps">Steps in Monte-Carlo randomization</text>
   <text col="pvalue">p-value</text>
   <text col="stderr">Std. error</text>
@@ -738,6 +741,11 @@ MODIFICATIONS.
        <xsl:when test="not(@type)">mcmc</xsl:when>
        <xsl:otherwise><xsl:value-of select="@type"/></xsl:otherwise>
       </xsl:choose>
+      <!-- two allele loci are tested exactly rather than by sampling -->
+      <xsl:if test="@method">
+       <xsl:text>, </xsl:text>
+       <xsl:value-of select="@method"/>
+      </xsl:if>
       <xsl:text>)</xsl:text>
       <xsl:choose>
        <xsl:when test="@allelelump=0 or not(@allelelump)"></xsl:when>
@@ -770,6 +778,24 @@ MODIFICATIONS.
        </xsl:when>
       </xsl:choose>
 
+      <!-- test chosen by the planner, to fit in the time budget -->
+      <xsl:if test="plan">
+       <xsl:text>Test chosen by planner: </xsl:text>
+       <xsl:value-of select="plan/@engine"/>
+       <xsl:text> (time budget: </xsl:text>
+       <xsl:value-of select="plan/@timeBudget"/>
+       <xsl:text>s, estimated tables: </xsl:text>
+       <xsl:value-of select="plan/@estimatedTables"/>
+       <xsl:text>, estimated time: </xsl:text>
+       <xsl:value-of select="plan/@estimatedSeconds"/>
+       <xsl:text>s</xsl:text>
+       <xsl:if test="plan/@approximate='1'">
+        <xsl:text>; estimates are approximate</xsl:text>
+       </xsl:if>
+       <xsl:text>)</xsl:text>
+       <xsl:call-template name="newline"/>
+      </xsl:if>
+
       <!-- if we are doing MCMC calculate *total steps* to allow comparison with MC-only -->
       <xsl:if test="dememorizationSteps">
        <xsl:text>Total steps in MCMC: </xsl:text>
@@ -778,7 +804,7 @@ MODIFICATIONS.
       </xsl:if>
       
       <xsl:for-each
-       select="stderr|dememorizationSteps|samplingNum|samplingSize|steps">
+       select="stderr|dememorizationSteps|samplingNum|samplingSize|chains|steps|stepsUsed|precision">
        <xsl:variable name="node-name" select="name(.)"/>
        <xsl:value-of 
 	select="$hw-guo-thompson[@col=$node-name]"/>  
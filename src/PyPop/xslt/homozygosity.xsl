@@ -131,6 +131,12 @@ MODIFICATIONS.
        <xsl:with-param name="type" select="'two-tailed'"/>
       </xsl:call-template>
 
+      <xsl:if test="replicates">
+       <xsl:call-template name="newline"/>
+       <xsl:text>Replicates used: </xsl:text>
+       <xsl:value-of select="replicates"/>
+      </xsl:if>
+
       <!--
       <xsl:call-template name="newline"/>
       <xsl:text>Theta: </xsl:text>
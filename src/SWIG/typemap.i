@@ -304,7 +304,8 @@ MODIFICATIONS. */
 #ifdef DEBUG
   printf("mallocing the new double OutList of size: %ld\n", PyInt_AsLong($input));
 #endif
-  $2 = (double*) malloc(PyInt_AsLong($input)*sizeof(double));
+  $1 = (int) PyInt_AsLong($input);
+  $2 = (double*) malloc($1*sizeof(double));
 }
 
 %typemap(freearg) (int len, double *OutList) {
@@ -354,7 +355,8 @@ MODIFICATIONS. */
 #ifdef DEBUG
   printf("mallocing the new int OutList of size: %ld\n", PyInt_AsLong($input));
 #endif
-  $2 = (int*) malloc(PyInt_AsLong($input)*sizeof(int));
+  $1 = (int) PyInt_AsLong($input);
+  $2 = (int*) malloc($1*sizeof(int));
 }
 
 %typemap(freearg) (int len, int *OutList) {
@@ -0,0 +1,80 @@
+# This file was automatically generated by SWIG (https://www.swig.org).
+# Version 4.1.1
+#
+# Do not make changes to this file unless you know what you are doing - modify
+# the SWIG interface file instead.
+
+from sys import version_info as _swig_python_version_info
+# Import the low-level C/C++ module
+if __package__ or "." in __name__:
+    from . import _Emhaplofreq
+else:
+    import _Emhaplofreq
+
+try:
+    import builtins as __builtin__
+except ImportError:
+    import __builtin__
+
+def _swig_repr(self):
+    try:
+        strthis = "proxy of " + self.this.__repr__()
+    except __builtin__.Exception:
+        strthis = ""
+    return "<%s.%s; %s >" % (self.__class__.__module__, self.__class__.__name__, strthis,)
+
+
+def _swig_setattr_nondynamic_instance_variable(set):
+    def set_instance_attr(self, name, value):
+        if name == "this":
+            set(self, name, value)
+        elif name == "thisown":
+            self.this.own(value)
+        elif hasattr(self, name) and isinstance(getattr(type(self), name), property):
+            set(self, name, value)
+        else:
+            raise AttributeError("You cannot add instance attributes to %s" % self)
+    return set_instance_attr
+
+
+def _swig_setattr_nondynamic_class_variable(set):
+    def set_class_attr(cls, name, value):
+        if hasattr(cls, name) and not isinstance(getattr(cls, name), property):
+            set(cls, name, value)
+        else:
+            raise AttributeError("You cannot add class attributes to %s" % cls)
+    return set_class_attr
+
+
+def _swig_add_metaclass(metaclass):
+    """Class decorator for adding a metaclass to a SWIG wrapped class - a slimmed down version of six.add_metaclass"""
+    def wrapper(cls):
+        return metaclass(cls.__name__, cls.__bases__, cls.__dict__.copy())
+    return wrapper
+
+
+class _SwigNonDynamicMeta(type):
+    """Meta class to enforce nondynamic attributes (no new attributes) for a class"""
+    __setattr__ = _swig_setattr_nondynamic_class_variable(type.__setattr__)
+
+
+NAME_LEN = _Emhaplofreq.NAME_LEN
+LINE_LEN = _Emhaplofreq.LINE_LEN
+MAX_ROWS = _Emhaplofreq.MAX_ROWS
+MAX_ALLELES = _Emhaplofreq.MAX_ALLELES
+MAX_LOCI = _Emhaplofreq.MAX_LOCI
+MAX_COLS = _Emhaplofreq.MAX_COLS
+MAX_GENOS = _Emhaplofreq.MAX_GENOS
+MAX_HAPLOS = _Emhaplofreq.MAX_HAPLOS
+CRITERION = _Emhaplofreq.CRITERION
+MAX_ITER = _Emhaplofreq.MAX_ITER
+FALSE = _Emhaplofreq.FALSE
+TRUE = _Emhaplofreq.TRUE
+MAX_INIT = _Emhaplofreq.MAX_INIT
+MAX_GENOS_PER_PHENO = _Emhaplofreq.MAX_GENOS_PER_PHENO
+MAX_PERMU = _Emhaplofreq.MAX_PERMU
+MAX_INIT_FOR_PERMU = _Emhaplofreq.MAX_INIT_FOR_PERMU
+
+def main_proc(arg1, arg2, arg3, arg4, arg5, arg6, arg7, arg8, arg9, arg10, arg11, arg12, arg13):
+    return _Emhaplofreq.main_proc(arg1, arg2, arg3, arg4, arg5, arg6, arg7, arg8, arg9, arg10, arg11, arg12, arg13)
+
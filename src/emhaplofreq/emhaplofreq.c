@@ -43,6 +43,27 @@ MODIFICATIONS. */
 
 #include "emhaplofreq.h"
 
+#include "thread_local.h"
+
+#if !(defined(_WIN32) || defined(__WIN32__) || defined(_WIN64) || defined(__WIN64__))
+/* 
+ * srand48()/drand48() share one generator between all threads, so
+ * use erand48() on a per-thread state instead: seeded the same way,
+ * it gives the same sequence of numbers
+ */
+static THREAD_LOCAL unsigned short rand48_state[3];
+
+static void seed_rand48(long seedval)
+{
+  rand48_state[0] = 0x330E;
+  rand48_state[1] = (unsigned short) (seedval & 0xFFFF);
+  rand48_state[2] = (unsigned short) ((seedval >> 16) & 0xFFFF);
+}
+
+#define srand48(x) seed_rand48(x)
+#define drand48() erand48(rand48_state)
+#endif
+
 /***************** begin: function prototypes ***************************/
 
 void print_usage(void);
@@ -357,11 +378,10 @@ int main_proc(
   /* int count = 0;      
      double temp = 0.0; */
 
-  /* these should be calloc'ed, but the stack will experience
-     meltdown: we initialize them with macro call after declarations
-     for re-entrancy */ 
-  static char geno[MAX_GENOS][2][LINE_LEN / 2];
-  static int gp[MAX_GENOS_PER_PHENO][MAX_ROWS];
+  /* too big for the stack, and can't be static if concurrent calls
+     from different threads are to be re-entrant, so calloc them */
+  CALLOC_ARRAY_DIM3(char, geno, MAX_GENOS, 2, LINE_LEN / 2);
+  CALLOC_ARRAY_DIM2(int, gp, MAX_GENOS_PER_PHENO, MAX_ROWS);
   /* gp[] stores the genotype-phenotype relationships, removed unused genopheno[] */
   /* the 1st dimension was changed from MAX_GENOS to MAX_GENOS_PER_PHENO          */
 
@@ -402,7 +422,7 @@ int main_proc(
   double haplo_freq_sum = 0.0;
 
   /* needed for multiple starting conditions */
-  int error_flag, error_flag_best, init_cond, iter_count, iter_count_best = 0;
+  int error_flag, error_flag_best, init_cond, iter_count = 0, iter_count_best = 0;
   double freq_sum, loglike, loglike_best = 0.0;
 
   CALLOC_ARRAY_DIM1(double, mle_best, MAX_HAPLOS);
@@ -428,11 +448,6 @@ int main_proc(
   /* default file pointers */
   FILE *fp_permu = FP_PERMU, *fp_iter = FP_ITER;
 
-  /* initialize elements of geno static arrays to make
-     function reentrant when used in a shared library */
-  
-  INIT_STATIC_DIM3(char, geno, MAX_GENOS, 2, (LINE_LEN/2));
-
   /******************* end: declarations ****************************/
 
   if (testing) {
@@ -1142,6 +1157,8 @@ int main_proc(
 #endif
   
   /* free calloc'ed space */
+  free(geno);
+  free(gp);
   free(buff);
   free(pheno);
   free(temp_geno);
@@ -1394,7 +1411,7 @@ void linkage_diseq(FILE * fp_out, double (*mle), int (*hl)[MAX_LOCI],
   int i, j, k, l, m, coeff_count = 0;
   double dmax, norm_dij = 0.0; 
 
-  static double dij[MAX_LOCI*(MAX_LOCI - 1)/2][MAX_ALLELES][MAX_ALLELES];
+  CALLOC_ARRAY_DIM3(double, dij, MAX_LOCI*(MAX_LOCI - 1)/2, MAX_ALLELES, MAX_ALLELES);
 
   CALLOC_ARRAY_DIM1(double, homz_f, MAX_LOCI); /* RS-ALD */	
   CALLOC_ARRAY_DIM1(double, summary_d, MAX_LOCI*(MAX_LOCI - 1)/2);
@@ -1409,9 +1426,6 @@ void linkage_diseq(FILE * fp_out, double (*mle), int (*hl)[MAX_LOCI],
   double diseq = 0.0; 
   double chisq = 0.0; 
 
-  /* zero out static array before each run to make code re-entrant */
-  INIT_STATIC_DIM3(double, dij, (MAX_LOCI*(MAX_LOCI-1)/2), \
-		   MAX_ALLELES, MAX_ALLELES);
 
   /* After 1st pass dij[coeff_count][locusA_allele#][locusB_allele#] */
   /*   contains Estimated 2-locus HFs based on full MLE HFs          */
@@ -1537,6 +1551,7 @@ void linkage_diseq(FILE * fp_out, double (*mle), int (*hl)[MAX_LOCI],
   }
 
   /* free calloc'ed space */
+  free(dij);
   free(summary_dprime);
   free(summary_q);
   free(summary_wn);
@@ -1675,6 +1690,8 @@ void emcalc(int *numgeno, int *obspheno,
   if (ambig_sum == 0)
   {
     iter = 1;
+    /* no E-M iterations are needed, report zero as before */
+    *iter_count = 0;
     //*error_flag = 1 is no longer used since ambig_sum=0 is not an error 8/23/03
     for (i = 0; i < n_haplo; i++)
     {
@@ -35,9 +35,12 @@ MODIFICATIONS. */
 %module Emhaplofreq
 
 %include "typemap.i"
+%include "threads.i"
 
 %include "emhaplofreq/emhaplofreq.h"
 
+RELEASE_GIL(main_proc)
+
 /* prototype for internal inclusion */
 %{
 extern int main_proc(char *, char *, int, int, int, int, int, int, int, int, int, char [], char []);  
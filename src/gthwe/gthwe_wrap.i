@@ -35,17 +35,21 @@ MODIFICATIONS. */
 %module Gthwe
 
 %include "typemap.i"
+%include "threads.i"
+
+RELEASE_GIL(run_data)
+RELEASE_GIL(run_randomization)
 
 /* 
  * Python entry point to program.
  */
 %{
-extern int run_data(int [], int [], int, int, int, int, int, char *, char *, int, int);
- extern int run_randomization(int [], int [], int, int, int, char *, int, int);
+extern int run_data(int [], int [], int, int, int, int, int, char *, char *, int, int, unsigned int, double [], int, double);
+ extern int run_randomization(int [], int [], int, int, int, char *, int, int, double [], int, double);
 %}
 
-extern int run_data(int [], int [], int, int, int, int, int, char *, char *, int, int);
-extern int run_randomization(int [], int [], int, int, int, char *, int, int);
+extern int run_data(int [], int [], int, int, int, int, int, char *, char *, int, int, unsigned int, double [], int, double);
+extern int run_randomization(int [], int [], int, int, int, char *, int, int, double [], int, double);
 
 /* 
  * Local variables:
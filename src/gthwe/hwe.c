@@ -50,7 +50,51 @@ MODIFICATIONS. */
 #include "func.h"
 #include <math.h>
 
-unsigned long tausval, congrval;
+THREAD_LOCAL unsigned long tausval, congrval;
+
+/* init_rand() seeds from rand(), whose state is shared by all
+   threads, so hold a lock while seeding (the Windows C runtime
+   already keeps rand() state per-thread) */
+#if defined(_WIN32)
+#define LOCK_RAND()
+#define UNLOCK_RAND()
+#else
+#include <pthread.h>
+static pthread_mutex_t rand_lock = PTHREAD_MUTEX_INITIALIZER;
+#define LOCK_RAND()   pthread_mutex_lock(&rand_lock)
+#define UNLOCK_RAND() pthread_mutex_unlock(&rand_lock)
+#endif
+
+/* sequential stopping: minimum number of chunks (MCMC), or steps and
+   interval between checks (plain Monte-Carlo), before stopping early */
+#define SEQ_MIN_GROUPS   10
+#define SEQ_MIN_STEPS    10000
+#define SEQ_CHECK_STEPS  1000
+
+/* 
+ * binomial_se(): standard error of a proportion of 'count' out of
+ * 'steps', kept away from zero when no (or all) steps are counted
+ */
+static double binomial_se(long count, double steps)
+{
+  double p = (count + 1.0) / (steps + 2.0);
+  return sqrt(p * (1.0 - p) / steps);
+}
+
+/* 
+ * interval_excludes(): true if the interval p +/- z*se excludes all
+ * of the 'num_thresholds' significance thresholds, so that more
+ * steps can't change which side of any threshold the p-value is on
+ */
+static int interval_excludes(double p, double se, double z,
+			     double *thresholds, int num_thresholds)
+{
+  int t;
+  for (t = 0; t < num_thresholds; t++)
+    if (fabs(p - thresholds[t]) <= z * se)
+      return 0;
+  return 1;
+}
 
 /* correct execution of this program: gthwe infile outfile */
 int main(int argc, char *argv[])
@@ -86,7 +130,7 @@ int main(int argc, char *argv[])
   size = sample.size;
 
   /* pass the parsed variables to do the main processing */
-  run_data(genotypes, allele_array, no_allele, total, step, group, size, title, outfile, 1);
+  run_data(genotypes, allele_array, no_allele, total, step, group, size, title, outfile, 1, 0, 0, NULL, 0, 0.0);
 
   free(genotypes);
   free(allele_array);
@@ -94,9 +138,10 @@ int main(int argc, char *argv[])
 }
 
 /* 
- * init_rand(): initializes random number generator 
+ * init_rand(): initializes random number generator, from 'seed' if
+ * it is non-zero
  */
-long init_rand(int testing) 
+long init_rand(int testing, unsigned int seed) 
 {
   register int i, j;
   unsigned long xxx[12];
@@ -104,9 +149,14 @@ long init_rand(int testing)
   unsigned long  conorig=0;
   unsigned long  tauorig=0;
   long t1;
-  extern unsigned long congrval, tausval;
 
-  if (!testing) 
+  LOCK_RAND();
+  if (seed)
+    {
+      /* independent chains are each given their own seed */
+      srand(seed);
+    }
+  else if (!testing) 
     {
       srand(time(NULL)); 
     }
@@ -125,6 +175,7 @@ long init_rand(int testing)
       }
     
   }
+  UNLOCK_RAND();
   
   for (j = 0; j < 6; ++j) {
     tauorig =  (((tauorig + (xxx[j + 6] * (pow(2, (6 * j))))))) ;
@@ -146,6 +197,9 @@ long init_rand(int testing)
  * run_data(): does the main processing, given the data in variables,
  * this can be called by external programs or be made into an
  * extension function in languages like Python using SWIG.
+ *
+ * If 'num_thresholds' is non-zero, sampling stops early once the
+ * interval p +/- z*se excludes all of the 'thresholds'.
  */
 int run_data(int *genotypes, int *allele_array, int no_allele, 
 	     int total_individuals, int thestep, int thegroup, int thesize,
@@ -155,9 +209,11 @@ int run_data(int *genotypes, int *allele_array, int no_allele,
 #else
 	     FILE *outfile,
 #endif
-	     int header, int testing)
+	     int header, int testing, unsigned int seed,
+	     double *thresholds, int num_thresholds, double z)
 {
-  int actual_switch, counter;
+  int actual_switch, counter, groups;
+  long hits = 0;
   Index index;
   double ln_p_observed, ln_p_simulated, p_mean, p_square; 
   double constant, p_simulated, total_step;
@@ -175,7 +231,7 @@ int run_data(int *genotypes, int *allele_array, int no_allele,
   /* int *genotypes = (int *)calloc(genotypes, sizeof(int)); */
 
   /* do random number initialization */
-  t1 = init_rand(testing); 
+  t1 = init_rand(testing, seed); 
 
   /* reassemble struct */
   sample.step = thestep;
@@ -253,6 +309,7 @@ int run_data(int *genotypes, int *allele_array, int no_allele,
       ++result.swch_count[actual_switch];
     }
   
+  groups = sample.group;
   for (i = 0; i < sample.group; ++i)
     {
       counter = 0;
@@ -279,15 +336,25 @@ int run_data(int *genotypes, int *allele_array, int no_allele,
       p_simulated = (double) counter / sample.size;
       p_mean += p_simulated;
       p_square += p_simulated * p_simulated;
-      
+      hits += counter;
+
+      if (num_thresholds && (i + 1) >= SEQ_MIN_GROUPS && (i + 1) < sample.group) {
+	double mean = p_mean / (i + 1);
+	double se = sqrt(p_square / ((double) (i + 1)) / i - mean / i * mean);
+	se = fmax(se, binomial_se(hits, (double) (i + 1) * sample.size));
+	if (interval_excludes(mean, se, z, thresholds, num_thresholds)) {
+	  groups = i + 1;
+	  break;
+	}
+      }
     }
-  p_mean /= sample.group;
+  p_mean /= groups;
   result.p_value = p_mean;
-  result.se = p_square / ((double) sample.group) / (sample.group - 1.0)
-    - p_mean / (sample.group - 1.0) * p_mean;
+  result.se = p_square / ((double) groups) / (groups - 1.0)
+    - p_mean / (groups - 1.0) * p_mean;
   result.se = sqrt(result.se);
    
-  total_step = sample.step + sample.group * sample.size;
+  total_step = sample.step + groups * sample.size;
   
 #ifndef XML_OUTPUT
   fprintf(outfile, "Randomization test P-value: %7.4g  (%7.4g) \n",
@@ -309,6 +376,11 @@ int run_data(int *genotypes, int *allele_array, int no_allele,
   xmlfprintf(outfile, "<percent-all>%6.2f</percent-all>\n",
 	  (result.swch_count[1] + result.swch_count[2]) / total_step * 100);
   xmlfprintf(outfile, "</switches>\n");
+  if (num_thresholds) {
+    xmlfprintf(outfile, "<stepsUsed>%d</stepsUsed>\n", groups * sample.size);
+    xmlfprintf(outfile, "<precision>%g</precision>\n",
+	       z * fmax(result.se, binomial_se(hits, (double) groups * sample.size)));
+  }
 #endif
   
   stamp_time(t1, &outfile);
@@ -344,7 +416,8 @@ int run_randomization(int *genotypes, int *allele_array, int no_allele,
 #else
 		      FILE *outfile,
 #endif
-		      int header, int testing)
+		      int header, int testing,
+		      double *thresholds, int num_thresholds, double z)
 {
   double ln_p_observed; 
   double constant;
@@ -430,9 +503,12 @@ int run_randomization(int *genotypes, int *allele_array, int no_allele,
   const gsl_rng_type * T;
   gsl_rng * r;
   
+  /* gsl_rng_env_setup() sets the library-wide defaults */
+  LOCK_RAND();
   gsl_rng_env_setup();
   T = gsl_rng_default;
   r = gsl_rng_alloc (T);
+  UNLOCK_RAND();
 
   /* create empty genotype array */
   int *g = (int *)calloc(num_genotypes, sizeof(int));
@@ -499,6 +575,15 @@ int run_randomization(int *genotypes, int *allele_array, int no_allele,
     /* go through genotype list, reset genotype array, g  */
     for (i=0; i < num_genotypes; i++) 
       g[i] = 0;
+
+    /* stop early if enough steps to be sure of the p-value */
+    if (num_thresholds && (permu + 1) >= SEQ_MIN_STEPS && (permu + 1) < iterations
+	&& (permu + 1) % SEQ_CHECK_STEPS == 0
+	&& interval_excludes((double)K/(permu + 1), binomial_se(K, permu + 1), 
+			     z, thresholds, num_thresholds)) {
+      iterations = permu + 1;
+      break;
+    }
   }
 
   double p_value = (double)K/iterations;
@@ -506,6 +591,9 @@ int run_randomization(int *genotypes, int *allele_array, int no_allele,
 #ifdef XML_OUTPUT
   xmlfprintf(outfile, "<steps>%d</steps>\n", iterations);
   xmlfprintf(outfile, "<pvalue type=\"overall\">%g</pvalue>\n", p_value);
+  if (num_thresholds)
+    xmlfprintf(outfile, "<precision>%g</precision>\n", 
+	       z * binomial_se(K, iterations));
 #else
   fprintf(outfile, "K = %d, N = %d\n", K, iterations);
   fprintf(outfile, "pvalue = %g\n", p_value);
@@ -50,6 +50,8 @@ MODIFICATIONS. */
 #include <gsl/gsl_randist.h>
 #include <gsl/gsl_sys.h>
 
+#include "thread_local.h"
+
 #define  EPSILON     1e-6
 #define  GREATER_OR_EQUAL(a,b) (gsl_fcmp(a,b,EPSILON)>=0)
 #define  LESS_OR_EQUAL(a,b)    (gsl_fcmp(a,b,EPSILON)<=0)
@@ -97,4 +99,7 @@ struct randomization
   int step;  /* number of steps to de-memerization */
 };
 
+/* state of the Splus style random number generator, see new_rand() */
+extern THREAD_LOCAL unsigned long tausval, congrval;
+
 
@@ -43,7 +43,6 @@ MODIFICATIONS. */
 
 double new_rand()
 		{
-	extern unsigned long congrval, tausval;
 	unsigned long n, lambda = 69069;
 		congrval = congrval * lambda;
 		tausval ^=tausval >> 15;
@@ -0,0 +1,70 @@
+# This file was automatically generated by SWIG (https://www.swig.org).
+# Version 4.1.1
+#
+# Do not make changes to this file unless you know what you are doing - modify
+# the SWIG interface file instead.
+
+from sys import version_info as _swig_python_version_info
+# Import the low-level C/C++ module
+if __package__ or "." in __name__:
+    from . import _Haplostats
+else:
+    import _Haplostats
+
+try:
+    import builtins as __builtin__
+except ImportError:
+    import __builtin__
+
+def _swig_repr(self):
+    try:
+        strthis = "proxy of " + self.this.__repr__()
+    except __builtin__.Exception:
+        strthis = ""
+    return "<%s.%s; %s >" % (self.__class__.__module__, self.__class__.__name__, strthis,)
+
+
+def _swig_setattr_nondynamic_instance_variable(set):
+    def set_instance_attr(self, name, value):
+        if name == "this":
+            set(self, name, value)
+        elif name == "thisown":
+            self.this.own(value)
+        elif hasattr(self, name) and isinstance(getattr(type(self), name), property):
+            set(self, name, value)
+        else:
+            raise AttributeError("You cannot add instance attributes to %s" % self)
+    return set_instance_attr
+
+
+def _swig_setattr_nondynamic_class_variable(set):
+    def set_class_attr(cls, name, value):
+        if hasattr(cls, name) and not isinstance(getattr(cls, name), property):
+            set(cls, name, value)
+        else:
+            raise AttributeError("You cannot add class attributes to %s" % cls)
+    return set_class_attr
+
+
+def _swig_add_metaclass(metaclass):
+    """Class decorator for adding a metaclass to a SWIG wrapped class - a slimmed down version of six.add_metaclass"""
+    def wrapper(cls):
+        return metaclass(cls.__name__, cls.__bases__, cls.__dict__.copy())
+    return wrapper
+
+
+class _SwigNonDynamicMeta(type):
+    """Meta class to enforce nondynamic attributes (no new attributes) for a class"""
+    __setattr__ = _swig_setattr_nondynamic_class_variable(type.__setattr__)
+
+
+
+def haplo_em_pin_wrap(xn_loci, xn_subject, xweight, xn_alleles, xmax_haps, xmax_iter, xloci_insert_order, xmin_prior, xmin_posterior, xtol, xinsert_batch_size, xrandom_start, xiseed1, xiseed2, xiseed3, xverbose, xgeno_vec):
+    return _Haplostats.haplo_em_pin_wrap(xn_loci, xn_subject, xweight, xn_alleles, xmax_haps, xmax_iter, xloci_insert_order, xmin_prior, xmin_posterior, xtol, xinsert_batch_size, xrandom_start, xiseed1, xiseed2, xiseed3, xverbose, xgeno_vec)
+
+def haplo_em_ret_info_wrap(xS_n_u_hap, xn_loci, xn_hap_pairs, arg4, arg5, arg6, arg7, arg8, arg9, arg10):
+    return _Haplostats.haplo_em_ret_info_wrap(xS_n_u_hap, xn_loci, xn_hap_pairs, arg4, arg5, arg6, arg7, arg8, arg9, arg10)
+
+def haplo_free_memory():
+    return _Haplostats.haplo_free_memory()
+
@@ -52,11 +52,13 @@
 
 
 /*************** Global vars ******************************************************/
+/* per-thread, so that haplo_em_pin(), haplo_em_ret_info() and
+   haplo_free_memory() from one thread see only that thread's results */
 
-static int n_loci, *loci_used;               /* used for qsort functions         */   
-static HAP **ret_hap_list;                    /* stored for later return to S+    */
-static HAPUNIQUE **ret_u_hap_list;
-static int ret_n_hap, ret_n_u_hap, ret_max_haps;
+static THREAD_LOCAL int n_loci, *loci_used;  /* used for qsort functions         */   
+static THREAD_LOCAL HAP **ret_hap_list;       /* stored for later return to S+    */
+static THREAD_LOCAL HAPUNIQUE **ret_u_hap_list;
+static THREAD_LOCAL int ret_n_hap, ret_n_u_hap, ret_max_haps;
 
 /**********************************************************************************/
 
@@ -1122,7 +1124,7 @@ void haplo_free_memory(void){
     Translated from fortran to C.
 */
 
-static int ix, iy, iz;
+static THREAD_LOCAL int ix, iy, iz;
 
 static int ranAS183_seed(int iseed1, int iseed2, int iseed3)
 {
@@ -59,7 +59,9 @@ typedef struct HAPUNIQUE_T {
   double prior;
 } HAPUNIQUE;
 
-static int iminarg1, iminarg2;
+#include "thread_local.h"
+
+static THREAD_LOCAL int iminarg1, iminarg2;
 
 # define imin(a,b) (iminarg1=(a), iminarg2=(b), \
 		    (iminarg1) < (iminarg2) ? (iminarg1) : (iminarg2) )
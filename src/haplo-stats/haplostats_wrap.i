@@ -33,6 +33,9 @@ MODIFICATIONS. */
 
 %module Haplostats
 %include "typemap.i"
+%include "threads.i"
+
+RELEASE_GIL(haplo_em_pin_wrap)
 
 /* prototype for internal inclusion */
 %{
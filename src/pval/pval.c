@@ -39,6 +39,14 @@ double pval(double chisq, double df) {
   return 1 - pchisq(chisq, df, TRUE, FALSE);
 }
 
+void pvals(double chisq[], double df, int len, double *OutList) {
+  /* p-values for 'len' chi-square values with the same degrees of
+     freedom, in a single call */
+  int i;
+  for (i = 0; i < len; i++)
+    OutList[i] = pval(chisq[i], df);
+}
+
 int main(int argc, char **argv) {
   double df, chisq;
   
@@ -37,10 +37,51 @@ MODIFICATIONS. */
 %include "typemap.i"
 %{
 extern double pval(double x, double df);
+extern void pvals(double [], double, int, double *);
 %}
 
 extern double pval(double x, double df);
 
+/* returns the p-values for a sequence of chi-square values as a list,
+   the number of values is always taken from the sequence itself */
+%rename(pvals) pvals_list;
+%inline %{
+PyObject *pvals_list(PyObject *chisqs, double df) {
+  PyObject *seq, *result;
+  Py_ssize_t i, len;
+  double *values;
+
+  seq = PySequence_Fast(chisqs, "chi-square values must be a sequence");
+  if (!seq)
+    return NULL;
+  len = PySequence_Fast_GET_SIZE(seq);
+
+  values = (double *)malloc((len + 1) * sizeof(double));
+  if (!values) {
+    Py_DECREF(seq);
+    return PyErr_NoMemory();
+  }
+  for (i = 0; i < len; i++) {
+    values[i] = PyFloat_AsDouble(PySequence_Fast_GET_ITEM(seq, i));
+    if (values[i] == -1.0 && PyErr_Occurred()) {
+      free(values);
+      Py_DECREF(seq);
+      return NULL;
+    }
+  }
+  Py_DECREF(seq);
+
+  /* each p-value only depends on the chi-square value it replaces */
+  pvals(values, df, (int)len, values);
+
+  result = PyList_New(len);
+  for (i = 0; result && i < len; i++)
+    PyList_SET_ITEM(result, i, PyFloat_FromDouble(values[i]));
+  free(values);
+  return result;
+}
+%}
+
 /*
  * Local variables:
  * mode: c
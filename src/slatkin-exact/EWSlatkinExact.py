@@ -0,0 +1,82 @@
+# This file was automatically generated by SWIG (https://www.swig.org).
+# Version 4.1.1
+#
+# Do not make changes to this file unless you know what you are doing - modify
+# the SWIG interface file instead.
+
+from sys import version_info as _swig_python_version_info
+# Import the low-level C/C++ module
+if __package__ or "." in __name__:
+    from . import _EWSlatkinExact
+else:
+    import _EWSlatkinExact
+
+try:
+    import builtins as __builtin__
+except ImportError:
+    import __builtin__
+
+def _swig_repr(self):
+    try:
+        strthis = "proxy of " + self.this.__repr__()
+    except __builtin__.Exception:
+        strthis = ""
+    return "<%s.%s; %s >" % (self.__class__.__module__, self.__class__.__name__, strthis,)
+
+
+def _swig_setattr_nondynamic_instance_variable(set):
+    def set_instance_attr(self, name, value):
+        if name == "this":
+            set(self, name, value)
+        elif name == "thisown":
+            self.this.own(value)
+        elif hasattr(self, name) and isinstance(getattr(type(self), name), property):
+            set(self, name, value)
+        else:
+            raise AttributeError("You cannot add instance attributes to %s" % self)
+    return set_instance_attr
+
+
+def _swig_setattr_nondynamic_class_variable(set):
+    def set_class_attr(cls, name, value):
+        if hasattr(cls, name) and not isinstance(getattr(cls, name), property):
+            set(cls, name, value)
+        else:
+            raise AttributeError("You cannot add class attributes to %s" % cls)
+    return set_class_attr
+
+
+def _swig_add_metaclass(metaclass):
+    """Class decorator for adding a metaclass to a SWIG wrapped class - a slimmed down version of six.add_metaclass"""
+    def wrapper(cls):
+        return metaclass(cls.__name__, cls.__bases__, cls.__dict__.copy())
+    return wrapper
+
+
+class _SwigNonDynamicMeta(type):
+    """Meta class to enforce nondynamic attributes (no new attributes) for a class"""
+    __setattr__ = _swig_setattr_nondynamic_class_variable(type.__setattr__)
+
+
+
+def main_proc(r_obs, k, n, maxrep):
+    return _EWSlatkinExact.main_proc(r_obs, k, n, maxrep)
+
+def main_proc_range(r_obs, k, n, firstrep, maxrep):
+    return _EWSlatkinExact.main_proc_range(r_obs, k, n, firstrep, maxrep)
+
+def get_theta():
+    return _EWSlatkinExact.get_theta()
+
+def get_prob_ewens():
+    return _EWSlatkinExact.get_prob_ewens()
+
+def get_prob_homozygosity():
+    return _EWSlatkinExact.get_prob_homozygosity()
+
+def get_mean_homozygosity():
+    return _EWSlatkinExact.get_mean_homozygosity()
+
+def get_var_homozygosity():
+    return _EWSlatkinExact.get_var_homozygosity()
+
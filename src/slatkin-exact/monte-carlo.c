@@ -53,11 +53,14 @@ find out for yourself.
 #define KLIMIT 100 /* changed from original 40--seen what HLA-B is up to now? */
 #define NR_END 1
 
+#include "thread_local.h"
+
 /* function prototypes for Slatkin's original */
 void print_results(int, int, int);
 double unif(void);
 void gsrand(int);
 int grand(void);
+int gskip(int, long);
 
 /* function prototypes for returning values to Python caller */
 double get_theta(void);
@@ -70,10 +73,11 @@ double get_var_homozygosity(void);
 int double_comp(const void *, const void *);
 int quantile_print(double *, int);
 
-static int seed;
+static THREAD_LOCAL int seed;
 
-/* declare static global variables */
-static double theta, P_E, P_H, E_F, Var_F, F_obs;
+/* declare static global variables, kept per-thread so that the
+   get_*() calls return the results of this thread's main_proc() */
+static THREAD_LOCAL double theta, P_E, P_H, E_F, Var_F, F_obs;
 
 int main(int argc, char **argv)
 {
@@ -149,6 +153,20 @@ int main(int argc, char **argv)
 }
 
 int main_proc(int r_obs[], int k, int n, int maxrep)
+{
+  int main_proc_range(int r_obs[], int k, int n, int firstrep, int maxrep);
+
+  return main_proc_range(r_obs, k, n, 0, maxrep);
+}
+
+/* run replicates firstrep, ..., firstrep + maxrep - 1 of the full
+   sequence started from initseed, so that a run can be split into
+   blocks (e.g. one per thread) that together give exactly the same
+   replicates as running them all at once.  Each replicate uses k - 1
+   random numbers, so the generator is skipped ahead by that much for
+   each of the first firstrep replicates.  The results returned by the
+   get_*() functions are for this block of maxrep replicates only */
+int main_proc_range(int r_obs[], int k, int n, int firstrep, int maxrep)
 {
   int initseed = 13840399;
   int i, j, repno, Ecount, Fcount;
@@ -168,7 +186,7 @@ int main_proc(int r_obs[], int k, int n, int maxrep)
   double Ftot, Fsq_tot;	/* added by DM */
   double *Fvalues;
 
-  gsrand(initseed);
+  gsrand(gskip(initseed, (long)firstrep * (k - 1)));
 
   r_random = ivector(0, k + 1);
   r_random[0] = r_random[k + 1] = 0;
@@ -442,6 +460,22 @@ void gsrand(int s)
   seed = s;
 }
 
+/* return the seed after 'steps' calls to grand() starting from 's',
+   i.e. s * A^steps mod M, by repeated squaring */
+int gskip(int s, long steps)
+{
+  unsigned long long result = s, mult = A;
+
+  while (steps > 0)
+  {
+    if (steps & 1)
+      result = (result * mult) % M;
+    mult = (mult * mult) % M;
+    steps >>= 1;
+  }
+  return ((int)result);
+}
+
 #define RM 2147483647.0
 
 double unif(void)			/* This is drand renamed to be consistent with my usage  */
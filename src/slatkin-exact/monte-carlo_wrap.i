@@ -3,8 +3,14 @@
 %module EWSlatkinExact
 
 %include "typemap.i"
+%include "threads.i"
+
+RELEASE_GIL(main_proc)
+RELEASE_GIL(main_proc_range)
+
 %{
 extern int main_proc(int r_obs[], int k, int n, int maxrep);
+extern int main_proc_range(int r_obs[], int k, int n, int firstrep, int maxrep);
 extern double get_theta();
 extern double get_prob_ewens();
 extern double get_prob_homozygosity();
@@ -13,6 +19,7 @@ extern double get_var_homozygosity();
 %}
 
 extern int main_proc(int r_obs[], int k, int n, int maxrep);
+extern int main_proc_range(int r_obs[], int k, int n, int firstrep, int maxrep);
 extern double get_theta();
 extern double get_prob_ewens();
 extern double get_prob_homozygosity();
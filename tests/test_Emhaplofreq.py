@@ -0,0 +1,36 @@
+import base
+import io
+import re
+from PyPop.Haplo import Emhaplofreq
+from PyPop.Utils import StringMatrix, XMLOutputStream
+
+def run_haplotypes(rows):
+    matrix = StringMatrix(len(rows), ['A', 'B'])
+    matrix.setRows(rows)
+    out = io.StringIO()
+    haplo = Emhaplofreq(matrix, stream=XMLOutputStream(out), testMode=True)
+    haplo.estHaplotypes(locusKeys='A:B', numInitCond=5)
+    return out.getvalue()
+
+def test_Emhaplofreq_unambiguous():
+    # every individual is homozygous at A, so all phases are known and
+    # no E-M iterations are run
+    rows = [['01', '01', '02', '03'],
+            ['01', '01', '03', '03'],
+            ['04', '04', '02', '05'],
+            ['04', '04', '05', '05'],
+            ['01', '01', '02', '02']]
+    for i in range(10):
+        output = run_haplotypes(rows)
+        iterations = re.findall('<iterConverged>(-?[0-9]+)</iterConverged>', output)
+        assert iterations and set(iterations) == set(['0'])
+
+def test_Emhaplofreq_ambiguous():
+    rows = [['01', '02', '03', '04'],
+            ['01', '01', '03', '03'],
+            ['02', '02', '04', '04'],
+            ['01', '02', '03', '03'],
+            ['01', '02', '04', '04']]
+    output = run_haplotypes(rows)
+    iterations = re.findall('<iterConverged>(-?[0-9]+)</iterConverged>', output)
+    assert iterations and all([int(i) > 0 for i in iterations])
@@ -0,0 +1,115 @@
+import base
+import pytest
+from PyPop.Utils import StringMatrix, EncodedStringMatrix
+from PyPop.DataTypes import Genotypes, GenotypeCounts
+
+def new_matrix(matrixClass=StringMatrix):
+    matrix = matrixClass(5, ['A', 'B'], ['id'])
+    matrix.setRows([['1', '02', '01', 'X', 'Y'],
+                    ['2', '01', '01', '****', 'Y'],
+                    ['3', '****', '03', 'Y', 'N'],
+                    ['4', '10', '02', 'N', 'Y'],
+                    ['5', '02', '10', '****', '****']])
+    return matrix
+
+@pytest.mark.parametrize("matrixClass", [StringMatrix, EncodedStringMatrix])
+def test_Genotypes_counts(matrixClass):
+    genotypes = Genotypes(matrix=new_matrix(matrixClass), unsequencedSite='N')
+
+    alleleTable, total, untyped, unsequenced = genotypes.getAlleleCountAt('A')
+    # allele order is order of first appearance
+    assert list(alleleTable.items()) == [('02', 3), ('01', 3), ('10', 2)]
+    assert (total, untyped, unsequenced) == (8, 1, 0)
+    # genotypes are sorted alphabetically within each individual
+    assert genotypes.getLocusDataAt('A') == [('01', '02'), ('01', '01'), ('02', '10'), ('02', '10')]
+
+    alleleTable, total, untyped, unsequenced = genotypes.getAlleleCountAt('B')
+    assert list(alleleTable.items()) == [('X', 1), ('Y', 1)]
+    assert (total, untyped, unsequenced) == (2, 2, 2)
+    assert genotypes.getLocusDataAt('B') == [('X', 'Y')]
+
+    assert genotypes.getAlleleCountAt('A', lumpValue=2) == ({'02': 3, '01': 3, 'lump': 2}, 8, 1, 0)
+    assert genotypes.getLocusDataAt('A', lumpValue=2)[2] == ('02', 'lump')
+    assert genotypes.totalLociWithData == 2
+
+def test_Genotypes_encoded(monkeypatch):
+    # an encoded matrix is counted from its codes, without decoding
+    def decode(self, cols):
+        raise AssertionError(cols)
+    monkeypatch.setattr(EncodedStringMatrix, '_getColumns', decode)
+    for lazy in (0, 1):
+        genotypes = Genotypes(matrix=new_matrix(EncodedStringMatrix), unsequencedSite='N', lazy=lazy)
+        assert genotypes.totalLociWithData == 2
+        assert list(genotypes.getAlleleCountAt('A')[0].items()) == [('02', 3), ('01', 3), ('10', 2)]
+        assert genotypes.getLocusDataAt('A') == [('01', '02'), ('01', '01'), ('02', '10'), ('02', '10')]
+
+@pytest.mark.parametrize("matrixClass", [StringMatrix, EncodedStringMatrix])
+def test_Genotypes_semityped(matrixClass):
+    genotypes = Genotypes(matrix=new_matrix(matrixClass), unsequencedSite='N', allowSemiTyped=1)
+
+    alleleTable, total, untyped, unsequenced = genotypes.getAlleleCountAt('A')
+    assert list(alleleTable.items()) == [('02', 3), ('01', 3), ('03', 1), ('10', 2)]
+    assert (total, untyped, unsequenced) == (9, 0.5, 0)
+    # all individuals are kept, including untyped alleles
+    assert len(genotypes.getLocusDataAt('A')) == 5
+    assert genotypes.getLocusDataAt('A')[2] == ('****', '03')
+
+    alleleTable, total, untyped, unsequenced = genotypes.getAlleleCountAt('B')
+    assert list(alleleTable.items()) == [('X', 1), ('Y', 4)]
+    assert (total, untyped) == (5, 1.5)
+
+@pytest.mark.parametrize("allowSemiTyped", [0, 1])
+def test_Genotypes_lazy(allowSemiTyped):
+    matrix = new_matrix()
+    matrix.setRows([row[:3] + ['****', '****'] for row in matrix['id:A:B']])
+    eager = Genotypes(matrix=matrix, unsequencedSite='N', allowSemiTyped=allowSemiTyped)
+    lazy = Genotypes(matrix=matrix, unsequencedSite='N', allowSemiTyped=allowSemiTyped, lazy=1)
+
+    # nothing is computed until needed
+    assert lazy.freqcount == {} and lazy.locusTable == {}
+    assert lazy.totalLociWithData == eager.totalLociWithData == 1
+    assert lazy.freqcount == {}
+
+    assert lazy.getAlleleCountAt('B') == eager.getAlleleCountAt('B')
+    assert list(lazy.freqcount.keys()) == ['B']
+    assert lazy.locusTable == {}
+    assert lazy.getLocusDataAt('A', lumpValue=2) == eager.getLocusDataAt('A', lumpValue=2)
+    assert lazy.getLocusData() == eager.getLocusData()
+    assert lazy.getAlleleCount() == eager.getAlleleCount()
+
+def test_Genotypes_lumped_views():
+    genotypes = Genotypes(matrix=new_matrix(), unsequencedSite='N', lazy=1)
+
+    lumped = genotypes.getLocusDataAt('A', lumpValue=2)
+    assert lumped == [('01', '02'), ('01', '01'), ('02', 'lump'), ('02', 'lump')]
+    counts = genotypes.getAlleleCountAt('A', lumpValue=2)
+    assert list(counts[0].items()) == [('02', 3), ('01', 3), ('lump', 2)]
+
+    # each view is only built once, callers get their own copies
+    lumped.append(('99', '99'))
+    counts[0]['lump'] = 0
+    assert genotypes.getLocusDataAt('A', lumpValue=2)[-1] == ('02', 'lump')
+    assert genotypes.getAlleleCountAt('A', lumpValue=2)[0]['lump'] == 2
+    assert list(genotypes.lumpedTables.keys()) == [('A', 2)]
+    assert list(genotypes.lumpedCounts.keys()) == [('A', 2)]
+
+def test_GenotypeCounts():
+    table = GenotypeCounts(locusData=[('02', '10'), ('01', '02'), ('02', '02'), ('01', '02')])
+    assert (table.n, table.k) == (4, 3)
+    assert table.alleles == ['02', '10', '01']
+    assert table.sortedAlleles == ['01', '02', '10']
+    assert table.counts.tolist() == [[0, 2, 0], [0, 1, 1], [0, 0, 0]]
+    # lower-triangular: 01/01, 02/01, 02/02, 10/01, 10/02, 10/10
+    assert table.packed.tolist() == [0, 2, 1, 0, 1, 0]
+
+@pytest.mark.parametrize("lumpValue", [0, 2])
+def test_GenotypeCounts_from_Genotypes(lumpValue):
+    genotypes = Genotypes(matrix=new_matrix(), unsequencedSite='N', lazy=1)
+    table = genotypes.getGenotypeCountsAt('A', lumpValue)
+    expected = GenotypeCounts(locusData=genotypes.getLocusDataAt('A', lumpValue))
+
+    assert genotypes.getGenotypeCountsAt('A', lumpValue) is table
+    assert table.alleles == expected.alleles
+    assert table.sortedAlleles == expected.sortedAlleles
+    assert table.counts.tolist() == expected.counts.tolist()
+    assert table.packed.tolist() == expected.packed.tolist()
@@ -163,6 +163,21 @@ def test_Haplostats_UchiTelleClassI():
     assert status2 == 0
 
 
+def test_Haplostats_threads():
+    # the EM runs without the GIL, and keeps its state per-thread, so
+    # concurrent runs should give the same results as serial ones
+    from concurrent.futures import ThreadPoolExecutor
+
+    geno_vec = [3, 2, 1, 4, 5, 6, 4, 7, 4, 6, 7, 1, 2, 1, 4, 6, 3, 7, 3, 5 ]
+    runs = [(2, 5, [1.0] * 5, [7, 7], 18, 5000, [0, 1], 0.0, 0.000000001, 0.00001, 2,
+             random_start, iseed1, 16090, 14502, 0, geno_vec)
+            for random_start in [0, 1] for iseed1 in [18717, 101, 2024]]
+
+    serial = [call_Haplostats(*args) for args in runs]
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        threaded = list(executor.map(lambda args: call_Haplostats(*args), runs * 4))
+    assert threaded == serial * 4
+
 def test_Haplostats_PyPopStringMatrix():
     """
     This is the same numerical example as test_Haplostats_Simple()
@@ -0,0 +1,329 @@
+import base
+import io
+import math
+import pytest
+import numpy as np
+from PyPop.Utils import StringMatrix, XMLOutputStream
+from PyPop.DataTypes import Genotypes, GenotypeCounts
+from PyPop.HardyWeinberg import HardyWeinberg, HardyWeinbergBiallelic, HardyWeinbergGuoThompson, \
+     HardyWeinbergEnumeration, planExactTest, makeGuoThompsonTest, _lnTableCount, _chenStatistics, \
+     calibrateExactTestTimings, _referenceTimings
+from PyPop import _Pvalue
+
+# 20 individuals: 01/01 x 6, 01/02 x 8, 02/02 x 2, 01/03 x 3, 02/03 x 1
+LOCUS_DATA = [('01', '01')] * 6 + [('01', '02')] * 8 + [('02', '02')] * 2 + \
+             [('01', '03')] * 3 + [('02', '03')]
+ALLELE_COUNT = ({'01': 23, '02': 13, '03': 4}, 40, 0, 0)
+
+def serialize(hw):
+    f = io.StringIO()
+    hw.serializeTo(XMLOutputStream(f))
+    return f.getvalue()
+
+def test_HardyWeinberg_tables():
+    hw = HardyWeinberg(LOCUS_DATA, ALLELE_COUNT, lumpBelow=5)
+
+    assert (hw.totalHomsObs, hw.totalHetsObs) == (8, 12)
+    assert hw.hetsObservedByAllele == {'01': 11, '02': 9, '03': 4}
+    # N * p^2 and 2N * p * q
+    assert hw.expectedGenotypeCounts[hw.genotypeIndex[0, 0]] == pytest.approx(20 * 0.575 ** 2)
+    assert hw.expectedGenotypeCounts[hw.genotypeIndex[0, 1]] == pytest.approx(2 * 20 * 0.575 * 0.325)
+    assert hw.hetsExpectedByAllele['03'] == pytest.approx(2 * 20 * 0.1 * (0.575 + 0.325))
+
+    # only 01/01 (6.61) and 01/02 (7.48) have at least 5 expected
+    assert (hw.commonGenotypeCounter, hw.rareGenotypeCounter) == (2, 4)
+    assert hw.commonObservedAccumulator == 14
+    assert hw.lumpedObservedGenotypes == 6
+    assert hw.commonChisqAccumulator == pytest.approx(
+        (6 - 6.6125) ** 2 / 6.6125 + (8 - 7.475) ** 2 / 7.475)
+
+def test_HardyWeinberg_genotypeCounts():
+    # the shared table from Genotypes gives the same output as the
+    # genotype list
+    matrix = StringMatrix(len(LOCUS_DATA), ['A'])
+    matrix.setRows([list(genotype) for genotype in reversed(LOCUS_DATA)])
+    genotypes = Genotypes(matrix=matrix, lazy=1)
+
+    for lumpValue in [0, 4]:
+        fromList = HardyWeinberg(genotypes.getLocusDataAt('A', lumpValue),
+                                 genotypes.getAlleleCountAt('A', lumpValue),
+                                 lumpBelow=1, flagChenTest=1)
+        fromTable = HardyWeinberg(alleleCount=genotypes.getAlleleCountAt('A', lumpValue),
+                                  genotypeCounts=genotypes.getGenotypeCountsAt('A', lumpValue),
+                                  lumpBelow=1, flagChenTest=1)
+        assert serialize(fromList) == serialize(fromTable)
+
+def test_Pvalue_pvals():
+    chisqs = [0.0, 0.5, 3.84, 10.83, 250.0]
+    for df in [1, 3]:
+        assert _Pvalue.pvals(chisqs, df) == [_Pvalue.pval(chisq, df) for chisq in chisqs]
+    assert _Pvalue.pvals([], 1) == []
+    # the length always comes from the sequence, there's no separate count
+    assert _Pvalue.pvals((1.0, 2.0), 1) == [_Pvalue.pval(1.0, 1), _Pvalue.pval(2.0, 1)]
+    with pytest.raises(TypeError):
+        _Pvalue.pvals([1.0, 2.0], 1, 5)
+    with pytest.raises(TypeError):
+        _Pvalue.pvals([1.0, 'x'], 1)
+
+def chen_statistic(i, j, p, genotypes, n):
+    # Chen's chi-square for one genotype, as per 'gthwe'
+    p_ij, p_ii, p_jj = genotypes[i][j] / n, genotypes[i][i] / n, genotypes[j][j] / n
+    if i != j:
+        d = p[i] * p[j] - 0.5 * p_ij
+        var = (p[i] * p[j] * ((1 - p[i]) * (1 - p[j]) + p[i] * p[j])
+               + p[i] ** 2 * (p_jj - p[j] ** 2) + p[j] ** 2 * (p_ii - p[i] ** 2)) / (2 * n)
+    else:
+        d = p[i] ** 2 - p_ii
+        var = (p[i] ** 4 - 2 * p[i] ** 3 + p[i] ** 2) / n
+    return d * d / var
+
+def test_chenStatistics():
+    counts = GenotypeCounts(locusData=LOCUS_DATA)
+    p = (counts.counts.sum(0) + counts.counts.sum(1)) / 40.0
+    chisqs = _chenStatistics(p, counts.counts, 40)
+    for i in range(3):
+        for j in range(3):
+            assert chisqs[i, j] == pytest.approx(chen_statistic(i, j, p, counts.counts.tolist(), 20))
+
+    # a stack of tables gives the statistics for each table
+    tables = np.array([counts.counts, counts.counts.T, np.diag([10, 4, 2]) + np.tril(np.ones((3, 3)), -1)])
+    stacked = _chenStatistics(p, tables, 40)
+    assert stacked.shape == (3, 3, 3)
+    for table, chisqs in zip(tables, stacked):
+        assert chisqs.tolist() == _chenStatistics(p, table, 40).tolist()
+
+    # and 'HardyWeinberg' uses them for the observed genotypes
+    hw = HardyWeinberg(LOCUS_DATA, ALLELE_COUNT, lumpBelow=5, flagChenTest=1)
+    for (i, j), pval in hw.chenPvalByGenotype.items():
+        assert counts.counts[i, j] > 0
+        assert pval == pytest.approx(_Pvalue.pval(chen_statistic(i, j, p, counts.counts.tolist(), 20), 1))
+
+def enumerate_biallelic(homs0, hets, homs1):
+    # probability of every table with the same allele counts, from the
+    # multinomial formula directly
+    n = homs0 + hets + homs1
+    alleles0, alleles1 = 2 * homs0 + hets, 2 * homs1 + hets
+    tables = []
+    for h in range(alleles0 % 2, min(alleles0, alleles1) + 1, 2):
+        x, y = (alleles0 - h) // 2, (alleles1 - h) // 2
+        lnProb = math.lgamma(n + 1) - math.lgamma(x + 1) - math.lgamma(h + 1) - math.lgamma(y + 1) \
+                 + h * math.log(2) + math.lgamma(alleles0 + 1) + math.lgamma(alleles1 + 1) - math.lgamma(2 * n + 1)
+        tables.append(((x, h, y), math.exp(lnProb)))
+    observed = dict(tables)[(homs0, hets, homs1)]
+    return sum([prob for table, prob in tables if prob <= observed * (1 + 1e-9)]), observed
+
+@pytest.mark.parametrize("homs0, hets, homs1", [(10, 5, 3), (0, 20, 0), (50, 0, 50), (1, 2, 30), (100, 91, 22)])
+def test_HardyWeinbergBiallelic(homs0, hets, homs1):
+    locusData = [('01', '01')] * homs0 + [('01', '02')] * hets + [('02', '02')] * homs1
+    alleleCount = ({'01': 2 * homs0 + hets, '02': 2 * homs1 + hets}, 2 * len(locusData), 0, 0)
+    hw = HardyWeinbergBiallelic(locusData, alleleCount, runMCMCTest=1)
+
+    exactPValue, observedPValue = enumerate_biallelic(homs0, hets, homs1)
+    assert hw.exactPValue == pytest.approx(exactPValue)
+    assert hw.observedPValue == pytest.approx(observedPValue)
+
+    f = io.StringIO()
+    hw.dumpTable('A', XMLOutputStream(f))
+    assert f.getvalue().startswith('<hardyweinbergGuoThompson allelelump="0" method="exact">')
+    assert '<pvalue type="overall">%g</pvalue>' % hw.exactPValue in f.getvalue()
+    assert f.getvalue().count('type="genotype"') == 6
+
+def enumerate_tables(alleleCounts):
+    # every genotype table with these allele counts, as a dictionary
+    # of genotype counts, with its probability from Levene's formula
+    k = len(alleleCounts)
+    n = sum(alleleCounts) // 2
+    pairs = [(i, j) for i in range(k) for j in range(i)]
+    lnNorm = math.lgamma(n + 1) - math.lgamma(2 * n + 1) + sum([math.lgamma(m + 1) for m in alleleCounts])
+    tables = []
+    def fill(p, remaining, table):
+        if p == len(pairs):
+            if all([r % 2 == 0 for r in remaining]):
+                table = table | dict([((i, i), r // 2) for i, r in enumerate(remaining)])
+                lnProb = lnNorm + sum([x * math.log(2) * (i != j) - math.lgamma(x + 1)
+                                       for (i, j), x in table.items()])
+                tables.append((table, math.exp(lnProb)))
+            return
+        i, j = pairs[p]
+        for hets in range(min(remaining[i], remaining[j]) + 1):
+            left = list(remaining)
+            left[i] -= hets
+            left[j] -= hets
+            fill(p + 1, left, table | {(i, j): hets})
+    fill(0, list(alleleCounts), {})
+    return tables
+
+@pytest.mark.parametrize("locusData", [
+    LOCUS_DATA,
+    [('01', '01')] * 3 + [('01', '02')] * 2 + [('02', '03')] * 4 + [('03', '04')] * 2 + [('04', '04')] * 3,
+    [('01', '02')] * 7 + [('03', '03')] * 5 + [('02', '04')] + [('01', '01')] * 2 + [('04', '05')] * 2,
+    [('01', '01')] * 10 + [('01', '02')] * 5 + [('02', '02')] * 3])
+def test_HardyWeinbergEnumeration(locusData):
+    counts = GenotypeCounts(locusData=locusData)
+    alleleCount = (dict(zip(counts.alleles, (counts.counts.sum(0) + counts.counts.sum(1)).tolist())),
+                   2 * len(locusData), 0, 0)
+    hw = HardyWeinbergEnumeration(locusData, alleleCount, doOverall=1, runMCMCTest=1)
+    index = lambda i, j: (max(i, j) * (max(i, j) + 1) // 2) + min(i, j)
+    tables = [([table[max(i, j), min(i, j)] for i in range(hw.k) for j in range(i + 1)], prob)
+              for table, prob in enumerate_tables(hw.alleleArray)]
+    observed = dict([(tuple(table), prob) for table, prob in tables])[tuple(hw.flattenedMatrix)]
+
+    assert sum([prob for table, prob in tables]) == pytest.approx(1.0)
+    assert hw.observedPValue == pytest.approx(observed)
+    assert hw.exactPValue == pytest.approx(sum([prob for table, prob in tables
+                                                if prob <= observed * (1 + 1e-9)]))
+
+    # the genotype p-values are the same as over all tables
+    for i in range(hw.k):
+        for j in range(i + 1):
+            diffs, chens = hw._genotypeStatistics(i, j, *np.array([[table[index(i, j)], table[index(i, i)], table[index(j, j)]]
+                                                                     for table, prob in tables]).T)
+            statistics = hw._genotypeStatistics(i, j, hw.flattenedMatrix[index(i, j)],
+                                                hw.flattenedMatrix[index(i, i)],
+                                                hw.flattenedMatrix[index(j, j)])
+            for pvals, stats, stat in [(hw.diffPvals, diffs, statistics[0]), (hw.chenPvals, chens, statistics[1])]:
+                assert pvals[index(i, j)] == pytest.approx(
+                    sum([prob for s, (table, prob) in zip(stats, tables) if not s < stat * (1 - 1e-9)]))
+
+    # which don't need the overall p-value, and match the two allele test
+    threeByThree = HardyWeinbergEnumeration(locusData, alleleCount, doOverall=0)
+    assert threeByThree.diffPvals == pytest.approx(hw.diffPvals)
+    assert threeByThree.chenPvals == pytest.approx(hw.chenPvals)
+    if hw.k == 2:
+        biallelic = HardyWeinbergBiallelic(locusData, alleleCount)
+        assert biallelic.exactPValue == pytest.approx(hw.exactPValue)
+        assert biallelic.diffPvals == pytest.approx(hw.diffPvals)
+        assert biallelic.chenPvals == pytest.approx(hw.chenPvals)
+
+def test_HardyWeinbergGuoThompson_chains():
+    pytest.importorskip("PyPop._Gthwe")
+
+    def run():
+        hw = HardyWeinbergGuoThompson(LOCUS_DATA, ALLELE_COUNT, runMCMCTest=1,
+                                      dememorizationSteps=100, samplingNum=20,
+                                      samplingSize=100, numChains=3, testing=True)
+        f = io.StringIO()
+        hw.dumpTable('A', XMLOutputStream(f))
+        return f.getvalue()
+
+    output = run()
+    assert '<samplingNum>20</samplingNum>' in output
+    assert '<chains>3</chains>' in output
+    pvalue = float(output.split('<pvalue type="overall">')[1].split('<')[0])
+    assert 0 <= pvalue <= 1
+    assert output.count('type="genotype"') == 12
+    # chains are seeded deterministically in testing mode
+    assert run() == output
+
+def test_HardyWeinbergGuoThompson_stopping():
+    pytest.importorskip("PyPop._Gthwe")
+    # strong heterozygote deficit, so p-value is clearly below 0.01
+    locusData = [('01', '01')] * 40 + [('02', '02')] * 30 + [('01', '02')] * 20 + \
+                [('01', '03')] * 5 + [('03', '03')] * 4
+    alleleCount = ({'01': 105, '02': 80, '03': 13}, 198, 0, 0)
+
+    for numChains in [1, 2]:
+        hw = HardyWeinbergGuoThompson(locusData, alleleCount, runMCMCTest=1, runPlainMCTest=1,
+                                      dememorizationSteps=100, samplingNum=1000, samplingSize=100,
+                                      monteCarloSteps=1000000, numChains=numChains,
+                                      stopThresholds=[0.01, 0.05],
+                                      monteCarloStopThresholds=[0.01, 0.05], testing=True)
+        f = io.StringIO()
+        hw.dumpTable('A', XMLOutputStream(f))
+        output = f.getvalue()
+
+        # both tests stop well short of their budgets
+        stepsUsed = int(output.split('<stepsUsed>')[1].split('<')[0])
+        steps = int(output.split('<steps>')[1].split('<')[0])
+        assert stepsUsed < 1000 * 100
+        assert steps < 1000000
+        assert output.count('<precision>') == 2
+        for pvalue in output.split('<pvalue type="overall">')[1:]:
+            assert float(pvalue.split('<')[0]) < 0.01
+
+def count_tables(alleleCounts):
+    # count genotype tables by brute force: every choice of
+    # heterozygote counts that leaves an even number of each allele
+    k = len(alleleCounts)
+    pairs = [(i, j) for i in range(k) for j in range(i)]
+    def count(p, remaining):
+        if p == len(pairs):
+            return int(all([r % 2 == 0 for r in remaining]))
+        i, j = pairs[p]
+        total = 0
+        for hets in range(min(remaining[i], remaining[j]) + 1):
+            left = list(remaining)
+            left[i] -= hets
+            left[j] -= hets
+            total += count(p + 1, left)
+        return total
+    return count(0, list(alleleCounts))
+
+@pytest.mark.parametrize("alleleCounts", [[23, 13, 4], [13, 20, 13], [8, 3, 3, 4, 20], [10, 9, 12, 9]])
+def test_lnTableCount(alleleCounts):
+    # the estimate should be well within a factor of two
+    estimate = math.exp(_lnTableCount(alleleCounts))
+    assert 0.5 < estimate / count_tables(alleleCounts) < 2
+
+def test_planExactTest():
+    counts = GenotypeCounts(locusData=LOCUS_DATA)
+    tables = count_tables([23, 13, 4])
+
+    plan = planExactTest(counts, 10, enumeration=1, timings=_referenceTimings())
+    assert plan['engine'] == 'enumeration'
+    assert 0.5 < plan['estimatedTables'] / tables < 2
+
+    # without enumeration, the Markov chain is cut to fit the budget
+    plan = planExactTest(counts, 10, enumeration=0, timings=_referenceTimings())
+    assert (plan['engine'], plan['samplingNum']) == ('mcmc', 1000)
+    plan = planExactTest(counts, 0.1, enumeration=0, timings=_referenceTimings())
+    assert plan['engine'] == 'mcmc' and 100 <= plan['samplingNum'] < 1000
+    assert plan['estimatedSeconds'] <= 0.1
+
+    # too little time, or too large a matrix, for the Markov chain
+    for kw in [dict(timeBudget=0.01), dict(timeBudget=10, maxMatrixSize=5)]:
+        plan = planExactTest(counts, enumeration=0, timings=_referenceTimings(), **kw)
+        assert plan['engine'] == 'monte-carlo'
+        assert 10000 <= plan['monteCarloSteps'] <= 1000000
+
+def test_calibrateExactTestTimings():
+    timings = calibrateExactTestTimings()
+    reference = _referenceTimings()
+    assert timings.keys() == reference.keys()
+    for engine in timings:
+        assert 0.1 <= timings[engine][0] / reference[engine][0] <= 10
+    # the enumeration exponent is not rescaled
+    assert timings['enumeration'][1] == reference['enumeration'][1]
+
+    # calibrated once per process
+    assert calibrateExactTestTimings() is timings
+    counts = GenotypeCounts(locusData=LOCUS_DATA)
+    assert planExactTest(counts, 10) == planExactTest(counts, 10, timings=timings)
+
+def test_makeGuoThompsonTest():
+    locusData = [('01', '01')] * 10 + [('01', '02')] * 5 + [('02', '02')] * 3
+    alleleCount = ({'01': 25, '02': 11}, 36, 0, 0)
+    hw = makeGuoThompsonTest(GenotypeCounts(locusData=locusData), locusData=locusData,
+                             alleleCount=alleleCount, runMCMCTest=1, runPlainMCTest=1, timeBudget=1,
+                             timings=_referenceTimings())
+    assert isinstance(hw, HardyWeinbergBiallelic)
+
+    # only the chosen test is run, and the plan is recorded
+    f = io.StringIO()
+    hw.dumpTable('A', XMLOutputStream(f))
+    assert f.getvalue().count('<hardyweinbergGuoThompson') == 1
+    assert '<plan engine="enumeration" approximate="1" timeBudget="1" estimatedTables="6" ' in f.getvalue()
+
+    # few enough tables to enumerate them all in the budget
+    hw = makeGuoThompsonTest(GenotypeCounts(locusData=LOCUS_DATA), locusData=LOCUS_DATA,
+                             alleleCount=ALLELE_COUNT, runMCMCTest=1, timeBudget=0.01,
+                             timings=_referenceTimings())
+    assert isinstance(hw, HardyWeinbergEnumeration) and hw.doOverall
+    assert hw.plan['estimatedSeconds'] <= 0.01
+
+    hw = makeGuoThompsonTest(GenotypeCounts(locusData=LOCUS_DATA), locusData=LOCUS_DATA,
+                             alleleCount=ALLELE_COUNT, runMCMCTest=1, timeBudget=1e-5,
+                             timings=_referenceTimings())
+    assert type(hw) == HardyWeinbergGuoThompson
+    assert (hw.runMCMCTest, hw.runPlainMCTest) == (0, 1)
+    assert hw.monteCarloSteps == hw.plan['monteCarloSteps'] < 1000000
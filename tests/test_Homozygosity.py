@@ -0,0 +1,264 @@
+import base
+import os
+import pytest
+import numpy as np
+from PyPop.Utils import XMLOutputStream
+from PyPop.Homozygosity import Homozygosity, HomozygosityEWSlatkinExact, HOMOZYGOSITY_INDEX, \
+     compileHomozygosityIndex, getHomozygosityIndex, EWSlatkinCache, runEwensMonteCarlo, \
+     _stewartTable, _sampleEwens
+from PyPop import _EWSlatkinExact
+import PyPop.Homozygosity as Homozygosity_module
+
+def write_table(rootPath, twoEn, k, count, quantiles):
+    # same layout as the simulated tables
+    path = os.path.join(rootPath, '2n%d' % twoEn)
+    os.makedirs(path, exist_ok=True)
+    with open(os.path.join(path, '%d_%d.out' % (k, twoEn)), 'w') as f:
+        f.write('count: %d\n' % count)
+        f.write('expected: %g\n' % (1.0 / k + twoEn / 1e5))
+        f.write('variance: %g\n' % (0.01 / k))
+        f.write('quantiles:\n')
+        for i in range(quantiles):
+            f.write('%.4f %.4f\n' % (0.9 - i * 0.1, 0.01 * (i + 1)))
+        f.write('\n')
+        f.write('ignored after blank line\n')
+
+def make_tables(rootPath):
+    write_table(rootPath, 100, 5, 10000, 5)
+    write_table(rootPath, 100, 6, 10000, 8)
+    write_table(rootPath, 2000, 5, 10000, 3)
+    # too few replicates to be used
+    write_table(rootPath, 30, 3, 500, 0)
+
+def stats(hz):
+    return (hz.canGenerateExpectedStats(), hz.getObservedHomozygosity(),
+            hz.count, hz.expectedHomozygosity, hz.varExpectedHomozygosity,
+            hz.quantile, hz.getPValueRange() if hz.canGenerateExpectedStats() else None)
+
+@pytest.mark.parametrize("alleleData", [[30, 20, 20, 15, 13], [17] * 6, [400, 600, 500, 300, 200], [10, 10, 10]])
+def test_Homozygosity_index(tmp_path, monkeypatch, alleleData):
+    rootPath = str(tmp_path / 'tables')
+    make_tables(rootPath)
+
+    # the index is compiled on first use, and gives the same as the
+    # tables themselves
+    hz = Homozygosity(alleleData, rootPath=rootPath)
+    assert os.path.exists(os.path.join(rootPath, HOMOZYGOSITY_INDEX))
+    index = compileHomozygosityIndex(rootPath, str(tmp_path / 'fresh.npy'))
+    assert (getHomozygosityIndex(rootPath) == index).all()
+
+    # once compiled, the tables aren't read again
+    def fail(path):
+        raise AssertionError(path)
+    monkeypatch.setattr(Homozygosity_module, '_readHomozygosityFile', fail)
+    assert stats(Homozygosity(alleleData, rootPath=rootPath)) == stats(hz)
+
+@pytest.mark.parametrize("change", ['edit', 'add', 'remove'])
+def test_Homozygosity_index_changed(tmp_path, monkeypatch, change):
+    rootPath = str(tmp_path / 'tables')
+    make_tables(rootPath)
+    assert Homozygosity([30, 20, 20, 15, 13], rootPath=rootPath).count == 10000
+    indexPath = os.path.join(rootPath, HOMOZYGOSITY_INDEX)
+
+    # an index that is still current is used as it is
+    monkeypatch.setattr(Homozygosity_module, '_homozygosityIndexes', {})
+    mtime = os.stat(indexPath).st_mtime_ns
+    Homozygosity([30, 20, 20, 15, 13], rootPath=rootPath)
+    assert os.stat(indexPath).st_mtime_ns == mtime
+
+    # tables changed after the index was compiled recompile it, the
+    # next time it is opened
+    path = os.path.join(rootPath, '2n100', '5_100.out')
+    if change == 'edit':
+        mtime = os.stat(path).st_mtime_ns
+        write_table(rootPath, 100, 5, 20000, 2)
+        os.utime(path, ns=(mtime + 10**9, mtime + 10**9))
+    elif change == 'add':
+        write_table(rootPath, 50, 4, 3000, 2)
+    else:
+        os.remove(path)
+    monkeypatch.setattr(Homozygosity_module, '_homozygosityIndexes', {})
+    index = getHomozygosityIndex(rootPath)
+    assert (index == compileHomozygosityIndex(rootPath, str(tmp_path / 'fresh.npy'))).all()
+    assert (np.load(indexPath) == index).all()
+    if change == 'edit':
+        hz = Homozygosity([30, 20, 20, 15, 13], rootPath=rootPath)
+        assert (hz.count, hz.quantile) == (20000, [(0.9, 0.01), (0.8, 0.02)])
+
+def test_Homozygosity_index_readonly(tmp_path, monkeypatch):
+    rootPath = str(tmp_path / 'tables')
+    make_tables(rootPath)
+
+    # if the index can't be saved, only the one table needed is read
+    def readonly(*args, **kw):
+        raise PermissionError(kw.get('dir'))
+    monkeypatch.setattr(Homozygosity_module.tempfile, 'mkstemp', readonly)
+    read = []
+    readHomozygosityFile = Homozygosity_module._readHomozygosityFile
+    def record(path):
+        read.append(os.path.relpath(path, rootPath))
+        return readHomozygosityFile(path)
+    monkeypatch.setattr(Homozygosity_module, '_readHomozygosityFile', record)
+
+    hz = Homozygosity([30, 20, 20, 15, 13], rootPath=rootPath)
+    assert getHomozygosityIndex(rootPath) is None
+    assert not os.path.exists(os.path.join(rootPath, HOMOZYGOSITY_INDEX))
+    assert (hz.count, hz.expectedHomozygosity) == (10000, 0.201)
+    assert read == [os.path.join('2n100', '5_100.out')]
+
+def test_Homozygosity_tables(tmp_path):
+    rootPath = str(tmp_path / 'tables')
+    make_tables(rootPath)
+
+    # 2n = 98 is rounded to 100
+    hz = Homozygosity([30, 20, 20, 15, 13], rootPath=rootPath)
+    assert hz.canGenerateExpectedStats()
+    assert (hz.count, hz.expectedHomozygosity, hz.varExpectedHomozygosity) == (10000, 0.201, 0.002)
+    assert hz.quantile == [(0.9, 0.01), (0.8, 0.02), (0.7, 0.03), (0.6, 0.04), (0.5, 0.05)]
+
+    # too few replicates
+    assert not Homozygosity([10, 10, 10], rootPath=rootPath).canGenerateExpectedStats()
+
+    # a table added after the index was compiled is read from its own file
+    write_table(rootPath, 50, 4, 3000, 2)
+    hz = Homozygosity([20, 10, 10, 10], rootPath=rootPath)
+    assert hz.canGenerateExpectedStats()
+    assert hz.quantile == [(0.9, 0.01), (0.8, 0.02)]
+
+def slatkin(alleleData, cache, numReplicates=1000, numThreads=1, engine='slatkin'):
+    hz = HomozygosityEWSlatkinExact(alleleData, numReplicates=numReplicates, cache=cache,
+                                    numThreads=numThreads, engine=engine)
+    hz.doCalcs(alleleData)
+    # all but the observed homozygosity, which is calculated directly
+    theta, probEwens, probHomozygosity, mean, observed, var = hz.getHomozygosity()
+    return theta, probEwens, probHomozygosity, mean, var
+
+def test_EWSlatkinCache(tmp_path, monkeypatch):
+    cacheDir = str(tmp_path / 'cache')
+    cache = EWSlatkinCache(maxSize=2, cacheDir=cacheDir)
+    results = slatkin([10, 5, 3, 2], cache)
+    _EWSlatkinExact.main_proc([0, 10, 5, 3, 2, 0], 4, 20, 1000)
+    assert results == (_EWSlatkinExact.get_theta(), _EWSlatkinExact.get_prob_ewens(),
+                       _EWSlatkinExact.get_prob_homozygosity(), _EWSlatkinExact.get_mean_homozygosity(),
+                       _EWSlatkinExact.get_var_homozygosity())
+    slatkin([10, 5, 3, 2], cache, numReplicates=2000)
+    assert len(os.listdir(cacheDir)) == 2
+
+    # the same counts in any order, from memory or disk, don't rerun
+    # the simulation
+    def fail(*args):
+        raise AssertionError("main_proc called")
+    monkeypatch.setattr(_EWSlatkinExact, 'main_proc_range', fail)
+    assert slatkin([2, 3, 10, 5], cache) == results
+    assert slatkin([5, 2, 10, 3], EWSlatkinCache(cacheDir=cacheDir)) == results
+    with pytest.raises(AssertionError):
+        slatkin([10, 5, 3, 2], EWSlatkinCache())
+    with pytest.raises(AssertionError):
+        slatkin([10, 5, 4, 1], cache)
+
+    # only the most recently used are kept in memory
+    cache.cacheDir = None
+    monkeypatch.undo()
+    slatkin([10, 5, 4, 1], cache)
+    assert len(cache.results) == 2
+    assert cache.get(cache.makeKey([10, 5, 3, 2], 2000)) == None
+    assert cache.get(cache.makeKey([10, 5, 3, 2], 1000))[:5] == results
+
+@pytest.mark.parametrize("alleleData", [[10, 5, 3, 2], [40, 30, 12, 9, 5, 3, 1, 1]])
+def test_HomozygosityEWSlatkinExact_threads(alleleData):
+    single = slatkin(alleleData, EWSlatkinCache(), numReplicates=1001)
+    for numThreads in [2, 3, 8]:
+        threaded = slatkin(alleleData, EWSlatkinCache(), numReplicates=1001, numThreads=numThreads)
+        # tail counts are identical, the pooled moments up to rounding
+        assert threaded[:3] == single[:3]
+        assert threaded[3:] == pytest.approx(single[3:], rel=1e-12)
+
+def generate(k, n, uniforms):
+    # the C code's table and sampling, one replicate at a time
+    b = [[0.0] * (n + 1) for i in range(k + 1)]
+    for j in range(1, n + 1):
+        b[1][j] = 1.0 / j
+    for i in range(2, k + 1):
+        b[i][i] = 1.0
+        for j in range(i, n):
+            b[i][j + 1] = (i * b[i - 1][j] + j * b[i][j]) / (j + 1.0)
+    counts = []
+    nleft = n
+    for l in range(1, k):
+        cum = 0.0
+        for i in range(1, nleft + 1):
+            cum += b[k - l][nleft - i] / (i * b[k - l + 1][nleft])
+            if cum >= uniforms[l - 1]:
+                break
+        counts.append(i)
+        nleft -= i
+    return b, counts + [nleft]
+
+@pytest.mark.parametrize("k, n", [(1, 5), (2, 2), (3, 10), (6, 40), (12, 150), (2, 3000), (5, 2000)])
+def test_sampleEwens(k, n):
+    uniforms = np.random.default_rng(1).random((50, k - 1))
+    expected = [generate(k, n, u) for u in uniforms]
+    b = _stewartTable(k, n)
+    assert b == pytest.approx(np.array(expected[0][0]), rel=1e-12)
+    assert _sampleEwens(b, k, n, uniforms).tolist() == [counts for b, counts in expected]
+
+@pytest.mark.parametrize("alleleData", [[10, 5, 3, 2], [40, 30, 12, 9, 5, 3, 1, 1], [20]])
+def test_runEwensMonteCarlo(alleleData):
+    results = runEwensMonteCarlo(alleleData, numReplicates=4000)
+    batched = runEwensMonteCarlo(alleleData, numReplicates=4000, batchSize=999)
+    assert batched[:3] == results[:3]
+    assert batched[3:] == pytest.approx(results[3:], rel=1e-12)
+    if len(alleleData) > 1:
+        assert runEwensMonteCarlo(alleleData, numReplicates=4000, seed=1) != results
+
+    # same test as the C code, up to Monte Carlo error
+    reference = slatkin(alleleData, EWSlatkinCache(), numReplicates=4000)
+    assert results.theta == pytest.approx(reference[0], rel=1e-9)
+    for p, q in zip(results[1:3], reference[1:3]):
+        assert abs(p - q) < 5 * np.sqrt(0.25 / 4000)
+    assert results.mean == pytest.approx(reference[3], abs=0.01)
+
+    # selectable from HomozygosityEWSlatkinExact, with its own cache key
+    cache = EWSlatkinCache()
+    assert slatkin(alleleData, cache, numReplicates=4000, engine='numpy') == results[:5]
+    assert slatkin(alleleData, cache, numReplicates=4000) == reference
+    assert len(cache.results) == 2
+
+@pytest.mark.parametrize("engine", ['slatkin', 'numpy'])
+@pytest.mark.parametrize("alleleData", [[10, 5, 3, 2], [60, 2, 1, 1, 1, 1], [40, 30, 12, 9, 5, 3, 1, 1]])
+def test_HomozygosityEWSlatkinExact_adaptive(engine, alleleData):
+    hz = HomozygosityEWSlatkinExact(alleleData, numReplicates=500, cache=EWSlatkinCache(),
+                                    engine=engine, tolerance=0.01, maxReplicates=20000, numThreads=2)
+    hz.doCalcs(alleleData)
+    used = hz.replicatesUsed
+    assert used % 500 == 0 and 500 <= used < 20000
+    for p in [hz.prob_ewens, hz.prob_homozygosity]:
+        assert np.sqrt(p * (1 - p) / used) <= 0.01
+
+    # the batches continue the same sequence, so give a fixed run of
+    # the same size
+    fixed = slatkin(alleleData, EWSlatkinCache(), numReplicates=used, engine=engine)
+    assert (hz.theta, hz.prob_ewens, hz.prob_homozygosity) == fixed[:3]
+    assert (hz.mean_homozygosity, hz.var_homozygosity) == pytest.approx(fixed[3:], rel=1e-12)
+
+    # stop at the maximum
+    hz = HomozygosityEWSlatkinExact(alleleData, numReplicates=500, cache=EWSlatkinCache(),
+                                    engine=engine, tolerance=1e-6, maxReplicates=1200)
+    hz.doCalcs(alleleData)
+    assert hz.replicatesUsed == 1200
+
+def test_HomozygosityEWSlatkinExact_replicates_xml(tmp_path):
+    alleleData = [10, 5, 3, 2]
+    for tolerance in [None, 0.02]:
+        filename = str(tmp_path / 'out.xml')
+        stream = XMLOutputStream(open(filename, 'w'))
+        hz = HomozygosityEWSlatkinExact(alleleData, numReplicates=100, cache=EWSlatkinCache(),
+                                        tolerance=tolerance)
+        hz.serializeHomozygosityTo(stream)
+        stream.close()
+        contents = open(filename).read()
+        if tolerance:
+            assert '<replicates>%d</replicates>' % hz.replicatesUsed in contents
+            assert hz.replicatesUsed > 100
+        else:
+            assert '<replicates>' not in contents
@@ -0,0 +1,185 @@
+import base
+import os
+import gzip, bz2, lzma
+import sys
+import random
+import pytest
+from PyPop.ParseFile import ParseGenotypeFile
+from PyPop.Utils import StringMatrix
+
+LOCI = ['A', 'B', 'C', 'DQA1', 'DQB1', 'DRB1', 'DPA1', 'DPB1', 'DRB3', 'DRB4',
+        'DRB5', 'E', 'F', 'G', 'H', 'J', 'K', 'L', 'MICA', 'MICB']
+
+def valid_sample_fields(loci):
+    fields = ['+populationid', 'id']
+    for locus in loci:
+        fields.extend(['*' + locus + '_1', '*' + locus + '_2'])
+    return '\n'.join(fields)
+
+def make_pop_file(path, numIndiv, loci=LOCI, seed=1234):
+    """Write a synthetic genotype file with 'numIndiv' individuals"""
+    rng = random.Random(seed)
+    with open(path, 'w') as f:
+        header = ['populationid', 'id']
+        for locus in loci:
+            header.extend([locus + '_1', locus + '_2'])
+        f.write('\t'.join(header) + '\n')
+        for indiv in range(numIndiv):
+            row = ['SYNTH', str(indiv)]
+            for locus in loci:
+                for i in range(2):
+                    allele = rng.randint(1, 40)
+                    row.append('****' if allele == 40 else '%02d' % allele)
+            f.write('\t'.join(row) + '\n')
+    return str(path)
+
+def parse(filename, loci=LOCI, **kw):
+    args = dict(validSampleFields=valid_sample_fields(loci),
+                alleleDesignator='*',
+                popNameDesignator='+',
+                untypedAllele='****')
+    args.update(kw)
+    return ParseGenotypeFile(filename, **args)
+
+def test_ParseGenotypeFile_contents(tmp_path):
+    loci = ['A', 'B']
+    filename = str(tmp_path / 'small.pop')
+    with open(filename, 'w') as f:
+        f.write('populationid\tid\tA_1\tA_2\tB_1\tB_2\n')
+        f.write('POP\t1\t01 \t02\t****\t03\n')
+        f.write('POP\t2\t 04\t04\t05\t06\n')
+    input = parse(filename, loci)
+    matrix = input.getMatrix()
+
+    assert input.popName == 'POP'
+    assert input.totalIndivCount == 2
+    assert matrix.colList == ['A', 'B']
+    assert matrix.extraList == ['populationid', 'id']
+    # alleles are stripped, metadata kept as-is
+    assert matrix['A'] == [['01', '02'], ['04', '04']]
+    assert matrix['B'] == [['****', '03'], ['05', '06']]
+    assert matrix['populationid:id'] == [['POP', '1'], ['POP', '2']]
+
+@pytest.mark.parametrize("opener, suffix", [(gzip.open, '.gz'), (bz2.open, '.bz2'), (lzma.open, '.xz'),
+                                           (gzip.open, ''), (bz2.open, ''), (lzma.open, '')])
+def test_ParseGenotypeFile_compressed(tmp_path, opener, suffix):
+    filename = make_pop_file(tmp_path / 'plain.pop', 100)
+    # compressed files are recognised by suffix, or by contents alone
+    compressed = str(tmp_path / ('compressed.pop' + suffix))
+    with open(filename, 'rb') as f_in, opener(compressed, 'wb') as f_out:
+        f_out.write(f_in.read())
+
+    plain = parse(filename)
+    decompressed = parse(compressed)
+    assert decompressed.fileData == plain.fileData
+    assert decompressed.getMatrix()['A:B'] == plain.getMatrix()['A:B']
+
+def test_ParseGenotypeFile_cache(tmp_path):
+    filename = make_pop_file(tmp_path / 'cached.pop', 200)
+    cacheDir = str(tmp_path / 'cache')
+
+    uncached = parse(filename)
+    first = parse(filename, cacheDir=cacheDir)
+    assert first.fileData != None
+    assert len(os.listdir(cacheDir)) == 1
+
+    # second time round is loaded from the cache, not the file
+    for encodeAlleles in [0, 1]:
+        cached = parse(filename, cacheDir=cacheDir, encodeAlleles=encodeAlleles)
+        assert cached.fileData == None
+        with pytest.raises(ValueError, match="raw file data isn't available"):
+            cached.getFileData()
+        assert cached.popName == uncached.popName
+        assert cached.getMatrix().colList == uncached.getMatrix().colList
+        assert cached.getMatrix()['populationid:id:' + ':'.join(LOCI)] == \
+               uncached.getMatrix()['populationid:id:' + ':'.join(LOCI)]
+
+    # changing a parse setting, or the file, gives a new entry
+    parse(filename, cacheDir=cacheDir, popNameDesignator='@')
+    assert len(os.listdir(cacheDir)) == 2
+    with open(filename, 'a') as f:
+        f.write('\t'.join(['SYNTH', '999'] + ['01'] * 2 * len(LOCI)) + '\n')
+    changed = parse(filename, cacheDir=cacheDir)
+    assert changed.fileData != None
+    assert changed.totalIndivCount == 201
+    assert len(os.listdir(cacheDir)) == 3
+
+def test_ParseGenotypeFile_populations(tmp_path):
+    filename = str(tmp_path / 'pops.pop')
+    with open(filename, 'w') as f:
+        f.write('populationid\tid\tA_1\tA_2\tB_1\tB_2\n')
+        f.write('POP2\t1\t01\t02\t03\t03\n')
+        f.write('POP1\t2\t04\t04\t05\t06\n')
+        f.write('POP2\t3\t01\t01\t****\t03\n')
+
+    for encodeAlleles in [0, 1]:
+        input = parse(filename, ['A', 'B'], encodeAlleles=encodeAlleles)
+        assert input.getPopulationNames() == ['POP2', 'POP1']
+
+        pop2 = input.getPopulation('POP2')
+        assert pop2.popName == 'POP2'
+        assert pop2.totalIndivCount == 2
+        assert pop2.getMatrix()['id:A:B'] == [['1', '01', '02', '03', '03'], ['3', '01', '01', '****', '03']]
+        assert input.getPopulation('POP1').getMatrix()['A'] == [['04', '04']]
+
+        # original is left untouched
+        assert input.popName == 'POP2'
+        assert input.getMatrix().rowCount == 3
+
+def test_ParseGenotypeFile_split_pipeline(tmp_path, monkeypatch):
+    # interleave individuals from two populations in one file, each
+    # split population should give the same output as a separate file
+    lines = open(base.abspath_test_data('./data/samples/USAFEL-UchiTelle.pop')).readlines()
+    header, samples = lines[:3], lines[3:]
+    popNames = ['POP1', 'POP2']
+    popSamples = dict([(popName, []) for popName in popNames])
+    combined = []
+    for i, line in enumerate(samples):
+        popName = popNames[i % 2]
+        line = popName + line.rstrip('\n')[line.index('\t'):] + '\n'
+        popSamples[popName].append(line)
+        combined.append(line)
+    with open(str(tmp_path / 'combined.pop'), 'w') as f:
+        f.writelines(header + combined)
+    for popName in popNames:
+        with open(str(tmp_path / ('separate-%s.pop' % popName)), 'w') as f:
+            f.writelines(header + popSamples[popName])
+
+    ini = open(base.abspath_test_data('./tests/data/minimal-no-emhaplofreq-no-guothompson-no-slatkin.ini')).read()
+    splitIni = str(tmp_path / 'split.ini')
+    with open(splitIni, 'w') as f:
+        f.write(ini.replace('[ParseGenotypeFile]', '[ParseGenotypeFile]\nsplitPopulations=1'))
+
+    monkeypatch.chdir(tmp_path)
+    assert base.run_pypop_process(splitIni, str(tmp_path / 'combined.pop')) == 0
+    for popName in popNames:
+        assert base.run_pypop_process('./tests/data/minimal-no-emhaplofreq-no-guothompson-no-slatkin.ini',
+                                      str(tmp_path / ('separate-%s.pop' % popName))) == 0
+        splitOut = open('combined-%s-out.txt' % popName).read()
+        separateOut = open('separate-%s-out.txt' % popName).read()
+        assert splitOut.replace('combined.pop', 'separate-%s.pop' % popName) == separateOut
+
+def count_line_splits(filename):
+    """Parse 'filename', counting the calls to str.split"""
+    splits = [0]
+    def profile(frame, event, arg):
+        if event == 'c_call' and arg.__name__ == 'split' and \
+           isinstance(getattr(arg, '__self__', None), str):
+            splits[0] += 1
+    sys.setprofile(profile)
+    try:
+        parse(filename)
+    finally:
+        sys.setprofile(None)
+    return splits[0]
+
+def test_ParseGenotypeFile_linear_scaling(tmp_path, monkeypatch):
+    # each individual's line is split exactly once, however many loci
+    # there are, and the matrix is filled in one go, not cell-by-cell
+    def fail(*args):
+        raise AssertionError("matrix filled cell-by-cell")
+    monkeypatch.setattr(StringMatrix, '__setitem__', fail)
+
+    small = count_line_splits(make_pop_file(tmp_path / 'synth-200.pop', 200))
+    large = count_line_splits(make_pop_file(tmp_path / 'synth-1200.pop', 1200))
+    assert large - small == 1000
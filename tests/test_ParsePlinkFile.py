@@ -0,0 +1,86 @@
+import base
+import random
+import numpy as np
+from base import run_pypop_process, filecmp_ignore_newlines
+from PyPop.ParseFile import ParsePlinkFile, ParseGenotypeFile, isPlinkFile
+from PyPop.Utils import EncodedStringMatrix, StringMatrix
+
+def make_plink_files(prefix, numIndiv=23, numSNPs=5, seed=1234):
+    """Write a PLINK .bed/.bim/.fam fileset and the equivalent .pop file
+
+    Genotypes are written as 0/1/2 copies of the second allele, with
+    -1 for missing."""
+    rng = random.Random(seed)
+    alleles = [('A', 'G'), ('C', 'T'), ('G', 'A'), ('T', 'C'), ('A', 'C')]
+    snps = ['rs%d' % (i + 1) for i in range(numSNPs)]
+    genotypes = [[rng.choice([-1, 0, 1, 1, 2]) for j in range(numIndiv)] for i in range(numSNPs)]
+
+    with open(prefix + '.fam', 'w') as f:
+        for j in range(numIndiv):
+            f.write('FAM%d IND%d 0 0 1 -9\n' % (j, j))
+    with open(prefix + '.bim', 'w') as f:
+        for i in range(numSNPs):
+            a1, a2 = alleles[i % len(alleles)]
+            f.write('1\t%s\t0\t%d\t%s\t%s\n' % (snps[i], 1000 * i, a1, a2))
+
+    # 2-bit codes: 00 hom allele 1, 01 missing, 10 het, 11 hom allele 2
+    bitCodes = {0: 0b00, -1: 0b01, 1: 0b10, 2: 0b11}
+    with open(prefix + '.bed', 'wb') as f:
+        f.write(bytes([0x6c, 0x1b, 0x01]))
+        for i in range(numSNPs):
+            packed = bytearray((numIndiv + 3) // 4)
+            for j in range(numIndiv):
+                packed[j // 4] |= bitCodes[genotypes[i][j]] << (2 * (j % 4))
+            f.write(bytes(packed))
+
+    with open(prefix + '.pop', 'w') as f:
+        f.write('\t'.join(['fid', 'id'] + ['%s_%d' % (snp, k) for snp in snps for k in (1, 2)]) + '\n')
+        for j in range(numIndiv):
+            row = ['FAM%d' % j, 'IND%d' % j]
+            for i in range(numSNPs):
+                a1, a2 = alleles[i % len(alleles)]
+                row.extend({0: [a1, a1], 1: [a1, a2], 2: [a2, a2], -1: ['****', '****']}[genotypes[i][j]])
+            f.write('\t'.join(row) + '\n')
+
+    validSampleFields = '\n'.join(['fid', 'id'] + ['*%s_%d' % (snp, k) for snp in snps for k in (1, 2)])
+    return validSampleFields
+
+def test_ParsePlinkFile_matches_text(tmp_path):
+    prefix = str(tmp_path / 'snps')
+    validSampleFields = make_plink_files(prefix)
+
+    assert isPlinkFile(prefix + '.bed')
+    assert isPlinkFile(prefix)
+    assert not isPlinkFile(prefix + '.pop')
+
+    text = ParseGenotypeFile(prefix + '.pop', validSampleFields=validSampleFields).getMatrix()
+    for encodeAlleles in [1, 0]:
+        plink = ParsePlinkFile(prefix + '.bed', encodeAlleles=encodeAlleles).getMatrix()
+        if encodeAlleles:
+            assert isinstance(plink, EncodedStringMatrix)
+        else:
+            assert not isinstance(plink, EncodedStringMatrix)
+        assert plink.colList == text.colList == ['RS1', 'RS2', 'RS3', 'RS4', 'RS5']
+        assert plink.extraList == text.extraList
+        key = 'fid:id:' + ':'.join(text.colList)
+        assert plink[key] == text[key]
+
+def test_ParsePlinkFile_pipeline(tmp_path, monkeypatch):
+    prefix = str(tmp_path / 'snps')
+    validSampleFields = make_plink_files(prefix, numIndiv=101)
+    inifile = str(tmp_path / 'snps.ini')
+    with open(inifile, 'w') as f:
+        f.write('[General]\ndebug=0\n\n[ParseGenotypeFile]\nuntypedAllele=****\n')
+        f.write('validSampleFields=' + validSampleFields.replace('\n', '\n ') + '\n\n')
+        f.write('[HardyWeinberg]\nlumpBelow=5\n\n[HomozygosityEWSlatkinExact]\nnumReplicates=1000\n\n')
+        # all loci are SNPs, so use the exact two allele test
+        f.write('[HardyWeinbergGuoThompson]\nsamplingNum=100\n')
+
+    # run both the PLINK and text versions, output should be the same
+    monkeypatch.chdir(tmp_path)
+    assert run_pypop_process(inifile, prefix + '.pop') == 0
+    textOut = open('snps-out.txt').read()
+    assert run_pypop_process(inifile, prefix + '.bed') == 0
+    plinkOut = open('snps-out.txt').read()
+    assert plinkOut.replace('snps.bed', 'snps.pop') == textOut
+    assert 'Guo and Thompson HardyWeinberg output (mcmc, exact)' in textOut
@@ -3,22 +3,24 @@ import subprocess
 import hashlib
 import unittest
 import pytest
-from PyPop.Utils import StringMatrix, appendTo2dList
+from PyPop.Utils import StringMatrix, EncodedStringMatrix, appendTo2dList
 
-def new_matrix():
-    return StringMatrix(3, ['A', 'B', 'C'])
+def new_matrix(matrixClass=StringMatrix):
+    return matrixClass(3, ['A', 'B', 'C'])
 
 class StringMatrixTest(unittest.TestCase):
+    matrixClass = StringMatrix
+
     def test_new(self):
         # check everything is zero upon first assignment
-        A_matrix = new_matrix()
+        A_matrix = new_matrix(self.matrixClass)
         assert A_matrix['A'] == [[0, 0], [0, 0], [0, 0]]
         assert A_matrix['B'] == [[0, 0], [0, 0], [0, 0]]
         assert A_matrix['C'] == [[0, 0], [0, 0], [0, 0]]
 
     def test_assign(self):
         # test assignment
-        A_matrix = new_matrix()
+        A_matrix = new_matrix(self.matrixClass)
         A_matrix[0, 'B'] = ('B0', 'B0')
         A_matrix[1, 'B'] = ('B1', 'B1')
         assert A_matrix['A'] == [[0, 0], [0, 0], [0, 0]]
@@ -27,7 +29,7 @@ class StringMatrixTest(unittest.TestCase):
 
     def test_copy(self):
         # check copies are independent
-        A_matrix = new_matrix()
+        A_matrix = new_matrix(self.matrixClass)
         A_matrix[0, 'B'] = ('B0', 'B0')
         A_matrix[1, 'B'] = ('B1', 'B1')
 
@@ -47,7 +49,7 @@ class StringMatrixTest(unittest.TestCase):
 
     def test_submatrix_one_locus(self):
         # test subMatrix, get all data at locus 'A'
-        A_matrix = new_matrix()
+        A_matrix = new_matrix(self.matrixClass)
         A_matrix[0, 'B'] = ('B0', 'B0')
         A_matrix[1, 'B'] = ('B1', 'B1')
         A_matrix[0, 'A'] = ('A0', 'A0')
@@ -56,7 +58,7 @@ class StringMatrixTest(unittest.TestCase):
 
     def test_submatrix_two_locus(self):
         # test subMatrix, get all data for b at locus 'A:B'
-        A_matrix = new_matrix()
+        A_matrix = new_matrix(self.matrixClass)
         A_matrix[0, 'B'] = ('B0', 'B0')
         A_matrix[1, 'B'] = ('B1', 'B1')
         A_matrix[0, 'A'] = ('A0', 'A0')
@@ -65,7 +67,7 @@ class StringMatrixTest(unittest.TestCase):
 
     def test_filterout(self):
         # filterOut all rows that contain 'B1'
-        A_matrix = new_matrix()
+        A_matrix = new_matrix(self.matrixClass)
         A_matrix[0, 'B'] = ('B0', 'B0')
         A_matrix[1, 'B'] = ('B1', 'B1')
         A_matrix[0, 'A'] = ('A0', 'A0')
@@ -75,7 +77,7 @@ class StringMatrixTest(unittest.TestCase):
 
     def test_append(self):
         # append a string to each allele
-        A_matrix = new_matrix()
+        A_matrix = new_matrix(self.matrixClass)
         A_matrix[0, 'B'] = ('B0', 'B0')
         A_matrix[1, 'B'] = ('B1', 'B1')
         A_matrix[0, 'A'] = ('A0', 'A0')
@@ -88,7 +90,7 @@ class StringMatrixTest(unittest.TestCase):
         assert A_matrix['C'] == [[0, 0], [0, 0], [0, 0]]
 
     def test_GetUniqueAlleles(self):
-        A_matrix = new_matrix()
+        A_matrix = new_matrix(self.matrixClass)
         A_matrix[0, 'B'] = ('B0', 'B0')
         A_matrix[1, 'B'] = ('B1', 'B1')
         A_matrix[0, 'A'] = ('A0', 'A0')
@@ -100,7 +102,7 @@ class StringMatrixTest(unittest.TestCase):
         assert A_matrix.getUniqueAlleles('C') == ['0']
 
     def test_ConvertToInts(self):
-        A_matrix = new_matrix()
+        A_matrix = new_matrix(self.matrixClass)
         A_matrix[0, 'B'] = ('B0', 'B0')
         A_matrix[1, 'B'] = ('B1', 'B1')
         A_matrix[0, 'A'] = ('A0', 'A0')
@@ -121,7 +123,7 @@ class StringMatrixTest(unittest.TestCase):
     def test_GetNewStringMatrix(self):
 
         # create StringMatrix with 3 loci + 1 non-locus keys
-        A_matrix = StringMatrix(3, ['A', 'B', 'C'], ['foo'])
+        A_matrix = self.matrixClass(3, ['A', 'B', 'C'], ['foo'])
         A_matrix[0, 'B'] = ('B0', 'B0')
         A_matrix[1, 'B'] = ('B1', 'B1')
         A_matrix[2, 'B'] = ('B3', 'B1')
@@ -152,7 +154,7 @@ class StringMatrixTest(unittest.TestCase):
         assert B_matrix['foo'] == [['bar'], ['baz'], ['frum']]
 
     def test_ConvertToInt_FlattenCols(self):
-        geno = StringMatrix(5, ["DRB", "B"])
+        geno = self.matrixClass(5, ["DRB", "B"])
         geno[0, 'DRB'] = ('4', '11')
         geno[1, 'DRB'] = ('2', '7')
         geno[2, 'DRB'] = ('1', '13')
@@ -171,7 +173,7 @@ class StringMatrixTest(unittest.TestCase):
 
     def test_CountPairs_Small(self):
 
-        geno = StringMatrix(5, ["DRB", "B"])
+        geno = self.matrixClass(5, ["DRB", "B"])
         geno[0, 'DRB'] = ('4', '11')
         geno[1, 'DRB'] = ('2', '7')
         geno[2, 'DRB'] = ('1', '13')
@@ -191,7 +193,7 @@ class StringMatrixTest(unittest.TestCase):
 
     def test_CountPairs_Large(self):
 
-        geno = StringMatrix(45, ['A', 'C', 'B'])
+        geno = self.matrixClass(45, ['A', 'C', 'B'])
         geno[ 0, 'A'] = ( '101', '201')
         geno[ 1, 'A'] = (  '210', '3012')
         geno[ 2, 'A'] = (  '101', '218')
@@ -333,3 +335,73 @@ class StringMatrixTest(unittest.TestCase):
 
         assert pairs == [4, 4, 4, 4, 4, 4, 1, 4, 2, 4, 1, 1, 1, 1, 4, 4, 1, 4, 1, 1, 1, 2, 4, 2, 2, 1, 4, 1, 1, 4, 1, 4, 4, 2, 4, 1, 4, 4, 4, 2, 2, 4, 1, 1, 4]
         assert max_haps == 236
+
+    def test_GetAlleleCodes(self):
+        A_matrix = self.matrixClass(4, ['A', 'B'])
+        A_matrix[0, 'A'] = ('10', '2')
+        A_matrix[1, 'A'] = ('02', '1')
+        A_matrix[2, 'A'] = ('2', '10')
+        A_matrix[3, 'A'] = ('1', '1')
+        A_matrix[0, 'B'] = ('B:01', 'B:1')
+
+        alleleCodes = A_matrix.getAlleleCodes()
+        assert list(alleleCodes.keys()) == ['A', 'B']
+
+        # natural sort, '2' and '02' tie so first appearance wins
+        labels, codes = alleleCodes['A']
+        assert labels == ['1', '2', '02', '10'] == A_matrix.getUniqueAlleles('A')
+        assert codes.tolist() == [[4, 2], [3, 1], [2, 4], [1, 1]]
+
+        labels, codes = alleleCodes['B']
+        assert labels == ['0', 'B:01', 'B:1'] == A_matrix.getUniqueAlleles('B')
+        assert codes.tolist() == [[2, 3], [1, 1], [1, 1], [1, 1]]
+
+        # convertToInts uses the same codes
+        assert A_matrix.convertToInts()['A'] == [[4, 2], [3, 1], [2, 4], [1, 1]]
+        assert A_matrix.getAlleleCodes('B')['B'][0] == ['0', 'B:01', 'B:1']
+
+class EncodedStringMatrixTest(StringMatrixTest):
+    # re-run all the above tests using the encoded storage
+    matrixClass = EncodedStringMatrix
+
+    def test_encoded_storage(self):
+        A_matrix = EncodedStringMatrix(4, ['A', 'B'], ['id'])
+        A_matrix.setRows([['1', 'A1', 'A2', 'B1', 'B1'],
+                          ['2', 'A2', 'A1', 'B2', 'B1'],
+                          ['3', 'A1', 'A1', 'B3', 'B3'],
+                          ['4', 'A3', 'A2', 'B1', 'B2']])
+
+        # each locus keeps its own dictionary, 0 is reserved
+        assert A_matrix.alleleLabels == [[0, 'A1', 'A2', 'A3'], [0, 'B1', 'B2', 'B3']]
+        assert A_matrix.codes.dtype == 'int16'
+        assert A_matrix.codes[:, 0:2].tolist() == [[1, 2], [2, 1], [1, 1], [3, 2]]
+
+        # string API is the same as for an ordinary StringMatrix
+        assert A_matrix['A'] == [['A1', 'A2'], ['A2', 'A1'], ['A1', 'A1'], ['A3', 'A2']]
+        assert A_matrix['id:B'] == [['1', 'B1', 'B1'], ['2', 'B2', 'B1'], ['3', 'B3', 'B3'], ['4', 'B1', 'B2']]
+        assert len(A_matrix) == 4
+        assert A_matrix.array.tolist() == A_matrix['id:A:B']
+
+        # the decoded array is read-only, rather than silently
+        # dropping writes to it
+        with pytest.raises(ValueError):
+            A_matrix.array[0, 1] = 'A3'
+        assert A_matrix['A'][0] == ['A1', 'A2']
+
+        A_matrix[2, 'B'] = ('B4', 'B1')
+        assert A_matrix['B'][2] == ['B4', 'B1']
+
+        # allele codes come from the stored codes, without decoding,
+        # and leave out labels no longer in use ('B3')
+        def decode(cols):
+            raise AssertionError(cols)
+        A_matrix._getColumns = decode
+        assert A_matrix.getUniqueAlleles('B') == ['B1', 'B2', 'B4']
+        assert A_matrix.getAlleleCodes('B')['B'][1].tolist() == [[1, 1], [2, 1], [3, 1], [1, 2]]
+
+    def test_encoded_promotion(self):
+        # more alleles than fit in int16 get promoted to int32
+        A_matrix = EncodedStringMatrix(40000, ['A'])
+        A_matrix.setRows([['a%d' % i, 'a%d' % i] for i in range(40000)])
+        assert A_matrix.codes.dtype == 'int32'
+        assert A_matrix['A'][-1] == ['a39999', 'a39999']
@@ -1,6 +1,7 @@
 import sys
 import subprocess
 import hashlib
+import gzip
 import pytest
 import os.path
 from base import abspath_test_data, run_pypop_process, xfail_windows, filecmp_ignore_newlines
@@ -15,6 +16,23 @@ def test_USAFEL():
 
     assert filecmp_ignore_newlines(out_filename, gold_out_filename)
 
+def test_USAFEL_gzip(tmp_path):
+    # compressed input gives identical output, with output prefix ignoring '.gz'
+    gzip_filename = str(tmp_path / "USAFEL-UchiTelle-small.pop.gz")
+    with open(abspath_test_data('./tests/data/USAFEL-UchiTelle-small.pop'), 'rb') as f_in, gzip.open(gzip_filename, 'wb') as f_out:
+        f_out.write(f_in.read())
+    exit_code = run_pypop_process('./tests/data/minimal-no-emhaplofreq-no-guothompson-no-slatkin.ini', gzip_filename)
+    # check exit code
+    assert exit_code == 0
+
+    # only the reported input filename should differ
+    out_filename = str(tmp_path / "USAFEL-UchiTelle-small-out.txt")
+    with open("USAFEL-UchiTelle-small-out.txt") as f_in, open(out_filename, 'w') as f_out:
+        f_out.write(f_in.read().replace("USAFEL-UchiTelle-small.pop.gz", "USAFEL-UchiTelle-small.pop"))
+    gold_out_filename = abspath_test_data(os.path.join('./tests/data/output', "USAFEL-UchiTelle-small-out-no-emhaplofreq-noguothompson-no-slatkin.txt"))
+
+    assert filecmp_ignore_newlines(out_filename, gold_out_filename)
+
 def test_USAFEL_slatkin():
     exit_code = run_pypop_process('./tests/data/minimal-no-emhaplofreq-no-guothompson.ini', './tests/data/USAFEL-UchiTelle-small.pop')
     # check exit code